@@ -19,7 +19,6 @@
 import os
 import os.path
 from logging import debug, warn, error
-from sqlite3 import dbapi2 as sqlite
 import numpy
 import scipy.stats
 import sys
@@ -27,7 +26,7 @@ import sys
 # tcp-eval imports
 from common.functions import call
 from analysis.analysis import Analysis
-from visualization.gnuplot import UmGnuplot, UmLinePointPlot, UmLinePlot
+from visualization.gnuplot import UmGnuplot, UmLinePointPlot, UmLinePlot, UmRenderSession
 
 class MultipathTCPAnalysis(Analysis):
     """Application for analysis of flowgrind results for multipath tcp."""
@@ -93,8 +92,6 @@ class MultipathTCPAnalysis(Analysis):
             sys.exit(1)
 
     def onLoad(self, record, iterationNo, scenarioNo, runNo, test):
-        dbcur = self.dbcon.cursor()
-
         try:
             recordHeader   = record.getHeader()
             src            = recordHeader["flowgrind_src"]
@@ -107,17 +104,17 @@ class MultipathTCPAnalysis(Analysis):
         try:
             qlimit     = int(recordHeader["testbed_param_qlimit"])
         except KeyError:
-            qlimit     = "NULL"
+            qlimit     = None
 
         try:
             bnbw       = int(recordHeader["testbed_param_bottleneckbw"])
         except KeyError:
-            bnbw       = "NULL"
+            bnbw       = None
 
         try:
             delay      = int(recordHeader["testbed_param_delay"])
         except KeyError:
-            delay      = "NULL"
+            delay      = None
 
         # test_start_time was introduced later in the header, so its not in old test logs
         try:
@@ -145,21 +142,21 @@ class MultipathTCPAnalysis(Analysis):
         try:
             rtt_min = float(rtt_min)
         except TypeError, inst:
-            rtt_min = "NULL"
+            rtt_min = None
 
         try:
             rtt_max = float(rtt_max)
         except TypeError, inst:
-            rtt_max = "NULL"
+            rtt_max = None
 
         try:
             rtt = float(rtt)
         except TypeError, inst:
-            rtt = "NULL"
+            rtt = None
 
-        dbcur.execute("""
-        INSERT INTO tests VALUES ("%s", %s, %s, %s, %u, "%s", %u, %u, %u, "%s", "%s","%s", %f, %s, %s, %s, %u)
-        """ % (variable,  bnbw, qlimit, delay, start_time, scenario_label, iterationNo, scenarioNo, runNo, test, src, dst, thruput, rtt_min, rtt_max, rtt, len(flow_ids)))
+        self.insertRow("tests", (variable, bnbw, qlimit, delay, start_time,
+                scenario_label, iterationNo, scenarioNo, runNo, test, src, dst,
+                thruput, rtt_min, rtt_max, rtt, len(flow_ids)))
 
         # calculate per flow values
         if len(flow_ids) > 1:
@@ -177,21 +174,20 @@ class MultipathTCPAnalysis(Analysis):
                 try:
                     rtt_min = float(rtt_min)
                 except TypeError, inst:
-                    rtt_min = "NULL"
+                    rtt_min = None
 
                 try:
                     rtt_max = float(rtt_max)
                 except TypeError, inst:
-                    rtt_max = "NULL"
+                    rtt_max = None
 
                 try:
                     rtt = float(rtt)
                 except TypeError, inst:
-                    rtt = "NULL"
+                    rtt = None
 
-                dbcur.execute("""
-                INSERT INTO single_values VALUES (%u, %u, %u, %u,"%s", %f, %s, %s, %s)
-                """ % (iterationNo, scenarioNo, runNo, flow_id, test, thruput, rtt_min, rtt_max, rtt))
+                self.insertRow("single_values", (iterationNo, scenarioNo,
+                        runNo, flow_id, test, thruput, rtt_min, rtt_max, rtt))
 
 
     def writeValueTable(self, x, y, scenarioNo, query, filename, cur_max_y_value):
@@ -210,10 +206,9 @@ class MultipathTCPAnalysis(Analysis):
         # data
         success = False
         for row in dbcur:
-            (x_value, y_value) = row
+            (x_value, y_value, stddev) = row
             try:
                 if self.options.plot_error:
-                    stddev = self.calculateStdDev(y, x_value, scenarioNo)
                     fhv.write("%u %f %f\n" %(x_value, y_value, stddev))
                 else:
                     fhv.write("%u %f\n" %(x_value, y_value))
@@ -296,10 +291,24 @@ class MultipathTCPAnalysis(Analysis):
             # 2) sum() up these average values of each scenario under one testbed
             #    configuration to get the total average y of one scenario under one
             #    testbed configuration
+            # 3) the standard deviation is calculated over the sum of y of
+            #    each iteration
+            stddev = '''
+                    SELECT %(x)s, stddev(sum_y) AS std_y
+                    FROM
+                    (
+                        SELECT %(x)s, iterationNo, sum(%(y)s) AS sum_y
+                        FROM tests
+                        WHERE scenarioNo=%(scenarioNo)u AND variable='%(x)s'
+                        GROUP BY %(x)s, iterationNo
+                    )
+                    GROUP BY %(x)s
+            ''' % {'x' : x, 'y' : y, 'scenarioNo' : scenarioNo}
+
             if self.options.per_subflow and (subflow_count[scenarioNo] > 1):
                 for flow_id in range(subflow_count[scenarioNo]):
                     query = '''
-                    SELECT %(x)s, sum(avg_y) AS total_avg_y
+                    SELECT %(x)s, sum(avg_y) AS total_avg_y, std_y
                     FROM
                     (
                         SELECT t.%(x)s, t.runNo, avg(s.%(y)s) AS avg_y
@@ -309,9 +318,11 @@ class MultipathTCPAnalysis(Analysis):
                             AND s.flowNo=%(flowNo)u
                         GROUP BY t.%(x)s, t.runNo
                     )
+                    LEFT JOIN (%(stddev)s) USING (%(x)s)
                     GROUP BY %(x)s
                     ORDER BY %(x)s
-                    ''' % {'x' : x, 'y' : y, 'scenarioNo' : scenarioNo, 'flowNo' : flow_id}
+                    ''' % {'x' : x, 'y' : y, 'scenarioNo' : scenarioNo, 'flowNo' : flow_id,
+                           'stddev' : stddev}
 
                     plotname = "%s_over_%s_s%u_f%u" % (y, x, scenarioNo, flow_id)
                     valfilename = os.path.join(outdir, plotname+".values")
@@ -324,7 +335,7 @@ class MultipathTCPAnalysis(Analysis):
 
             else:
                 query = '''
-                    SELECT %(x)s, sum(avg_y) AS total_avg_y
+                    SELECT %(x)s, sum(avg_y) AS total_avg_y, std_y
                     FROM
                     (
                         SELECT %(x)s, runNo, avg(%(y)s) AS avg_y
@@ -332,9 +343,11 @@ class MultipathTCPAnalysis(Analysis):
                         WHERE scenarioNo=%(scenarioNo)u AND variable='%(x)s'
                         GROUP BY %(x)s, runNo
                     )
+                    LEFT JOIN (%(stddev)s) USING (%(x)s)
                     GROUP BY %(x)s
                     ORDER BY %(x)s
-                ''' % {'x' : x, 'y' : y, 'scenarioNo' : scenarioNo}
+                ''' % {'x' : x, 'y' : y, 'scenarioNo' : scenarioNo,
+                       'stddev' : stddev}
 
                 plotname = "%s_over_%s_s%u" % (y, x, scenarioNo)
                 valfilename = os.path.join(outdir, plotname+".values")
@@ -353,79 +366,60 @@ class MultipathTCPAnalysis(Analysis):
 
         p.save()
 
-    def calculateStdDev(self, y, x_value, scenarioNo):
-        """Calculates the standarddeviation for the values of the YoverXPlot
-        """
-
-        x = self.options.variable
-        dbcur = self.dbcon.cursor()
-
-        query = '''
-            SELECT sum(%s) AS sum_y
-            FROM tests
-            WHERE %s=%u AND scenarioNo=%u AND variable='%s'
-            GROUP BY iterationNo
-        ''' % (y, x, x_value, scenarioNo, x)
-
-        dbcur.execute(query)
-        ary = numpy.array(dbcur.fetchall())
-        return ary.std()
-
     def run(self):
         """Main Method"""
 
-        # bring up database
-        dbexists = False
-        if os.path.exists('data.sqlite'):
-            dbexists = True
-        self.dbcon = sqlite.connect('data.sqlite')
-
-        if not dbexists:
-            dbcur = self.dbcon.cursor()
-            dbcur.execute("""
-            CREATE TABLE tests (variable        VARCHAR(15),
-                                bnbw            INTEGER,
-                                qlimit          INTEGER,
-                                delay           INTEGER,
-                                start_time      VARCHAR(70),
-                                scenario_label  VARCHAR(70),
-                                iterationNo     INTEGER,
-                                scenarioNo      INTEGER,
-                                runNo           INTEGER,
-                                test            VARCHAR(50),
-                                src             VARCHAR(4),
-                                dst             VARCHAR(4),
-                                thruput         DOUBLE,
-                                rtt_min         DOUBLE,
-                                rtt_max         DOUBLE,
-                                rtt_avg         DOUBLE,
-                                flow_count      INTEGER)
-            """)
-            dbcur.execute("""
-            CREATE TABLE single_values (iterationNo     INTEGER,
-                                        scenarioNo      INTEGER,
-                                        runNo           INTEGER,
-                                        flowNo          INTEGER,
-                                        test            VARCHAR(50),
-                                        thruput         DOUBLE,
-                                        rtt_min         DOUBLE,
-                                        rtt_max         DOUBLE,
-                                        rtt_avg         DOUBLE)
-            """)
-            # store failed test as a mapping from run_label to number
-            self.failed = dict()
-            # only load flowgrind test records
-            self.loadRecords(tests=["multiflowgrind"])
-            self.dbcon.commit()
-        else:
-            warn("Database already exists, don't load records.")
+        # bring up database, only new or changed logs are loaded
+        self.openDatabase('data.sqlite', tables=("tests", "single_values"))
+        dbcur = self.dbcon.cursor()
+        dbcur.execute("""
+        CREATE TABLE IF NOT EXISTS tests (variable        VARCHAR(15),
+                                          bnbw            INTEGER,
+                                          qlimit          INTEGER,
+                                          delay           INTEGER,
+                                          start_time      VARCHAR(70),
+                                          scenario_label  VARCHAR(70),
+                                          iterationNo     INTEGER,
+                                          scenarioNo      INTEGER,
+                                          runNo           INTEGER,
+                                          test            VARCHAR(50),
+                                          src             VARCHAR(4),
+                                          dst             VARCHAR(4),
+                                          thruput         DOUBLE,
+                                          rtt_min         DOUBLE,
+                                          rtt_max         DOUBLE,
+                                          rtt_avg         DOUBLE,
+                                          flow_count      INTEGER)
+        """)
+        dbcur.execute("""
+        CREATE TABLE IF NOT EXISTS single_values (iterationNo     INTEGER,
+                                                  scenarioNo      INTEGER,
+                                                  runNo           INTEGER,
+                                                  flowNo          INTEGER,
+                                                  test            VARCHAR(50),
+                                                  thruput         DOUBLE,
+                                                  rtt_min         DOUBLE,
+                                                  rtt_max         DOUBLE,
+                                                  rtt_avg         DOUBLE)
+        """)
+        # store failed test as a mapping from run_label to number
+        self.failed = dict()
+        # only load flowgrind test records
+        self.loadRecords(tests=["multiflowgrind"])
+        # index the columns the plots group, filter and join by
+        self.createIndex("tests", "scenarioNo", "variable")
+        self.createIndex("single_values", "scenarioNo", "iterationNo",
+                "runNo", "flowNo")
+        self.dbcon.commit()
 
         if self.options.dry_run:
             return
 
-        # Do Plots
+        # Do Plots, the pdfs are built at once
+        session = UmRenderSession().start()
         for y in ("thruput", "rtt_max","rtt_min","rtt_avg"):
             self.generateYOverXLinePlot(y)
+        session.render()
 
 
     def main(self):
@@ -15,67 +15,60 @@
 # more details.
 
 # python imports
-import dpkt
-import struct
-import socket
 from logging import info, debug, warn, error
 
 # tcp-eval imports
 from common.application import Application
+from analysis.pcapreader import PcapReader, TH_FIN, TH_SYN, TH_RST
 
 class Info:
     connections = list()
+    # connection table, maps the canonical 4-tuple of a connection to its
+    # two halves
+    table = dict()
+
+    # canonical 4-tuple of a connection and the index of its half
+    def key(self, c):
+        a = (c['src'], c['sport'])
+        b = (c['dst'], c['dport'])
+        if a <= b:
+            return ((a, b), 0)
+        else:
+            return ((b, a), 1)
 
     # check if connection exists
     def check(self, c):
-        for entry in Info.connections:
-            if Info.compare(self,entry,c) == 1:
-                return entry
+        (key, half) = Info.key(self, c)
+        halves = Info.table.get(key)
+        if halves:
+            return halves[half]
         return None
 
     # find the other half connection
     def findOtherHalf(self, c):
-        for entry in Info.connections:
-            if Info.compare(self,entry,c) == 2:
-                return entry
+        (key, half) = Info.key(self, c)
+        halves = Info.table.get(key)
+        if halves:
+            return halves[1 - half]
         return None
 
-    # compare two connections
-    def compare(self, c1, c2):
-       if ((c1['src'] == c2['dst']) and (c1['dst'] == c2['src']) \
-          and (c1['sport'] == c2['dport']) and (c1['dport'] == c2['sport'])):
-            return 2
-
-       if ((c1['src'] == c2['src']) and (c1['dst'] == c2['dst']) \
-          and (c1['sport'] == c2['sport']) and (c1['dport'] == c2['dport'])):
-            return 1
-       else:
-            return 0
-
-    def addConnection(self,ip_hdr):
-        try:
-            tcp_hdr = ip_hdr.data
-        except:
-            return
+    # record a new connection
+    def register(self, c):
+        (key, half) = Info.key(self, c)
+        Info.table.setdefault(key, [None, None])[half] = c
+        Info.connections.append(c)
 
+    def addConnection(self, packet):
         # ---- set vars ----
-        ip_len = ip_hdr.len
-        ack = tcp_hdr.ack
-        seq = int(tcp_hdr.seq)
-        offset = tcp_hdr._get_off()
-
-        flags = [0,0,0,0,0,0]
-        hdr_flags = tcp_hdr.flags
-        for t in reversed(range(6)):
-            flags[t] = hdr_flags % 2
-            hdr_flags = hdr_flags/2
+        (ts, src, dst, sport, dport, seq, ack, flags, ip_len, offset,
+         sack_blocks) = packet
 
         # general connection infos
         c = dict()
-        c['src'] = socket.inet_ntoa(ip_hdr.src)
-        c['dst'] = socket.inet_ntoa(ip_hdr.dst)
-        c['sport'] = tcp_hdr.sport
-        c['dport'] = tcp_hdr.dport
+        c['src'] = src
+        c['dst'] = dst
+        c['sport'] = sport
+        c['dport'] = dport
 
         # check if connection is already recorded
         entry = Info.check(self,c)
@@ -92,39 +85,18 @@ class Info:
         if ip_len - 40 - offset - 4 > 0:
             carries_data = 1
 
-        # get sack blocks from the tcp options field
-        opt = dpkt.tcp.parse_opts(tcp_hdr.opts)
-        sack_list = []
-        for i in opt:
-            if i[0] == 5:
-                oval = i[1]
-                oname, ofmt = ("SAck","!")
-                ofmt += "%iI" % (len(oval)/4)
-                if ofmt and struct.calcsize(ofmt) == len(oval):
-                    oval = struct.unpack(ofmt, oval)
-                    if len(oval) == 1:
-                        oval = oval[0]
-                sack_list.append((oname, oval))
-        tcp_hdr.options = sack_list
-
         # check for sack blocks in this packet
         sack = 0
         dsack = 0
-        sack_blocks = []
-        try:
-                #save sack blocks for later use
-                sack_blocks = tcp_hdr.options[0][1]
-
-                sack = 1
-
-                #dsack detection
-                if ack >= sack_blocks[1]: #1st sack block, right edge
-                    dsack = 1
-                if ack <= sack_blocks[0] and len(sack_blocks) >= 3 \
-                 and (sack_blocks[0] >= sack_blocks[2] and sack_blocks[1] <= sack_blocks[3]): #ex 2nd sack block, 1st sack block is covered by 2nd
-                    dsack = 1
-        except:
-            pass
+        if sack_blocks:
+            sack = 1
+
+            #dsack detection
+            if ack >= sack_blocks[1]: #1st sack block, right edge
+                dsack = 1
+            if ack <= sack_blocks[0] and len(sack_blocks) >= 3 \
+             and (sack_blocks[0] >= sack_blocks[2] and sack_blocks[1] <= sack_blocks[3]): #ex 2nd sack block, 1st sack block is covered by 2nd
+                dsack = 1
 
         # ---- process connection ---
 
@@ -158,11 +130,11 @@ class Info:
             c['rst'] = 0
             c['fin'] = 0
             c['syn'] = 0
-            if flags[4]:
+            if flags & TH_SYN:
                 c['syn'] = 1
             for block in range(0, len(sack_blocks), 2):
                 c['sblocks'].append([sack_blocks[block],sack_blocks[block+1]])
-            Info.connections.append(c)
+            Info.register(self, c)
 
         else: # found old connection
             entry['sack'] += sack
@@ -271,9 +243,9 @@ class Info:
                 else: #paket is retransmit, store seq no and length
                     entry['rexmit'][seq] = ip_len - 40 - offset - 4
 
-            if flags[3]:
+            if flags & TH_RST:
                 entry['rst'] = 1
-            if flags[5]:
+            if flags & TH_FIN:
                 entry['fin'] = 1
 
 
@@ -303,17 +275,8 @@ class ReorderInfo(Application):
     def run(self):
         info = Info()
 
-        self.packets = dpkt.pcap.Reader(open(self.args[0],'rb'))
-#        count = 1
-#        count2 = 0
-        for ts, buf in self.packets:
-            eth = dpkt.sll.SLL(buf)
-            info.addConnection(eth.data)
-#            count += 1
-#            if count == 1000:
-#                count2 += 1
-                #print count2
-#                count = 0
+        for packet in PcapReader(self.args[0]):
+            info.addConnection(packet)
 
         print "Src\t\tsport\tDst\t\tdport\tSyn Rst Fin\tSack\tDSack\tPkts\treor\tdreor\t% reor"
         con_reordered = 0
@@ -22,12 +22,11 @@ import textwrap
 import numpy
 import scipy.stats
 from logging import info, debug, warn, error
-from sqlite3 import dbapi2 as sqlite
 
 # tcp-eval imports
 from common.functions import call
 from analysis.analysis import Analysis
-from visualization.gnuplot import UmGnuplot, UmLinePointPlot
+from visualization.gnuplot import UmGnuplot, UmLinePointPlot, UmRenderSession
 
 class TCPaNCR_Analysis(Analysis):
     """Application for analysis of TCP-aNCR results.  It needs flowlogs
@@ -79,8 +78,6 @@ class TCPaNCR_Analysis(Analysis):
 
 
     def onLoad(self, record, iterationNo, scenarioNo, runNo, test):
-        dbcur = self.dbcon.cursor()
-
         try:
             recordHeader   = record.getHeader()
             if recordHeader.has_key("src"):
@@ -105,22 +102,22 @@ class TCPaNCR_Analysis(Analysis):
         try:
             bnbw       = int(recordHeader["testbed_param_bottleneckbw"])
         except KeyError:
-            bnbw       = "NULL"
+            bnbw       = None
 
         try:
-            delay      = 2 * float(recordHeader["testbed_param_delay"])
+            delay      = int(2 * float(recordHeader["testbed_param_delay"]))
         except KeyError:
-            delay      = "NULL"
+            delay      = None
 
         try:
             ackreor    = int(recordHeader["testbed_param_ackreor"])
         except KeyError:
-            ackreor    = "NULL"
+            ackreor    = None
 
         try:
             ackloss    = int(recordHeader["testbed_param_ackloss"])
         except KeyError:
-            ackloss    = "NULL"
+            ackloss    = None
 
         # test_start_time was introduced later in the header, so its not in old test logs
         try:
@@ -159,12 +156,12 @@ class TCPaNCR_Analysis(Analysis):
         try:
             rtos = int(rtos)
         except TypeError, inst:
-            rtos = "NULL"
+            rtos = None
 
         try:
             frs = int(frs)
         except TypeError, inst:
-            frs = "NULL"
+            frs = None
 
         # check for lost SYN or long connection establishing
         c = 0
@@ -179,28 +176,12 @@ class TCPaNCR_Analysis(Analysis):
         except:
             warn("calculate(flows) failed")
 
-        print  (variable, reordering, bnbw, qlimit, delay, rrate, rdelay,
-                     ackreor, ackloss, rtos, frs, iterationNo, scenarioNo, runNo,
-                     src, dst, thruput, rtt_avg, dsacks, start_time, run_label,
-                     scenario_label, test)
-
-        debug("""
-              INSERT INTO tests VALUES ("%s", "%s", %s, %u, %u, %u, %u, %u, %u, %s, %s, %u, %u,
-                    %u, "%s", "%s", %f, %f, %u,
-                    %u, "$%s$", "%s", "%s")
-              """ % (variable, reordering, bnbw, qlimit, delay, rrate, rdelay,
-                     ackreor, ackloss, rtos, frs, iterationNo, scenarioNo, runNo,
-                     src, dst, thruput, rtt_avg, dsacks, start_time, run_label,
-                     scenario_label, test))
-
-        dbcur.execute("""
-                      INSERT INTO tests VALUES ("%s", "%s", %s, %u, %u, %u, %u, %u, %u, %s, %s, %u, %u,
-                            %u, "%s", "%s", %f, %f, %u,
-                            %u, "$%s$", "%s", "%s")
-                      """ % (variable, reordering, bnbw, qlimit, delay, rrate,
-                             rdelay, ackreor, ackloss, rtos, frs, iterationNo,
-                             scenarioNo, runNo, src, dst, thruput, rtt_avg,
-                             dsacks, start_time, run_label, scenario_label, test))
+        row = (variable, reordering, bnbw, qlimit, delay, rrate, rdelay,
+               ackreor, ackloss, rtos, frs, iterationNo, scenarioNo, runNo,
+               src, dst, thruput, rtt_avg, int(dsacks), start_time,
+               "$%s$" %run_label, scenario_label, test)
+        debug("INSERT INTO tests VALUES %s" %(row,))
+        self.insertRow("tests", row)
 
     def generateFairnessOverXLinePlot(self):
         """Generates a line plot of the DB column y over the DB column x
@@ -303,18 +284,39 @@ class TCPaNCR_Analysis(Analysis):
             # 2) sum() up these average values of each scenario under one testbed
             #    configuration to get the total average y of one scenario under one
             #    testbed configuration
+            # 3) the standard deviation is calculated over the sum of y of
+            #    each iteration
             query = '''
-                SELECT %s, sum(avg_y) AS total_avg_y
+                SELECT %(x)s, total_avg_y, std_y
                 FROM
                 (
-                    SELECT %s, runNo, avg(%s) AS avg_y
-                    FROM tests
-                    WHERE scenarioNo=%u AND variable='%s' AND reordering='%s'
-                    GROUP BY %s, runNo
+                    SELECT %(x)s, sum(avg_y) AS total_avg_y
+                    FROM
+                    (
+                        SELECT %(x)s, runNo, avg(%(y)s) AS avg_y
+                        FROM tests
+                        WHERE scenarioNo=%(scenarioNo)u AND variable='%(x)s'
+                            AND reordering='%(rotype)s'
+                        GROUP BY %(x)s, runNo
+                    )
+                    GROUP BY %(x)s
                 )
-                GROUP BY %s
-                ORDER BY %s
-            ''' % (x, x, y, scenarioNo, x, rotype, x, x, x)
+                LEFT JOIN
+                (
+                    SELECT %(x)s, stddev(sum_y) AS std_y
+                    FROM
+                    (
+                        SELECT %(x)s, iterationNo, sum(%(y)s) AS sum_y
+                        FROM tests
+                        WHERE scenarioNo=%(scenarioNo)u AND variable='%(x)s'
+                            AND reordering='%(rotype)s'
+                        GROUP BY %(x)s, iterationNo
+                    )
+                    GROUP BY %(x)s
+                )
+                USING (%(x)s)
+                ORDER BY %(x)s
+            ''' % {'x' : x, 'y' : y, 'scenarioNo' : scenarioNo, 'rotype' : rotype}
             debug("\n\n" + query + "\n\n")
             dbcur = self.dbcon.cursor()
             dbcur.execute(query)
@@ -331,13 +333,12 @@ class TCPaNCR_Analysis(Analysis):
             # data
             success = False
             for row in dbcur:
-                (x_value, y_value) = row
+                (x_value, y_value, stddev) = row
                 # skip bogus rtt measurements
                 if (y == "rtt_avg" and y_value == 0):
                     continue
                 try:
                     if self.args.plot_error:
-                        stddev = self.calculateStdDev(y, x_value, scenarioNo)
                         fhv.write("%u %f %f\n" %(x_value, y_value, stddev))
                     else:
                         fhv.write("%u %f\n" %(x_value, y_value))
@@ -362,78 +363,57 @@ class TCPaNCR_Analysis(Analysis):
             p.setYRange("[0:%u]" % max(1, int(max_y_value * 1.30)))
         p.save()
 
-    def calculateStdDev(self, y, x_value, scenarioNo):
-        """Calculates the standarddeviation for the values of the YoverXPlot
-        """
-
-        x      = self.args.variable
-        rotype = self.args.rotype
-        dbcur  = self.dbcon.cursor()
-
-        query = '''
-            SELECT sum(%s) AS sum_y
-            FROM tests
-            WHERE %s=%u AND scenarioNo=%u AND variable='%s' AND reordering='%s'
-            GROUP BY iterationNo
-        ''' % (y, x, x_value, scenarioNo, x, rotype)
-
-        dbcur.execute(query)
-        ary = numpy.array(dbcur.fetchall())
-        return ary.std()
-
     def run(self):
         """Main Method"""
 
-        # bring up database
-        dbexists = False
-        if os.path.exists('data.sqlite'):
-            dbexists = True
-        self.dbcon = sqlite.connect('data.sqlite')
-
-        if not dbexists:
-            dbcur = self.dbcon.cursor()
-            dbcur.execute("""
-            CREATE TABLE tests (variable    VARCHAR(15),
-                                reordering  VARCHAR(15),
-                                bnbw        INTEGER,
-                                qlimit      INTEGER,
-                                delay       INTEGER,
-                                rrate       INTEGER,
-                                rdelay      INTEGER,
-                                ackreor     INTEGER,
-                                ackloss     INTEGER,
-                                rtos        INTEGER,
-                                frs         INTEGER,
-                                iterationNo INTEGER,
-                                scenarioNo  INTEGER,
-                                runNo       INTEGER,
-                                src         INTEGER,
-                                dst         INTEGER,
-                                thruput     DOUBLE,
-                                rtt_avg     DOUBLE,
-                                dsacks      INTEGER,
-                                start_time  INTEGER,
-                                run_label   VARCHAR(70),
-                                scenario_label VARCHAR(70),
-                                test        VARCHAR(50))
-            """)
-            # store failed test as a mapping from run_label to number
-            self.failed = dict()
-            # only load flowgrind test records
-            self.loadRecords(tests=["flowgrind"])
-            self.dbcon.commit()
-        else:
-            info("Database already exists, don't load records.")
+        # bring up database, only new or changed logs are loaded
+        self.openDatabase('data.sqlite', tables=("tests",))
+        dbcur = self.dbcon.cursor()
+        dbcur.execute("""
+        CREATE TABLE IF NOT EXISTS tests (variable    VARCHAR(15),
+                                          reordering  VARCHAR(15),
+                                          bnbw        INTEGER,
+                                          qlimit      INTEGER,
+                                          delay       INTEGER,
+                                          rrate       INTEGER,
+                                          rdelay      INTEGER,
+                                          ackreor     INTEGER,
+                                          ackloss     INTEGER,
+                                          rtos        INTEGER,
+                                          frs         INTEGER,
+                                          iterationNo INTEGER,
+                                          scenarioNo  INTEGER,
+                                          runNo       INTEGER,
+                                          src         INTEGER,
+                                          dst         INTEGER,
+                                          thruput     DOUBLE,
+                                          rtt_avg     DOUBLE,
+                                          dsacks      INTEGER,
+                                          start_time  INTEGER,
+                                          run_label   VARCHAR(70),
+                                          scenario_label VARCHAR(70),
+                                          test        VARCHAR(50))
+        """)
+        # store failed test as a mapping from run_label to number
+        self.failed = dict()
+        # only load flowgrind test records
+        self.loadRecords(tests=["flowgrind"])
+        # index the columns the plots group and filter by
+        self.createIndex("tests", "scenarioNo", "variable", "reordering")
+        self.dbcon.commit()
 
         if self.args.dry_run:
             return
 
-        # Do Plots
+        # Do Plots, the pdfs are built at once
+        UmGnuplot.preview = self.args.preview
+        session = UmRenderSession(self.args.jobs).start()
         if self.args.fairness:
             self.generateFairnessOverXLinePlot()
         else:
             for y in ("thruput", "frs", "rtos", "rtt_avg", "dsacks"):
                 self.generateYOverXLinePlot(y)
+        session.render()
 
 
     def main(self):
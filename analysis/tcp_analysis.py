@@ -20,12 +20,11 @@ import os.path
 import numpy
 import scipy.stats
 from logging import info, debug, warn, error
-from sqlite3 import dbapi2 as sqlite
 
 # tcp-eval imports
 from common.functions import call
 from analysis.analysis import Analysis
-from visualization.gnuplot import UmHistogram, UmGnuplot, UmLinePlot, UmBoxPlot
+from visualization.gnuplot import UmHistogram, UmGnuplot, UmLinePlot, UmBoxPlot, UmRenderSession
 
 class TcpAnalysis(Analysis):
     """Application for analysis of flowgrind results"""
@@ -37,8 +36,6 @@ class TcpAnalysis(Analysis):
         if test == "rate":
             return self.onLoadRate(record, iterationNo, scenarioNo, runNo, test)
 
-        dbcur = self.dbcon.cursor()
-
         recordHeader = record.getHeader()
         src = recordHeader["src"]
         dst = recordHeader["dst"]
@@ -68,19 +65,11 @@ class TcpAnalysis(Analysis):
             thruput_0 = 0.0
             thruput_1 = 0.0
 
-	#print """
-        #      INSERT INTO tests VALUES (%u, %u, %u, %s, %s, %f, %f, %f, %u, "$%s$", "%s", "%s")
-        #      """ % (iterationNo, scenarioNo, runNo, src, dst, thruput, thruput_0, thruput_1,
-        #             start_time, run_label, scenario_label, test)
-
-        dbcur.execute("""
-                      INSERT INTO tests VALUES (%u, %u, %u, "%s", "%s", %f, %f, %f, %u, "$%s$", "%s", "%s")
-                      """ % (iterationNo, scenarioNo, runNo, src, dst, thruput, thruput_0, thruput_1,
-                             start_time, run_label, scenario_label, test))
+        self.insertRow("tests", (iterationNo, scenarioNo, runNo, src, dst,
+                thruput, thruput_0, thruput_1, start_time, "$%s$" %run_label,
+                scenario_label, test))
 
     def onLoadRate(self, record, iterationNo, scenarioNo, runNo, test):
-        dbcur = self.dbcon.cursor()
-
         recordHeader = record.getHeader()
         src = recordHeader["rate_src"]
         dst = recordHeader["rate_dst"]
@@ -93,9 +82,7 @@ class TcpAnalysis(Analysis):
         if not avg_rate:
             return
 
-        dbcur.execute("""
-                      INSERT INTO tests_rate VALUES (%u, %u, %u, %f)
-                      """ % (iterationNo,scenarioNo,runNo,avg_rate))
+        self.insertRow("tests_rate", (iterationNo, scenarioNo, runNo, avg_rate))
 
     def generateTputOverTime(self, orderby="iterationNo, runNo, scenarioNo ASC"):
         """Generates a line plot of the measured throughput regardless of
@@ -135,33 +122,23 @@ class TcpAnalysis(Analysis):
 
         plotname = "tput_over_time"
         outdir = self.args.outdir
-        valfilename = os.path.join(outdir, plotname+".values")
-
-        info("Generating %s..." % valfilename)
-        fh = file(valfilename, "w")
-
-        # header
-        if times:
-            fh.write("# thruput rate start_time\n")
-        else:
-            fh.write("# thruput rate\n")
 
+        columns = [[thruputs[key] for key in sorted_keys], list()]
         for key in sorted_keys:
-            thruput = thruputs[key]
             try:
-                rate = rates[key]
+                columns[1].append(rates[key])
             except KeyError:
                 if rates:
                     warn("Oops: no rate for %u,%u,%u" %key)
-                rate = 0
-            if times:
-                fh.write("%f %f %u\n" %(thruput,rate,times[key]))
-            else:
-                fh.write("%f %f\n" %(thruput,rate))
-
-        fh.close()
+                columns[1].append(0)
+        header = "thruput rate"
+        if times:
+            columns.append([times[key] for key in sorted_keys])
+            header += " start_time"
 
-        p = UmLinePlot(plotname = plotname, outdir = outdir)
+        p = UmLinePlot(plotname = plotname, outdir = outdir,
+                saveit = self.args.save)
+        values = p.data(columns, header=header)
         p.setYLabel(r"\\si{\\Mbps}")
         if times:
             p.setXLabel("Time")
@@ -173,10 +150,10 @@ class TcpAnalysis(Analysis):
             using_str = ""
             p.setXLabel("test")
 
-        p.plot(valfilename, "Throughput", using=using_str+"1", linestyle=2)
+        p.plot(values, "Throughput", using=using_str+"1", linestyle=2)
 
         if rates:
-            p.plot(valfilename, "Avg. Rate", using=using_str+"2", linestyle=9)
+            p.plot(values, "Avg. Rate", using=using_str+"2", linestyle=9)
 
         # output plot
         p.save()
@@ -209,7 +186,8 @@ class TcpAnalysis(Analysis):
 
         plotname = "tput_over_time_per_run"
         outdir = self.args.outdir
-        p = UmLinePlot(plotname = plotname, outdir = outdir)
+        p = UmLinePlot(plotname = plotname, outdir = outdir,
+                saveit = self.args.save)
         p.setYLabel(r"\\si{\Mbps}")
 
         for runNo in runs.keys():
@@ -246,31 +224,15 @@ class TcpAnalysis(Analysis):
                 key = (iterationNo,runNo,scenarioNo)
                 rates[key] = avg_rate
 
-            plotname = "tput_over_time_per_run_r%u" %(runNo)
-            valfilename = os.path.join(outdir, plotname+".values")
-
-            info("Generating %s..." % valfilename)
-            fh = file(valfilename, "w")
-
-            # header
+            # generate values
+            columns = [[thruputs[key] for key in sorted_keys],
+                       [rates.get(key, 0) for key in sorted_keys]]
+            header = "thruput rate"
             if times:
-                fh.write("# thruput rate start_time\n")
-            else:
-                fh.write("# thruput rate\n")
-
-            # generate values file
-            for key in sorted_keys:
-                thruput = thruputs[key]
-                try:
-                    rate = rates[key]
-                except KeyError:
-                    rate = 0
-
-                if times:
-                    fh.write("%f %f %u\n" %(thruput,rate,times[key]))
-                else:
-                    fh.write("%f %f\n" %(thruput,rate))
-            fh.close()
+                columns.append([times[key] for key in sorted_keys])
+                header += " start_time"
+            values = p.data(columns, name="tput_over_time_per_run_r%u"
+                    %(runNo), header=header)
 
             if runNo == 0 and times:
                 p.setXLabel("time")
@@ -282,10 +244,10 @@ class TcpAnalysis(Analysis):
                 p.setXLabel("test")
                 using_str = ""
 
-            p.plot(valfilename, "Throughput "+runs[runNo], linestyle=runNo+1, using=using_str+"1")
+            p.plot(values, "Throughput "+runs[runNo], linestyle=runNo+1, using=using_str+"1")
 
             if rates:
-                p.plot(valfilename, "Rate "+runs[runNo], linestyle=runNo+1, using=using_str+"2")
+                p.plot(values, "Rate "+runs[runNo], linestyle=runNo+1, using=using_str+"2")
 
         p.save()
 
@@ -340,22 +302,6 @@ class TcpAnalysis(Analysis):
 
         g.save()
 
-    def calculateStdDev(self, rlabel, slabel, key="thruput"):
-        """Calculates the standarddeviation of all values of the same rlabel
-           and scenarioNo
-        """
-
-        dbcur = self.dbcon.cursor()
-
-        query = '''
-        SELECT %s FROM tests WHERE
-        scenario_label="%s" AND run_label="%s";
-        ''' %(key,slabel,rlabel)
-
-        dbcur.execute(query)
-        ary = numpy.array(dbcur.fetchall())
-        return ary.std()
-
     def generateHistogram2Flows(self):
         """ Generates a histogram with scenario labels for two parallel flows"""
 
@@ -377,12 +323,15 @@ class TcpAnalysis(Analysis):
         MIN(thruput) as min_thruput,
         MAX(thruput) as max_thruput,
         AVG(thruput) as avg_thruput,
+        STDDEV(thruput) as std_thruput,
         MIN(thruput_0) as min_thruput_0,
         MAX(thruput_0) as max_thruput_0,
         AVG(thruput_0) as avg_thruput_0,
+        STDDEV(thruput_0) as std_thruput_0,
         MIN(thruput_1) as min_thruput_1,
         MAX(thruput_1) as max_thruput_1,
         AVG(thruput_1) as avg_thruput_1,
+        STDDEV(thruput_1) as std_thruput_1,
         SUM(1)
         FROM tests GROUP BY run_label, scenarioNo ORDER BY avg_thruput DESC, scenarioNo ASC
         ''')
@@ -414,15 +363,11 @@ class TcpAnalysis(Analysis):
         sorted_labels = list()
         for row in dbcur:
             (rlabel,slabel,sno,
-             min_thruput,max_thruput,avg_thruput,
-             min_thruput_0,max_thruput_0,avg_thruput_0,
-             min_thruput_1,max_thruput_1,avg_thruput_1,
+             min_thruput,max_thruput,avg_thruput,std_thruput,
+             min_thruput_0,max_thruput_0,avg_thruput_0,std_thruput_0,
+             min_thruput_1,max_thruput_1,avg_thruput_1,std_thruput_1,
              notests) = row
 
-            std_thruput  = self.calculateStdDev(rlabel, slabel, "thruput")
-            std_thruput_0 = self.calculateStdDev(rlabel, slabel, "thruput_0")
-            std_thruput_1 = self.calculateStdDev(rlabel, slabel, "thruput_1")
-
             if not data.has_key(rlabel):
                 tmp = list()
                 for key in keys:
@@ -501,6 +446,7 @@ class TcpAnalysis(Analysis):
         MIN(thruput) as min_thruput,
         MAX(thruput) as max_thruput,
         AVG(thruput) as avg_thruput,
+        STDDEV(thruput) as std_thruput,
         SUM(1)
         FROM tests GROUP BY run_label, scenarioNo ORDER BY avg_thruput DESC, scenarioNo ASC
         ''')
@@ -529,8 +475,7 @@ class TcpAnalysis(Analysis):
 
         sorted_labels = list()
         for row in dbcur:
-            (rlabel,slabel,sno,min_thruput,max_thruput,avg_thruput,notests) = row
-            std_thruput = self.calculateStdDev(rlabel, slabel)
+            (rlabel,slabel,sno,min_thruput,max_thruput,avg_thruput,std_thruput,notests) = row
             if not data.has_key(rlabel):
                 tmp = list()
                 for key in keys:
@@ -598,30 +543,18 @@ class TcpAnalysis(Analysis):
 
         outdir = self.args.outdir
         plotname = "fraction_of_pairs"
-        valfilename = os.path.join(outdir, plotname+".values")
-
-        info("Generating %s..." % valfilename)
-        fh = file(valfilename, "w")
-
-        # header
-        fh.write("# fraction of pairs\n")
-        fh.write("# avg_thruput fraction\n")
-
-        i = 1
-        for row in dbcur:
-            (avg_thruput,notests) = row
-            fraction = float(i)/float(pairs)
-            fh.write("%f %f\n" %(avg_thruput, fraction))
-            i = i+1
 
-        fh.close()
+        avg_thruputs = numpy.array([row[0] for row in dbcur], dtype=float)
+        fractions = numpy.arange(1, len(avg_thruputs) + 1) / float(pairs)
 
-        g = UmGnuplot(plotname)
+        g = UmGnuplot(plotname, outdir, saveit = self.args.save)
+        values = g.data([avg_thruputs, fractions],
+                header="fraction of pairs\navg_thruput fraction")
 
         g.setXLabel(r"Throughput in $\\si{\Mbps}$")
         g.setYLabel("Fraction of Pairs")
 
-        g.plot('"%s" using 1:2 title "1-Hop" ls 1 with steps' % valfilename)
+        g.plot('%s using 1:2 title "1-Hop" ls 1 with steps' % values.spec())
 
         # output plot
         g.save()
@@ -734,25 +667,16 @@ class TcpAnalysis(Analysis):
         plotname = "tput_distribution_r%u_b%u" %(runNo, noBins)
 
         outdir = self.args.outdir
-        valfilename = os.path.join(outdir, plotname+".values")
-
-        info("Generating %s..." % valfilename)
-        fh = file(valfilename, "w")
-
-        # header
-        fh.write("# %s\n" %plotname)
-        fh.write("# lower_edge_of_bin tput\n")
 
         (n, bins) = numpy.histogram(ary, bins=noBins, normed=1)
 
-        for i in range(len(n)):
-            fh.write("%0.2f %f\n" %(bins[i], n[i]))
-
-        fh.close()
-        p = UmBoxPlot(plotname = plotname, outdir = outdir)
+        p = UmBoxPlot(plotname = plotname, outdir = outdir,
+                saveit = self.args.save)
+        values = p.data([bins[:-1], n], header="%s\nlower_edge_of_bin tput"
+                %plotname)
         p.setXLabel(r"Throughput in $\\si{\Mbps}$")
         p.setYLabel("Frequency")
-        p.plot(valfilename,"Frequency", using="1:2", linestyle=1)
+        p.plot(values,"Frequency", using="1:2", linestyle=1)
 
         mu  = ary.mean()
         std = ary.std()
@@ -792,7 +716,7 @@ class TcpAnalysis(Analysis):
         """Main Method"""
 
         # database in memory to access data efficiently
-        self.dbcon = sqlite.connect(':memory:')
+        self.openDatabase()
         dbcur = self.dbcon.cursor()
         dbcur.execute("""
         CREATE TABLE tests (iterationNo INTEGER,
@@ -823,7 +747,16 @@ class TcpAnalysis(Analysis):
         # only load flowgrind test records
         self.loadRecords(tests=["flowgrind","rate"])
 
+        # index the columns the plots group and filter by
+        self.createIndex("tests", "run_label", "scenarioNo")
+        self.createIndex("tests", "runNo")
+        self.createIndex("tests", "src", "dst")
+        self.createIndex("tests_rate", "runNo")
         self.dbcon.commit()
+
+        # build the pdfs of all plots at once
+        UmGnuplot.preview = self.args.preview
+        session = UmRenderSession(self.args.jobs).start()
         self.generateHistogram()
         self.generateHistogram2Flows()
         self.generateTputOverTimePerRun()
@@ -832,6 +765,7 @@ class TcpAnalysis(Analysis):
         #self.generateAccTputDistribution(50)
         #self.generateAccHistogram()
         #self.generateCumulativeFractionOfPairs()
+        session.render()
 
     def main(self):
         """Main method of the ping stats object"""
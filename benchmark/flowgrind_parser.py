@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import os
+import sys
+import time
+import random
+import tempfile
+import textwrap
+from logging import info, debug, warn, error
+
+# tcp-eval imports
+from common.application import Application
+from analysis.testrecord import TestRecord
+from analysis.testrecords_flowgrind import FlowgrindRecordFactory
+
+class FlowgrindParserBenchmark(Application):
+    """Compares the single-pass flowgrind tokenizer with the generic
+    regex-per-pass parser of TestRecord on synthetic flowgrind logs"""
+
+    def __init__(self):
+        """Creates a new FlowgrindParserBenchmark object"""
+
+        # object variables
+        self.factory = FlowgrindRecordFactory()
+
+        # create top-level parser
+        description = textwrap.dedent("""\
+                Generates a synthetic flowgrind log and parses it with both
+                the generic TestRecord parser and the line-oriented flowgrind
+                tokenizer. Checks that both yield the same results and
+                reports the speedup.""")
+        Application.__init__(self, description=description)
+        self.parser.add_argument("-f", "--flows", metavar="NUM", type=int,
+                default=2, action="store", help="number of flows in the log "\
+                        "(default: %(default)s)")
+        self.parser.add_argument("-d", "--duration", metavar="SEC",
+                type=float, default=900.0, action="store", help="flow "\
+                        "duration in seconds (default: %(default)s)")
+        self.parser.add_argument("-i", "--interval", metavar="SEC",
+                type=float, default=0.01, action="store", help="reporting "\
+                        "interval in seconds (default: %(default)s)")
+        self.parser.add_argument("-r", "--repeat", metavar="NUM", type=int,
+                default=3, action="store", help="best of '%(metavar)s' "\
+                        "runs (default: %(default)s)")
+
+    def generate(self, fh):
+        """Writes a synthetic flowgrind log to the given file"""
+
+        args = self.args
+        fh.write("run_label=benchmark\n")
+        fh.write("scenario_label=synthetic\n")
+        fh.write("BEGIN_TEST_OUTPUT\n")
+        fh.write("# Sat Dec 11 08:20:49 2010: controlling host = vmhost1, "\
+                "number of flows = %u, reporting interval = %.2fs, "\
+                "[through] = 10**6 bit/second (SVN Rev 6756)\n"
+                %(args.flows, args.interval))
+        fh.write("# ID begin end through transac min RTT avg RTT max RTT "\
+                "min IAT avg IAT max IAT cwnd ssth uack sack lost retr tret "\
+                "fack reor bkof rtt rttvar rto ca state smss pmtu\n")
+
+        row = "%s %4u %10.3f %10.3f %12.6f %8.2f %s %s %s %s %s %s "\
+              "%5u %s %5u %3u %3u %3u %3u %3u %3u %3u %8.3f %8.3f %8.3f "\
+              "%s %5u %5u %u %u %u %u %u %u\n"
+        samples = int(args.duration / args.interval)
+        for i in xrange(samples):
+            begin = i * args.interval
+            for flow in range(args.flows):
+                for direction in ("S", "D"):
+                    cwnd = random.randint(2, 500)
+                    fh.write(row %(direction, flow, begin,
+                            begin + args.interval, random.random() * 100,
+                            0.0, "inf", "inf", "inf", "inf", "inf", "inf",
+                            cwnd, random.choice(["INT_MAX", "%u" %cwnd]),
+                            cwnd, 0, 0, 0, 0, 0, 3, 0,
+                            random.random() * 100, random.random() * 10,
+                            200 + random.random() * 10,
+                            random.choice(["open", "disorder", "recover",
+                                "loss"]), 1448, 1500, 0, 0, 0, 3, 0, 0))
+
+        for flow in range(args.flows):
+            fh.write("# ID %u S: 10.0.0.1/src, sbuf = 16384/0, rbuf = "\
+                    "87380/0 (real/req), flow duration = %.3fs/%.3fs "\
+                    "(real/req), through = %f/0.000000Mbit/s (out/in), "\
+                    "transactions/s = 0.00, request blocks = 1000/0, "\
+                    "response blocks = 0/0, RTT = 1.000/2.000/3.000\n"
+                    %(flow, args.duration, args.duration,
+                      random.random() * 100))
+            fh.write("# ID %u D: 10.0.0.2/dst, sbuf = 16384/0, rbuf = "\
+                    "87380/0 (real/req), flow duration = %.3fs/%.3fs "\
+                    "(real/req), through = 0.000000/%fMbit/s (out/in), "\
+                    "request blocks = 0/1000, response blocks = 0/0, "\
+                    "IAT = 1.000/2.000/3.000\n"
+                    %(flow, args.duration, args.duration,
+                      random.random() * 100))
+        fh.write("# S ICMP: 0 0\n")
+        fh.write("# D ICMP: 0 0\n")
+
+    def measure(self, create):
+        """Returns the record and the best wall time of create()"""
+
+        best = None
+        for i in range(self.args.repeat):
+            start = time.time()
+            record = create()
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        return record, best
+
+    def run(self):
+        """Run..."""
+
+        (fd, filename) = tempfile.mkstemp(prefix="flowgrind_", suffix=".log")
+        fh = os.fdopen(fd, "w")
+        info("Generating synthetic flowgrind log %s..." %filename)
+        self.generate(fh)
+        fh.close()
+
+        try:
+            size = os.path.getsize(filename)
+            regexes = [regex for (cls, regex) in self.factory.regexes]
+            whats = self.factory.whats
+
+            info("Parsing with TestRecord.parse()...")
+            generic, t_generic = self.measure(
+                    lambda: TestRecord(filename, regexes, whats))
+
+            info("Parsing with FlowgrindRecord.parse()...")
+            single, t_single = self.measure(
+                    lambda: self.factory.createRecord(filename, "flowgrind"))
+        finally:
+            os.remove(filename)
+
+        if generic.results != single.results or \
+                generic.header != single.header:
+            error("Parsers disagree on the synthetic log!")
+            sys.exit(1)
+
+        rows = len(single.results["flow_id"])
+        print "log size           : %.1f MiB, %u interim rows" \
+                %(size / 1048576.0, rows)
+        print "TestRecord.parse   : %8.3fs" %t_generic
+        print "single-pass parser : %8.3fs" %t_single
+        print "speedup            : %8.2fx" %(t_generic / t_single)
+
+    def main(self):
+        self.parse_options()
+        self.apply_options()
+        self.run()
+
+
+# this only runs if the module was *not* imported
+if __name__ == '__main__':
+    FlowgrindParserBenchmark().main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import os
+import os.path
+import sys
+import imp
+import time
+import struct
+import socket
+import random
+import tempfile
+import textwrap
+import dpkt
+from logging import info, debug, warn, error
+
+# tcp-eval imports
+from common.application import Application
+from analysis.pcapreader import PcapReader
+
+# the analysis scripts are no modules, so we load them from their path
+ANALYSIS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        os.pardir, "analysis")
+
+def compare(c1, c2):
+    """Former Info.compare(), returns 1 if both connections are the same half
+    connection, 2 if they are the two halves of one connection, else 0"""
+
+    if ((c1['src'] == c2['dst']) and (c1['dst'] == c2['src']) \
+       and (c1['sport'] == c2['dport']) and (c1['dport'] == c2['sport'])):
+        return 2
+
+    if ((c1['src'] == c2['src']) and (c1['dst'] == c2['dst']) \
+       and (c1['sport'] == c2['sport']) and (c1['dport'] == c2['dport'])):
+        return 1
+    else:
+        return 0
+
+def scanCheck(self, c):
+    """Former Info.check(), scans all connections"""
+
+    for entry in self.connections:
+        if compare(entry, c) == 1:
+            return entry
+    return None
+
+def scanFindOtherHalf(self, c):
+    """Former Info.findOtherHalf(), scans all connections"""
+
+    for entry in self.connections:
+        if compare(entry, c) == 2:
+            return entry
+    return None
+
+class ReorderStatsBenchmark(Application):
+    """Compares the connection table of the reorderstats scripts with the
+    former linear scan over all connections on a synthetic multi-flow pcap"""
+
+    def __init__(self):
+        """Creates a new ReorderStatsBenchmark object"""
+
+        # create top-level parser
+        description = textwrap.dedent("""\
+                Generates a synthetic pcap file with many parallel TCP
+                flows, some of them with reordering, retransmissions and
+                DSACKs. Runs reorderstats.py and
+                reorderstats.pktsack.py with the hash-indexed connection
+                table and with the former linear scan, checks that both
+                yield the same per-connection statistics and reports the
+                speedup.""")
+        Application.__init__(self, description=description)
+        self.parser.add_argument("-f", "--flows", metavar="NUM", type=int,
+                default=200, action="store", help="number of parallel "\
+                        "flows (default: %(default)s)")
+        self.parser.add_argument("-p", "--packets", metavar="NUM", type=int,
+                default=100, action="store", help="data segments per flow "\
+                        "(default: %(default)s)")
+        self.parser.add_argument("-R", "--reorder", metavar="PROB",
+                type=float, default=0.05, action="store", help="probability "\
+                        "that a segment is reordered (default: %(default)s)")
+        self.parser.add_argument("-e", "--ethernet", action="store_true",
+                help="write Ethernet frames instead of a Linux cooked "\
+                        "capture")
+        self.parser.add_argument("-s", "--seed", metavar="NUM", type=int,
+                default=0, action="store", help="seed of the random "\
+                        "generator (default: %(default)s)")
+
+    def segment(self, src, dst, sport, dport, seq, ack, flags, length=0,
+            sack=None):
+        """Returns a TCP/IP packet in a Linux cooked capture header or an
+        Ethernet frame. sack is a list of SACK block edges"""
+
+        opts = ""
+        if sack:
+            opts = "\x01\x01" + struct.pack("!BB%uI" %len(sack), 5,
+                    2 + 4 * len(sack), *sack)
+        tcp = dpkt.tcp.TCP(sport=sport, dport=dport, seq=seq, ack=ack,
+                flags=flags, opts=opts, off=5 + len(opts) / 4,
+                data="\x00" * length)
+        ip = dpkt.ip.IP(src=socket.inet_aton(src), dst=socket.inet_aton(dst),
+                p=dpkt.ip.IP_PROTO_TCP, data=tcp)
+        ip.len = len(ip)
+        if self.args.ethernet:
+            return str(dpkt.ethernet.Ethernet(type=dpkt.ethernet.ETH_TYPE_IP,
+                    data=ip))
+        return str(dpkt.sll.SLL(ethtype=dpkt.ethernet.ETH_TYPE_IP, data=ip))
+
+    def flow(self, no):
+        """Returns the packets of one synthetic flow"""
+
+        mss = 1448
+        src = "10.0.%u.%u" %(no / 250, no % 250 + 1)
+        dst = "10.1.0.1"
+        sport = 10000 + no
+        dport = 5999
+        isn = random.randint(0, 1 << 30)
+        irs = random.randint(0, 1 << 30)
+
+        data = lambda seq: self.segment(src, dst, sport, dport, seq, irs + 1,
+                dpkt.tcp.TH_ACK, mss)
+        ack = lambda ack, sack=None: self.segment(dst, src, dport, sport,
+                irs + 1, ack, dpkt.tcp.TH_ACK, sack=sack)
+
+        packets = [self.segment(src, dst, sport, dport, isn, 0,
+                       dpkt.tcp.TH_SYN),
+                   self.segment(dst, src, dport, sport, irs, isn + 1,
+                       dpkt.tcp.TH_SYN | dpkt.tcp.TH_ACK),
+                   self.segment(src, dst, sport, dport, isn + 1, irs + 1,
+                       dpkt.tcp.TH_ACK)]
+
+        seq = isn + 1
+        for i in range(self.args.packets):
+            packets.append(data(seq))
+            if random.random() < self.args.reorder:
+                # the segment overtakes its predecessor in the network
+                packets.append(data(seq + mss))
+                packets.append(ack(seq, [seq + mss, seq + 2 * mss]))
+                packets.append(ack(seq + 2 * mss))
+                seq += 2 * mss
+            elif random.random() < self.args.reorder:
+                # spurious retransmission, answered with a DSACK
+                packets.append(ack(seq + mss))
+                packets.append(data(seq))
+                packets.append(ack(seq + mss, [seq, seq + mss]))
+                seq += mss
+            else:
+                packets.append(ack(seq + mss))
+                seq += mss
+
+        packets.append(self.segment(src, dst, sport, dport, seq, irs + 1,
+                dpkt.tcp.TH_FIN | dpkt.tcp.TH_ACK))
+        return packets
+
+    def generate(self, fh):
+        """Writes a pcap with interleaved synthetic flows to the given file"""
+
+        random.seed(self.args.seed)
+        flows = [self.flow(no) for no in range(self.args.flows)]
+        if self.args.ethernet:
+            linktype = dpkt.pcap.DLT_EN10MB
+        else:
+            linktype = dpkt.pcap.DLT_LINUX_SLL
+        writer = dpkt.pcap.Writer(fh, linktype=linktype)
+        ts = 0.0
+        count = 0
+        while flows:
+            flow = random.choice(flows)
+            writer.writepkt(flow.pop(0), ts)
+            if not flow:
+                flows.remove(flow)
+            ts += 0.0001
+            count += 1
+        return count
+
+    def measure(self, module, filename, scan):
+        """Runs the reorderstats module on the pcap and returns the per
+        connection statistics and the wall time"""
+
+        cls = module.Info
+        (check, findOtherHalf) = (cls.__dict__["check"],
+                                  cls.__dict__["findOtherHalf"])
+        if scan:
+            (cls.check, cls.findOtherHalf) = (scanCheck, scanFindOtherHalf)
+        cls.connections = list()
+        cls.table = dict()
+
+        start = time.time()
+        try:
+            info = cls()
+            if hasattr(info, "process"):
+                info.process(filename)
+            else:
+                for packet in PcapReader(filename):
+                    info.addConnection(packet)
+        finally:
+            (cls.check, cls.findOtherHalf) = (check, findOtherHalf)
+        elapsed = time.time() - start
+
+        keys = ("src", "sport", "dst", "dport", "syn", "rst", "fin", "sack",
+                "dsack", "all", "reorder", "dreorder")
+        stats = [tuple([c[k] for k in keys]) for c in cls.connections]
+        return stats, elapsed
+
+    def run(self):
+        """Run..."""
+
+        (fd, filename) = tempfile.mkstemp(prefix="reorderstats_",
+                                          suffix=".pcap")
+        fh = os.fdopen(fd, "wb")
+        info("Generating synthetic pcap %s..." %filename)
+        count = self.generate(fh)
+        fh.close()
+
+        results = list()
+        try:
+            for script in ("reorderstats.py", "reorderstats.pktsack.py"):
+                name = script[:-3].replace(".", "_")
+                module = imp.load_source(name, os.path.join(ANALYSIS, script))
+
+                info("Running %s with the linear scan..." %script)
+                (scan, t_scan) = self.measure(module, filename, True)
+                info("Running %s with the connection table..." %script)
+                (table, t_table) = self.measure(module, filename, False)
+
+                if scan != table:
+                    error("%s: connection statistics differ!" %script)
+                    sys.exit(1)
+                # the comparison is void if the SACK code was never hit
+                dsacks = sum([s[8] for s in table])
+                reordered = sum([s[-2] + s[-1] for s in table])
+                if not dsacks or not reordered:
+                    error("%s: found %u DSACKs and %u reorderings, the "\
+                            "SACK options of the pcap are broken!"
+                            %(script, dsacks, reordered))
+                    sys.exit(1)
+                results.append((script, t_scan, t_table, reordered))
+        finally:
+            os.remove(filename)
+
+        print "pcap               : %u packets, %u flows" \
+                %(count, self.args.flows)
+        for (script, t_scan, t_table, reordered) in results:
+            print "%-24s: scan %8.3fs, table %8.3fs, speedup %6.2fx, "\
+                    "%u reorderings" %(script, t_scan, t_table,
+                            t_scan / t_table, reordered)
+
+    def main(self):
+        self.parse_options()
+        self.apply_options()
+        self.run()
+
+
+# this only runs if the module was *not* imported
+if __name__ == '__main__':
+    ReorderStatsBenchmark().main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import math
+import numpy
+
+class Variance:
+    """SQLite aggregate variance(x). Like numpy.var() this is the population
+    variance. Uses Welford's online algorithm, so the values are not kept"""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def step(self, value):
+        if value is None:
+            return
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+    def finalize(self):
+        if not self.n:
+            return None
+        return self.m2 / self.n
+
+class StdDev(Variance):
+    """SQLite aggregate stddev(x), the population standard deviation like
+    numpy.std()"""
+
+    def finalize(self):
+        if not self.n:
+            return None
+        return math.sqrt(self.m2 / self.n)
+
+class ConfidenceInterval(Variance):
+    """SQLite aggregate ci(x, level). Returns the half width of the confidence
+    interval of the mean at the given level (e.g. 0.95), based on the
+    sample standard deviation and Student's t-distribution"""
+
+    def step(self, value, level):
+        self.level = level
+        Variance.step(self, value)
+
+    def finalize(self):
+        if self.n < 2:
+            return None
+        from scipy.stats import t
+        quantile = t.ppf(0.5 + self.level / 2.0, self.n - 1)
+        return quantile * math.sqrt(self.m2 / (self.n - 1) / self.n)
+
+class Percentile:
+    """SQLite aggregate percentile(x, p). Returns the p-th percentile (0-100)
+    of the values, interpolated like numpy.percentile()"""
+
+    def __init__(self):
+        self.values = list()
+
+    def step(self, value, p):
+        self.p = p
+        if value is not None:
+            self.values.append(value)
+
+    def finalize(self):
+        if not self.values:
+            return None
+        return float(numpy.percentile(self.values, self.p))
+
+def registerAggregates(dbcon):
+    """Makes the statistic aggregates available in queries on the given
+    SQLite connection"""
+
+    dbcon.create_aggregate("variance", 1, Variance)
+    dbcon.create_aggregate("stddev", 1, StdDev)
+    dbcon.create_aggregate("ci", 2, ConfidenceInterval)
+    dbcon.create_aggregate("percentile", 2, Percentile)
@@ -19,12 +19,51 @@ import sys
 import os
 import os.path
 import re
+import multiprocessing
 from logging import info, debug, warn, error
+from sqlite3 import dbapi2 as sqlite
 
 # tcp-eval imports
 from common.application import Application
 from common.functions import call
 from testrecordfactory import TestRecordFactory
+from aggregates import registerAggregates
+from visualization.rendercache import RenderCache
+from recordcache import RecordCache, parserVersion, encodeResults, \
+        decodeResults
+
+# record factory of a worker process of Analysis.loadRecords()
+_factory = None
+
+def _initWorker(cache):
+    """Sets up the record factory of a worker process"""
+
+    global _factory
+    _factory = TestRecordFactory(cache)
+
+def _parseRecord(job):
+    """Parses a test log in a worker process. Returns the header and the
+    parsed values packed for a cheap transfer to the parent process"""
+
+    (entry, test) = job[-2:]
+    cache = _factory.cache
+    hits = cache.hits if cache else 0
+    record = _factory.createRecord(entry, test)
+    hit = cache is not None and cache.hits > hits
+    return (record.getHeader(), encodeResults(record.results), hit)
+
+class _Parsed:
+    """Provides the values parsed by a worker process in place of a
+    RecordCache, so that the record is not parsed again"""
+
+    def __init__(self, header, results):
+        self.header = header
+        self.results = results
+
+    def load(self, record, regexes):
+        record.header = self.header
+        record.results = decodeResults(self.results)
+        return True
 
 class Analysis(Application):
     """Provides an Application wrapper for Analysis classes. Should be
@@ -38,6 +77,10 @@ class Analysis(Application):
         self.action = ''
         self.analysis = 'none'
         self.factory = TestRecordFactory()
+        self.dbcon = None
+        self.dbrows = dict()
+        self.dbbatch = 5000
+        self.dbtables = None
 
         # create top-level parser
         Application.__init__(self, **kwargs)
@@ -63,6 +106,26 @@ class Analysis(Application):
                 "gnuplot and tex files")
         self.parser.add_argument("--force", action="store_true",
                 help="overwrite existing output")
+        self.parser.add_argument("--preview", metavar="FORMAT", nargs="?",
+                const="png", choices=("png", "svg"), help="render quick "\
+                        "'%(metavar)s' previews with gnuplot instead of pdf "\
+                        "files (default: %(const)s)")
+        self.parser.add_argument("--cache-dir", metavar="DIR", type=str,
+                action="store", dest="cachedir", help="store parsed test "\
+                        "records and rendered figures in '%(metavar)s' "\
+                        "(default: '.recordcache' next to the log files and "\
+                        "'.rendercache' next to the figures)")
+        self.parser.add_argument("--cache-size", metavar="MB", type=int,
+                default=256, action="store", dest="cachesize", help="keep "\
+                        "at most '%(metavar)s' MiB of rendered figures "\
+                        "(default: %(default)s)")
+        self.parser.add_argument("--no-cache", action="store_false",
+                dest="cache", help="always parse the log files and render "\
+                        "the figures, don't use the record and render cache")
+        self.parser.add_argument("-j", "--jobs", metavar="NUM", type=int,
+                default=1, action="store", help="parse the log files and "\
+                        "render the figures with '%(metavar)s' processes "\
+                        "(default: %(default)s)")
 
     def apply_options(self):
         """Configure object based on the options form the argparser"""
@@ -77,6 +140,194 @@ class Analysis(Application):
             info("%s does not exist, creating." %self.args.outdir)
             os.mkdir(self.args.outdir)
 
+        # reuse parsed records of unchanged log files and figures rendered
+        # from the same data
+        if self.args.cache:
+            self.factory.cache = RecordCache(self.args.cachedir)
+            RenderCache.active = RenderCache(self.args.cachedir,
+                    self.args.cachesize * 1024 * 1024)
+
+    def openDatabase(self, filename=":memory:", tables=None):
+        """Opens the SQLite database the subclass stores the parsed values
+        in. The database is a scratch copy of the test logs only, so we trade
+        durability for loading speed. The aggregates stddev(), variance(),
+        ci() and percentile() can be used in queries.
+
+        If the tables the onLoad hook inserts into are given, an on-disk
+        database is updated incrementally: loadRecords() only loads new or
+        changed logs and removes the rows of changed or deleted logs from
+        these tables. Rows are attributed to their log by the columns
+        iterationNo, scenarioNo, runNo and test, which the tables must have.
+        If the database has no manifest yet (e.g. it was written by an older
+        version), the tables contain rows of unknown logs or logs in different
+        subdirectories share these columns, the tables are emptied and all
+        logs are loaded again.
+        """
+
+        self.dbcon = sqlite.connect(filename)
+        registerAggregates(self.dbcon)
+        self.dbcon.execute("PRAGMA synchronous = OFF")
+        self.dbcon.execute("PRAGMA temp_store = MEMORY")
+        if filename != ":memory:":
+            self.dbcon.execute("PRAGMA journal_mode = WAL")
+
+        if tables and filename != ":memory:":
+            # manifest of the logs the database contains
+            self.dbfresh = not self.dbcon.execute("SELECT name FROM "\
+                    "sqlite_master WHERE type='table' AND name='records'"
+                    ).fetchone()
+            self.dbcon.execute("""
+            CREATE TABLE IF NOT EXISTS records (path        VARCHAR(255) PRIMARY KEY,
+                                                size        INTEGER,
+                                                mtime       DOUBLE,
+                                                version     VARCHAR(32),
+                                                iterationNo INTEGER,
+                                                scenarioNo  INTEGER,
+                                                runNo       INTEGER,
+                                                test        VARCHAR(50))
+            """)
+            self.dbtables = tables
+        return self.dbcon
+
+    def updateManifest(self, jobs, tests=None):
+        """Compares the logs found by loadRecords() with the manifest of the
+        database. Removes the rows of deleted and changed logs, registers new
+        and changed logs and returns the jobs that still have to be loaded
+        """
+
+        # the rows are attributed to their log by its numbers. If logs in
+        # different subdirectories share them, the rows of one log can't be
+        # told apart from the other's, so all logs are loaded again
+        keys = dict()
+        shared = None
+        for (iterationNo, scenarioNo, runNo, entry, test) in jobs:
+            key = (iterationNo, scenarioNo, runNo, test)
+            if key in keys:
+                shared = (keys[key], entry)
+                break
+            keys[key] = entry
+
+        # DDL commits implicitly, so the indexes are created before the rows
+        # are removed in one transaction
+        for table in self.dbtables:
+            self.createIndex(table, "iterationNo", "scenarioNo", "runNo", "test")
+
+        # rebuild the tables if they contain rows the manifest does not cover
+        # or rows that belong to more than one log
+        rebuild = self.dbfresh
+        if shared:
+            warn("Database: %s and %s have the same iteration, scenario, run "\
+                    "and test, rebuilding." %shared)
+            rebuild = True
+        elif self.dbcon.execute("""
+            SELECT 1 FROM records GROUP BY iterationNo, scenarioNo, runNo, test
+                    HAVING count(*) > 1 LIMIT 1
+            """).fetchone():
+            info("Database: logs with the same numbers loaded, rebuilding.")
+            shared = True
+            rebuild = True
+        for table in self.dbtables:
+            if rebuild:
+                break
+            rebuild = self.dbcon.execute("""
+            SELECT 1 FROM %s t WHERE NOT EXISTS (SELECT 1 FROM records r
+                    WHERE r.iterationNo=t.iterationNo AND
+                          r.scenarioNo=t.scenarioNo AND r.runNo=t.runNo AND
+                          r.test=t.test) LIMIT 1
+            """ %table).fetchone() is not None
+        if rebuild:
+            if not shared:
+                info("Database: rows of unknown logs found, rebuilding.")
+            for table in self.dbtables:
+                self.dbcon.execute("DELETE FROM %s" %table)
+            self.dbcon.execute("DELETE FROM records")
+            self.dbfresh = False
+
+        known = dict()
+        for row in self.dbcon.execute("SELECT * FROM records"):
+            known[row[0]] = row[1:]
+
+        # the parser version of every test, including its whats
+        versions = dict()
+
+        pending = list()
+        manifest = list()
+        stale = list()
+        found = set()
+        for job in jobs:
+            (iterationNo, scenarioNo, runNo, entry, test) = job
+            if test not in versions:
+                try:
+                    factory = self.factory.factories[test]
+                except KeyError:
+                    factory = self.factory.initFactory(test)
+                versions[test] = parserVersion(factory.__class__.__name__,
+                        factory.regexes, factory.whats)
+            path = os.path.abspath(entry)
+            stat = os.stat(entry)
+            row = (stat.st_size, stat.st_mtime, versions[test], iterationNo,
+                   scenarioNo, runNo, test)
+            found.add(path)
+            if path in known:
+                if known[path] == row:
+                    continue
+                stale.append((path, known[path][3:]))
+            pending.append(job)
+            manifest.append((path,) + row)
+
+        # logs that are gone, if the walk was not restricted to other tests
+        removed = 0
+        for (path, row) in known.iteritems():
+            if path not in found and (not tests or row[6] in tests):
+                stale.append((path, row[3:]))
+                removed += 1
+
+        for table in self.dbtables:
+            self.dbcon.executemany("DELETE FROM %s WHERE iterationNo=? AND "\
+                    "scenarioNo=? AND runNo=? AND test=?" %table,
+                    [key for (path, key) in stale])
+        self.dbcon.executemany("DELETE FROM records WHERE path=?",
+                [(path,) for (path, key) in stale])
+        self.dbcon.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?, "\
+                "?, ?, ?)", manifest)
+
+        info("Database: %d of %d logs new or changed, %d logs removed."
+                %(len(pending), len(jobs), removed))
+        return pending
+
+    def insertRow(self, table, row):
+        """Buffers a row for the given table. The buffered rows are written
+        with a single executemany() as soon as the buffer is full"""
+
+        rows = self.dbrows.setdefault(table, list())
+        rows.append(row)
+        if len(rows) >= self.dbbatch:
+            self.flushRows(table)
+
+    def flushRows(self, *tables):
+        """Writes the buffered rows of the given tables (default: all tables)
+        to the database. The rows are passed as bound parameters, thus None is
+        stored as NULL. All rows end up in one transaction, which is committed
+        by the caller"""
+
+        for table in tables or self.dbrows.keys():
+            rows = self.dbrows.get(table)
+            if not rows:
+                continue
+            marks = ", ".join(["?"] * len(rows[0]))
+            self.dbcon.executemany("INSERT INTO %s VALUES (%s)"
+                    %(table, marks), rows)
+            del rows[:]
+
+    def createIndex(self, table, *columns):
+        """Creates an index on the given columns of the table. Should be
+        called after the records are loaded, since updating the index on
+        every insert is much more expensive than building it once"""
+
+        name = "%s_%s" %(table, "_".join(columns))
+        self.dbcon.execute("CREATE INDEX IF NOT EXISTS %s ON %s (%s)"
+                %(name, table, ", ".join(columns)))
+
     def process(self):
         """Processing of the gathered data"""
         pass
@@ -97,8 +348,8 @@ class Analysis(Application):
 
         # testnames are only valid with plain text and numbers
         regex = re.compile("^i(\d+)_s(\d+)_r(\d+)_test_(\w+)$")
-        count = 0
         failed = []
+        jobs = []
 
         for root, dirs, files in os.walk(self.args.indir):
             debug("Processing %s" %root)
@@ -116,18 +367,59 @@ class Analysis(Application):
                     if tests and not test in tests:
                         continue
 
-                    count += 1
-                    debug("Processing %s" %entry)
-                    record = self.factory.createRecord(entry,test)
+                    jobs.append((iterationNo, scenarioNo, runNo, entry, test))
+
+        # the hook is always called in the same order, regardless of the
+        # order of os.walk() or of the parsing processes
+        jobs.sort()
+        count = len(jobs)
+
+        # skip the logs the database already contains
+        if self.dbtables:
+            jobs = self.updateManifest(jobs, tests)
+
+        if self.args.jobs > 1 and len(jobs) > 1:
+            info("Parsing with %d processes..." %self.args.jobs)
+            pool = multiprocessing.Pool(self.args.jobs, _initWorker,
+                                        (self.factory.cache,))
+            # results are streamed back in the order of the jobs
+            parsed = pool.imap(_parseRecord, jobs)
+        else:
+            pool = None
+
+        for job in jobs:
+            (iterationNo, scenarioNo, runNo, entry, test) = job
+            debug("Processing %s" %entry)
+
+            if pool:
+                (header, results, hit) = parsed.next()
+                if hit:
+                    self.factory.cache.hits += 1
+                elif self.factory.cache:
+                    self.factory.cache.misses += 1
+                record = self.factory.createRecord(entry, test,
+                        _Parsed(header, results))
+            else:
+                record = self.factory.createRecord(entry, test)
+
+            # call hook
+            onLoad(record, iterationNo, scenarioNo, runNo, test)
+
+        if pool:
+            pool.close()
+            pool.join()
 
-                    # call hook
-                    onLoad(record, iterationNo, scenarioNo, runNo, test)
+        # write the rows still buffered by the hook
+        self.flushRows()
 
         if (count == 0):
             warn('Found no log records in "%s" Stop.' %self.args.indir)
             sys.exit(0)
         else:
             info('Found %d test records.' %count)
+            if self.factory.cache:
+                info('Record cache: %d hits, %d misses.'
+                        %(self.factory.cache.hits, self.factory.cache.misses))
             if failed:
                 warn('some files failed: %s' %failed)
 
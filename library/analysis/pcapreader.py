@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import mmap
+import socket
+import struct
+
+# supported link types
+DLT_EN10MB = 1
+DLT_LINUX_SLL = 113
+
+# TCP flags
+TH_FIN = 0x01
+TH_SYN = 0x02
+TH_RST = 0x04
+TH_PUSH = 0x08
+TH_ACK = 0x10
+TH_URG = 0x20
+
+ETH_TYPE_IP = 0x0800
+ETH_TYPE_8021Q = 0x8100
+TCP_OPT_SACK = 5
+
+# fixed parts of the headers, unpacked in place
+_ethertype = struct.Struct("!H")
+# version/IHL, total length, fragment offset, protocol, src, dst
+_ip = struct.Struct("!BxHxxHxBxx4s4s")
+# sport, dport, seq, ack, data offset, flags
+_tcp = struct.Struct("!HHIIBB")
+
+class PcapReader:
+    """Streams the IPv4 TCP packets of a pcap file with Linux cooked (SLL) or
+    Ethernet link layer. The file is mapped into memory and only the header
+    fields the analysis needs are unpacked in place, so no packet objects are
+    built and the packet data is never copied.
+
+    Iterating yields one tuple per TCP packet:
+    (ts, src, dst, sport, dport, seq, ack, flags, ip_len, offset, sack)
+    src and dst are dotted quad strings, offset is the TCP data offset in
+    32 bit words and sack are the edges of the blocks of the first SACK
+    option (empty if there is none). Only full blocks are decoded, SACK
+    options too short for a single block are ignored.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        fh = open(filename, "rb")
+        try:
+            self.data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            fh.close()
+
+        # pcap global header
+        (magic,) = struct.unpack_from("<I", self.data, 0)
+        if magic in (0xa1b2c3d4, 0xa1b23c4d):
+            self.endian = "<"
+        elif magic in (0xd4c3b2a1, 0x4d3cb2a1):
+            self.endian = ">"
+        else:
+            raise ValueError("%s is not a pcap file" %filename)
+        self.resolution = 1e9 if magic in (0xa1b23c4d, 0x4d3cb2a1) else 1e6
+        (self.linktype,) = struct.unpack_from(self.endian + "I", self.data, 20)
+
+        # offsets of the ethertype and the network header
+        if self.linktype == DLT_LINUX_SLL:
+            self.link = (14, 16)
+        elif self.linktype == DLT_EN10MB:
+            self.link = (12, 14)
+        else:
+            raise ValueError("%s: unsupported link type %u"
+                    %(filename, self.linktype))
+
+        # addresses repeat, so they are converted only once
+        self.addresses = dict()
+
+    def address(self, raw):
+        """Returns the dotted quad string of a packed IPv4 address"""
+
+        try:
+            return self.addresses[raw]
+        except KeyError:
+            name = self.addresses[raw] = socket.inet_ntoa(raw)
+            return name
+
+    def __iter__(self):
+        data = self.data
+        size = len(data)
+        record = struct.Struct(self.endian + "IIII")
+        (typeoffset, linklen) = self.link
+        ethernet = self.linktype == DLT_EN10MB
+        resolution = self.resolution
+        address = self.address
+
+        pos = 24
+        while pos + 16 <= size:
+            (sec, frac, caplen, origlen) = record.unpack_from(data, pos)
+            start = pos + 16
+            end = pos = start + caplen
+            if end > size:
+                # truncated capture
+                break
+
+            (ethertype,) = _ethertype.unpack_from(data, start + typeoffset)
+            iph = start + linklen
+            if ethernet and ethertype == ETH_TYPE_8021Q:
+                (ethertype,) = _ethertype.unpack_from(data, iph + 2)
+                iph += 4
+            if ethertype != ETH_TYPE_IP or iph + 20 > end:
+                continue
+
+            (vhl, ip_len, frag, proto, src, dst) = _ip.unpack_from(data, iph)
+            # only IPv4 TCP, and no trailing fragments
+            if vhl >> 4 != 4 or proto != socket.IPPROTO_TCP or frag & 0x1fff:
+                continue
+            th = iph + (vhl & 0x0f) * 4
+            if th + 20 > end:
+                continue
+
+            (sport, dport, seq, ack, offset, flags) = _tcp.unpack_from(data, th)
+            offset >>= 4
+
+            # walk the TCP options for the first SACK option
+            sack = ()
+            opt = th + 20
+            optend = min(th + offset * 4, end)
+            while opt < optend:
+                kind = ord(data[opt])
+                if kind == 0:
+                    break
+                elif kind == 1:
+                    opt += 1
+                    continue
+                if opt + 1 >= optend:
+                    break
+                length = ord(data[opt + 1])
+                if length < 2 or opt + length > optend:
+                    break
+                # a SACK block has 8 bytes, a truncated one is skipped
+                if kind == TCP_OPT_SACK and not sack and length >= 10:
+                    sack = struct.unpack_from("!%uI" %((length - 2) / 8 * 2),
+                            data, opt + 2)
+                opt += length
+
+            yield (sec + frac / resolution, address(src), address(dst), sport,
+                   dport, seq, ack, flags, ip_len, offset, sack)
+
+    def close(self):
+        self.data.close()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import os
+import os.path
+import zlib
+import hashlib
+import tempfile
+import cPickle
+from logging import info, debug, warn, error
+
+# tcp-eval imports
+from testrecord import Derived, numericColumn
+
+# bump this whenever the parsing code changes its results without changing
+# the regexes, e.g. TestRecord.parse() or FlowgrindRecord.parse()
+PARSER_VERSION = 1
+
+# bump this whenever the layout of the cache entries changes
+CACHE_VERSION = 2
+
+def _digestFunction(digest, function, seen):
+    """Feeds the code of a "what" into the digest, including the constants,
+       nested functions and functions of its closure
+    """
+
+    if isinstance(function, Derived):
+        digest.update(repr(function.depends))
+        function = function.function
+    code = getattr(function, "func_code", function)
+    if id(code) in seen:
+        return
+    seen.add(id(code))
+
+    if not hasattr(code, "co_code"):
+        # builtins like sum() or types like float
+        digest.update(getattr(code, "__name__", repr(code)))
+        return
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names))
+    for const in code.co_consts:
+        if hasattr(const, "co_code"):
+            _digestFunction(digest, const, seen)
+        else:
+            digest.update(repr(const))
+    for cell in getattr(function, "func_closure", None) or ():
+        if callable(cell.cell_contents):
+            _digestFunction(digest, cell.cell_contents, seen)
+
+def parserVersion(name, regexes, whats=None):
+    """Returns the parser version for the given record class name, regexes
+       and, if given, whats. Changing a regex (or a what) changes the version.
+    """
+
+    digest = hashlib.md5()
+    digest.update("%s %s" %(PARSER_VERSION, name))
+    for regex in regexes:
+        # flowgrind regexes are tagged with a line class
+        if isinstance(regex, tuple):
+            digest.update(repr(regex[0]))
+            regex = regex[1]
+        digest.update(regex.pattern)
+    if whats:
+        seen = set()
+        for key in sorted(whats.keys()):
+            digest.update(key)
+            _digestFunction(digest, whats[key], seen)
+    return digest.hexdigest()
+
+def encodeResults(results):
+    """Packs every column of parsed values for a cheap (un)pickling. Numeric
+       columns are stored as typed numpy arrays, all other columns as one
+       string, which is much faster than a list of many small strings.
+       Missing optional values (None) are stored as a list of their indices.
+    """
+
+    columns = dict()
+    for key, values in results.iteritems():
+        column = numericColumn(values)
+        if column is not None:
+            columns[key] = (len(values), column, None)
+            continue
+
+        missing = [i for i, v in enumerate(values) if v is None] \
+                if None in values else []
+        joined = "\n".join([v or "" for v in values] if missing else values)
+        # values containing the separator are stored as they are
+        if values and joined.count("\n") != len(values) - 1:
+            columns[key] = (None, values, [])
+        else:
+            columns[key] = (len(values), joined, missing)
+    return columns
+
+def decodeResults(columns):
+    """Reverses encodeResults()"""
+
+    results = dict()
+    for key, (length, joined, missing) in columns.iteritems():
+        # numeric columns, as TestRecord.normalize() leaves them
+        if missing is None:
+            results[key] = joined.tolist()
+            continue
+        if length is None:
+            values = joined
+        elif length == 0:
+            values = []
+        else:
+            values = joined.split("\n")
+        for i in missing:
+            values[i] = None
+        results[key] = values
+    return results
+
+class RecordCache:
+    """Persistent cache for parsed test records. For every log file the
+       header and the parsed values are stored in a compressed sidecar file.
+       An entry is only used if path, size and mtime of the log file and the
+       parser version still match, otherwise the log is parsed again.
+
+       If no cache directory is given, the entries are stored in the
+       directory ".recordcache" next to the log files.
+    """
+
+    def __init__(self, cachedir=None):
+        self.cachedir = cachedir
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, record, regexes):
+        """Returns the parser version for the given record class and regexes.
+           Changing a regex automatically invalidates the cache.
+        """
+
+        return parserVersion(record.__class__.__name__, regexes)
+
+    def identity(self, record, regexes):
+        """Returns the key of the log file belonging to the record"""
+
+        stat = os.stat(record.filename)
+        return (os.path.abspath(record.filename), stat.st_size,
+                stat.st_mtime, self.version(record, regexes), CACHE_VERSION)
+
+    def path(self, filename):
+        """Returns the path of the cache entry for the given log file"""
+
+        if self.cachedir:
+            name = hashlib.md5(os.path.abspath(filename)).hexdigest()
+            return os.path.join(self.cachedir, "%s.cache" %name)
+        else:
+            (logdir, name) = os.path.split(filename)
+            return os.path.join(logdir, ".recordcache", "%s.cache" %name)
+
+    def load(self, record, regexes):
+        """Restores header and parsed values of the record from the cache.
+           Returns False if there is no valid cache entry.
+        """
+
+        path = self.path(record.filename)
+        try:
+            fh = open(path, "rb")
+            try:
+                entry = cPickle.loads(zlib.decompress(fh.read()))
+            finally:
+                fh.close()
+        except (IOError, OSError):
+            self.misses += 1
+            return False
+        except Exception, inst:
+            warn("Ignoring broken cache entry %s: %s" %(path, inst))
+            self.misses += 1
+            return False
+
+        if entry["identity"] != self.identity(record, regexes):
+            debug("Cache entry %s is outdated" %path)
+            self.misses += 1
+            return False
+
+        record.header = entry["header"]
+        record.results = decodeResults(entry["results"])
+        self.hits += 1
+        return True
+
+    def store(self, record, regexes):
+        """Writes header and parsed values of the record to the cache. The
+           entry is written to a temporary file first and renamed afterwards,
+           so an interrupted run never leaves a half written entry behind.
+        """
+
+        path = self.path(record.filename)
+        entry = dict(identity=self.identity(record, regexes),
+                     header=record.header, results=encodeResults(record.results))
+        try:
+            directory = os.path.dirname(path)
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            (fd, tmppath) = tempfile.mkstemp(dir=directory)
+        except (IOError, OSError), inst:
+            debug("Failed to write cache entry %s: %s" %(path, inst))
+            return
+
+        try:
+            fh = os.fdopen(fd, "wb")
+            try:
+                fh.write(zlib.compress(cPickle.dumps(entry,
+                    cPickle.HIGHEST_PROTOCOL), 1))
+            finally:
+                fh.close()
+            os.rename(tmppath, path)
+        except (IOError, OSError), inst:
+            debug("Failed to write cache entry %s: %s" %(path, inst))
+            os.remove(tmppath)
@@ -15,30 +15,74 @@
 # more details.
 
 # python imports
+import numpy
 from logging import info, debug, warn, error
 
+def numericColumn(values):
+    """Returns the values as int64 or float64 array if all of them are
+       numbers, otherwise None. Integers too large for int64 are not
+       converted, as they would lose precision as float64.
+    """
+
+    # numpy would turn missing optional values into NaN
+    if not values or None in values:
+        return None
+    # columns of a normalized record already hold numbers of one type
+    if isinstance(values[0], (int, long, float)):
+        column = numpy.array(values)
+        return column if column.dtype.kind in "if" else None
+    try:
+        return numpy.array(values, dtype=numpy.int64)
+    except OverflowError:
+        return None
+    except (ValueError, TypeError):
+        pass
+    try:
+        return numpy.array(values, dtype=numpy.float64)
+    except (ValueError, TypeError):
+        return None
+
+class Derived:
+    """A "what" that is calculated from other whats instead of the parsed
+       values. The function is called with the (memoized) values of the
+       given whats, followed by the keyword arguments of calculate().
+    """
+
+    def __init__(self, function, *depends):
+        self.function = function
+        self.depends = depends
+
 class TestRecord:
     """A record of a single Test.
        For performance reasons it expects already compiled regexes and
        an initialize dict with function pointers to calculate results,
-       from parsed values.
+       from parsed values. Calculated values are memoized per record. If a
+       RecordCache is given, parsed values are loaded from and stored to it.
     """
 
-    def __init__(self, filename, regexes, whats):
+    def __init__(self, filename, regexes, whats, cache=None):
         self.results = dict()
         self.filename = filename
         self.whats = whats
         self.valid = True
         self.header = dict()
+        self.memo = dict()
 
-        self.parse(regexes)
+        # use the parsed values of a previous run if the log is unchanged
+        if cache is None or not cache.load(self, regexes):
+            self.parse(regexes)
+            self.normalize()
+            if cache is not None:
+                cache.store(self, regexes)
 
-    def parse(self, regexes):
-        """Parses the file associated with this record."""
+        # values written after the test are not part of the cached header
+        self.parseMetadata()
 
-        fh = open(self.filename, "r")
+    def parseHeader(self, fh):
+        """Reads the header of the given file into self.header. Afterwards,
+           the file position is at the beginning of the test output.
+        """
 
-        # read header
         while 1:
             line = fh.readline()
             line = line.strip()
@@ -52,6 +96,33 @@ class TestRecord:
                 fh.seek(0)
                 break
 
+    def parseMetadata(self):
+        """Adds the values of the metadata file "<log>.meta", written after
+           the test, to self.header. Most logs do not have one.
+        """
+
+        try:
+            fh = open("%s.meta" %self.filename, "r")
+        except IOError:
+            return
+
+        for line in fh:
+            try:
+                (key, value) = line.strip().split("=",1)
+                self.header[key] = value
+            except ValueError:
+                warn("%s.meta: Error parsing metadata: %s" %(self.filename,
+                        line.strip()))
+        fh.close()
+
+    def parse(self, regexes):
+        """Parses the file associated with this record."""
+
+        fh = open(self.filename, "r")
+
+        # read header
+        self.parseHeader(fh)
+
         # read the rest
         output = fh.read()
 
@@ -67,10 +138,55 @@ class TestRecord:
 
         fh.close()
 
+    def normalize(self):
+        """Turns every column of parsed values that only holds numbers into a
+           list of int or float. The record cache stores such columns as
+           numbers, so the whats get the same types however the record was
+           loaded.
+        """
+
+        for key, values in self.results.iteritems():
+            column = numericColumn(values)
+            if column is not None:
+                self.results[key] = column.tolist()
+
     def getHeader(self):
         """Returns the header as a dictionary. """
         return self.header
 
+    def evaluate(self, what, **kwargs):
+        """Returns the memoized value of the given what, calculates it on the
+           first call. Raises KeyError if a required parsed value is missing.
+           The returned value is shared between all callers, so do not modify
+           it in place.
+        """
+
+        key = (what, tuple(sorted(kwargs.iteritems())))
+        if key in self.memo:
+            return self.memo[key]
+
+        function = self.whats[what]
+        if isinstance(function, Derived):
+            depends = [self.evaluate(dep) for dep in function.depends]
+            value = function.function(*depends, **kwargs)
+        elif self.results is None:
+            raise KeyError("%s (parsed values already released)" %what)
+        else:
+            value = function(self.results, **kwargs)
+
+        self.memo[key] = value
+        return value
+
+    def release(self, *whats):
+        """Calculates the given whats and frees the parsed values afterwards.
+           Later calls of calculate() can only return whats calculated so far
+           or derived from them.
+        """
+
+        for what in whats:
+            self.calculate(what, optional=True)
+        self.results = None
+
     def calculate(self, what, optional = False, **kwargs):
         """Calculate the given value from parsed values.
            If calculation failes, this record is marked invalid, and None is returned.
@@ -80,7 +196,7 @@ class TestRecord:
             return None
 
         try:
-            return self.whats[what](self.results, **kwargs);
+            return self.evaluate(what, **kwargs)
         except KeyError, inst:
             if not optional:
                 warn("Failed to get required value %s out of %s: KeyError:%s" %(what, self.filename, inst))
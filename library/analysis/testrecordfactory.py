@@ -23,10 +23,12 @@ from testrecords_fping import FpingRecordFactory
 from testrecords_flowgrind import FlowgrindRecordFactory
 
 class TestRecordFactory:
-    """A factory for test records"""
+    """A factory for test records. If a RecordCache is given, records are
+       loaded from it instead of parsing unchanged log files again."""
 
-    def __init__(self):
+    def __init__(self, cache=None):
         self.factories = dict()
+        self.cache = cache
 
     def initFactory(self, test):
         debug("Initializing test record factory for %s..." %test)
@@ -44,10 +46,13 @@ class TestRecordFactory:
         self.factories[test] = factory
         return factory
 
-    def createRecord(self, filename, test):
+    def createRecord(self, filename, test, cache=None):
+        """Creates a record for the given log file. Uses the given cache, or
+        the cache of this factory if none is given"""
+
         try:
             createRecord = self.factories[test].createRecord
         except KeyError:
             createRecord = self.initFactory(test).createRecord
-        return createRecord(filename, test)
+        return createRecord(filename, test, cache or self.cache)
 
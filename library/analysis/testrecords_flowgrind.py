@@ -16,15 +16,74 @@
 # python imports
 import re
 import time
+import itertools
+import numpy
 from logging import info, debug, warn, error
 
 # tcp-eval imports
 from common.functions import StrictStruct
-from testrecord import TestRecord
+from testrecord import TestRecord, Derived
+
+# line classes of a flowgrind log. Every regex is tagged with the class of
+# lines it may match, so that each line is only handed to those regexes:
+#   LEADING: the first line of the test output (regexes anchored by "^")
+#   SUMMARY: per flow summary and ICMP lines, they all contain ": "
+#   INTERIM: interim report rows, i.e. all other lines
+LEADING, SUMMARY, INTERIM = range(3)
 
 class FlowgrindRecord(TestRecord):
-    def __init__(self, filename, regexes, whats):
-        TestRecord.__init__(self, filename, regexes, whats)
+    def __init__(self, filename, regexes, whats, cache=None):
+        TestRecord.__init__(self, filename, regexes, whats, cache)
+
+    def parse(self, regexes):
+        """Parses the file associated with this record in a single pass.
+           Instead of running every regex over the whole test output, each
+           line is classified once and only matched against the regexes of
+           its class. The regexes are given as (class, regex) tuples. The
+           resulting dict is the same as the one of TestRecord.parse().
+        """
+
+        fh = open(self.filename, "r")
+
+        # read header
+        self.parseHeader(fh)
+
+        # matched groups per regex, merged in regex order afterwards to
+        # preserve the order of keys that are shared by several regexes
+        matches = [list() for i in range(len(regexes))]
+        classes = dict()
+        for (cls, regex), groups in zip(regexes, matches):
+            classes.setdefault(cls, []).append((regex.finditer, groups.append))
+        leading = classes.get(LEADING, [])
+        summary = classes.get(SUMMARY, [])
+        interim = classes.get(INTERIM, [])
+
+        first = fh.readline()
+        for finditer, append in leading:
+            for match in finditer(first):
+                append(match.groups())
+
+        for line in itertools.chain([first], fh):
+            if ": " in line:
+                extractors = summary
+            else:
+                extractors = interim
+            for finditer, append in extractors:
+                for match in finditer(line):
+                    append(match.groups())
+
+        fh.close()
+
+        # transpose matches into one list of values per key
+        for (cls, regex), groups in zip(regexes, matches):
+            if not groups:
+                continue
+            columns = zip(*groups)
+            for key, index in regex.groupindex.iteritems():
+                try:
+                    self.results[key].extend(columns[index-1])
+                except KeyError:
+                    self.results[key] = list(columns[index-1])
 
 
 class FlowgrindRecordFactory():
@@ -42,75 +101,95 @@ class FlowgrindRecordFactory():
                  'iat_avg' : float,
                  'iat_max' : float,
                  'cwnd'    : float,
-                 'ssth'    : int,
-                 'uack'    : int,
-                 'sack'    : int,
-                 'lost'    : int,
-                 'retr'    : int,
-                 'tret'    : int,
-                 'fack'    : int,
-                 'reor'    : int,
-                 'bkof'    : int,
+                 'ssth'    : numpy.int64,
+                 'uack'    : numpy.int64,
+                 'sack'    : numpy.int64,
+                 'lost'    : numpy.int64,
+                 'retr'    : numpy.int64,
+                 'tret'    : numpy.int64,
+                 'fack'    : numpy.int64,
+                 'reor'    : numpy.int64,
+                 'bkof'    : numpy.int64,
                  'krtt'    : float,
                  'krttvar' : float,
                  'krto'    : float,
-                 'castate' : lambda x:x,
-                 'mss'     : int,
-                 'mtu'     : int,
+                 'castate' : str,
+                 'mss'     : numpy.int64,
+                 'mtu'     : numpy.int64,
                  # optional values
-                 'dupthresh':int,
-                 'revr':int,
-                 'lrs':int,
-                 'tdsac':int
+                 'dupthresh':numpy.int64,
+                 'revr':numpy.int64,
+                 'lrs':numpy.int64,
+                 'tdsac':numpy.int64
                  }
+        optional_keys = ('dupthresh', 'revr', 'lrs', 'tdsac')
 
         def removeInf(val):
             return str(val) != 'inf'
 
 
-        # convenience function to group flows
+        # convenience function to group flows. For every flow and direction
+        # a StrictStruct is returned which holds one typed numpy array per
+        # key, so flow['S']['tput'][i] still works as with plain lists
         def group_flows(r):
 
-            flow_ids = map(int, set(r['flow_id']))
+            # group rows by flow id and direction (D,R for compability)
+            flow_id = numpy.array(r['flow_id'], dtype=numpy.int64)
+            reverse = numpy.array(r['direction']) != 'S'
+            group = 2 * flow_id + reverse
+            order = numpy.argsort(group, kind='mergesort')
+            group = group[order]
+
+            flow_ids = numpy.unique(flow_id)
             flow_map = dict()
+            slices = dict()
 
             # initialize value records
-            for flow_id in flow_ids:
-                flow_map[flow_id] = dict()
-                flow_map[flow_id]['S'] = StrictStruct(direction='S', size=0, **keys)
-                flow_map[flow_id]['D'] = StrictStruct(direction='D', size=0, **keys)
-                for key in keys.iterkeys():
-                    flow_map[flow_id]['S'][key] = list()
-                    flow_map[flow_id]['D'][key] = list()
-
-            # iterate over all entries, rearrange and convert
-            for i in range(len(r['flow_id'])):
-                if r['direction'][i] == 'S':
-                    d = 'S'
-                else: # D,R (for compability)
-                    d = 'D'
-
-                flow = flow_map[int(r['flow_id'][i])][d]
-                for (key, convert) in keys.iteritems():
-                    try:
-                        if r[key][i] == 'INT_MAX':
-                            flow[key].append(convert('2147483647'))
-                        else:
-                            flow[key].append(convert(r[key][i]))
-                    except KeyError, inst:
-                        # ignore optional dupthresh and rvr
-                        if key in ['dupthresh','revr','lrs']:
-                            continue
-                        warn('KeyError: Failed to get r["%s"][%u]' %(key,i))
-                        raise inst
-                    except TypeError, inst:
-                        # ignore optional dupthresh and rvr
-                        if key in ['dupthresh','revr','lrs','tdsac']:
-                            continue
-                        warn('TypeError: Failed to get r["%s"][%u]' %(key,i))
+            for fid in flow_ids:
+                flow_map[fid] = dict()
+                for (d, g) in (('S', 2 * fid), ('D', 2 * fid + 1)):
+                    lo = numpy.searchsorted(group, g, 'left')
+                    hi = numpy.searchsorted(group, g, 'right')
+                    flow_map[fid][d] = StrictStruct(direction=d, size=hi-lo,
+                                                    **keys)
+                    slices[fid, d] = slice(lo, hi)
+
+            # convert every column at once and distribute it over the flows
+            for (key, dtype) in keys.iteritems():
+                try:
+                    values = r[key]
+                except KeyError, inst:
+                    # ignore optional dupthresh and rvr
+                    if key in ['dupthresh','revr','lrs']:
+                        values = []
+                    else:
+                        warn('KeyError: Failed to get r["%s"]' %key)
                         raise inst
-                flow.size += 1
-            return flow_map.values()
+
+                # optional values are None if the extension is not present
+                valid = None
+                if key in optional_keys and None in values:
+                    valid = numpy.array([v is not None for v in values])
+                    valid = valid[order]
+                    values = [v or '0' for v in values]
+
+                if 'INT_MAX' in values:
+                    values = [v if v != 'INT_MAX' else '2147483647'
+                              for v in values]
+
+                if values:
+                    column = numpy.array(values, dtype=dtype)[order]
+                else:
+                    column = numpy.zeros(len(order), dtype=dtype)
+                    valid = numpy.zeros(len(order), dtype=bool)
+
+                for (fid, d), rows in slices.iteritems():
+                    if valid is None:
+                        flow_map[fid][d][key] = column[rows]
+                    else:
+                        flow_map[fid][d][key] = column[rows][valid[rows]]
+
+            return [flow_map[fid] for fid in flow_ids]
 
         def outages(r, min_retr=1, min_time=0, time_abs=0):
             flow_map = dict()
@@ -158,36 +237,36 @@ class FlowgrindRecordFactory():
             #  0 S: 10.0.1.147/vmrouter401, sbuf = 16384/0, rbuf = 87380/0 (real/req), SMSS = 1420, Path MTU = 1472, Interface MTU = 1472 (unknown), flow duration 30.004s/30.000s (real/req), through = 8.457316/0.024688Mbit/s (out/in), 128.58 transactions/s, 3872/0 request blocks (out/in), 0/3858 response blocks (out/in), 39.744/115.262/170.705 RTT (min/avg/max)
 
             # sender buffers and throughput
-            "S: .* sbuf = (?P<s_sbuf_real>\d+)(\/(?P<s_sbuf_req>\d+)), rbuf = (?P<s_rbuf_real>\d+)(\/(?P<s_rbuf_req>\d+))",
-            "S: .* through = (?P<s_thruput_out>\d+\.\d+)(\/(?P<s_thruput_in>\d+\.\d+))?Mbit\/s \(out\/in\)",
+            (SUMMARY, "S: .* sbuf = (?P<s_sbuf_real>\d+)(\/(?P<s_sbuf_req>\d+)), rbuf = (?P<s_rbuf_real>\d+)(\/(?P<s_rbuf_req>\d+))"),
+            (SUMMARY, "S: .* through = (?P<s_thruput_out>\d+\.\d+)(\/(?P<s_thruput_in>\d+\.\d+))?Mbit\/s \(out\/in\)"),
 
             # destination buffers and throughput
-            "[R,D]: .* sbuf = (?P<d_sbuf_real>\d+)(\/(?P<d_sbuf_req>\d+)), rbuf = (?P<d_rbuf_real>\d+)(\/(?P<d_rbuf_req>\d+))",
-            "[R,D]: .* through = (?P<d_thruput_out>\d+\.\d+)(\/(?P<d_thruput_in>\d+\.\d+))?Mbit\/s",
+            (SUMMARY, "[R,D]: .* sbuf = (?P<d_sbuf_real>\d+)(\/(?P<d_sbuf_req>\d+)), rbuf = (?P<d_rbuf_real>\d+)(\/(?P<d_rbuf_req>\d+))"),
+            (SUMMARY, "[R,D]: .* through = (?P<d_thruput_out>\d+\.\d+)(\/(?P<d_thruput_in>\d+\.\d+))?Mbit\/s"),
 
             # optional calculated source transactions
-            "S: .* transactions\/s = (?P<s_transac>\d+\.\d+)",
+            (SUMMARY, "S: .* transactions\/s = (?P<s_transac>\d+\.\d+)"),
 
             # optional calculated rtt
             # "S: .* (?P<s_sum_rtt_min>(\d+\.\d+))\/(?P<s_sum_rtt_avg>(\d+\.\d+))\/(?P<s_sum_rtt_max>(\d+\.\d+)) RTT",
 
             # source request/ response blocks
-            "S: .* request blocks = (?P<s_requ_out_sum>\d+)\/(?P<s_requ_in_sum>\d+)",
-            "S: .* response blocks = (?P<s_resp_out_sum>\d+)/(?P<s_resp_in_sum>\d+)",
+            (SUMMARY, "S: .* request blocks = (?P<s_requ_out_sum>\d+)\/(?P<s_requ_in_sum>\d+)"),
+            (SUMMARY, "S: .* response blocks = (?P<s_resp_out_sum>\d+)/(?P<s_resp_in_sum>\d+)"),
             # reciever blocks
-            "[R,D]: .* request blocks = (?P<d_requ_out_sum>\d+)\/(?P<s_requ_in_sum>\d+)",
-            "[R,D]: .* response blocks = (?P<d_resp_out_sum>\d+)/(?P<s_resp_in_sum>\d+)",
+            (SUMMARY, "[R,D]: .* request blocks = (?P<d_requ_out_sum>\d+)\/(?P<s_requ_in_sum>\d+)"),
+            (SUMMARY, "[R,D]: .* response blocks = (?P<d_resp_out_sum>\d+)/(?P<s_resp_in_sum>\d+)"),
             # optional icmp stats
-            "# S ICMP: (?P<s_icmp_code_0>\d+) (?P<s_icmp_code_1>\d+)",
-            "# D ICMP: (?P<d_icmp_code_0>\d+) (?P<d_icmp_code_1>\d+)",
+            (SUMMARY, "# S ICMP: (?P<s_icmp_code_0>\d+) (?P<s_icmp_code_1>\d+)"),
+            (SUMMARY, "# D ICMP: (?P<d_icmp_code_0>\d+) (?P<d_icmp_code_1>\d+)"),
             # flow duration
             # optional calculated source rtt
-            "S: .* RTT = (?P<s_rtt_min>\d+\.\d+)\/(?P<s_rtt_avg>\d+\.\d+)\/(?P<s_rtt_max>\d+\.\d+)",
+            (SUMMARY, "S: .* RTT = (?P<s_rtt_min>\d+\.\d+)\/(?P<s_rtt_avg>\d+\.\d+)\/(?P<s_rtt_max>\d+\.\d+)"),
             # optional calculated destination iat
-            "[R,D]: .* IAT = (?P<d_iat_min>\d+\.\d+)\/(?P<d_iat_avg>\d+\.\d+)\/(?P<d_iat_max>\d+\.\d+)",
+            (SUMMARY, "[R,D]: .* IAT = (?P<d_iat_min>\d+\.\d+)\/(?P<d_iat_avg>\d+\.\d+)\/(?P<d_iat_max>\d+\.\d+)"),
 
             # ID begin   end  through transac min RTT avg RTT max RTT min IAT avg IAT max IAT cwnd ssth uack sack lost retr tret fack reor bkof revr  rtt rttvar    rto ca state smss pmtu
-            "(?P<direction>[S,R,D])\s+"\
+            (INTERIM, "(?P<direction>[S,R,D])\s+"\
             "(?P<flow_id>\d+)\s+"\
             "(?P<begin>\d+\.\d+)\s+(?P<end>\d+\.\d+)\s+"\
             "(?P<tput>\d+\.\d+)\s+"\
@@ -202,17 +281,17 @@ class FlowgrindRecordFactory():
             "(?P<castate>loss|open|disorder|recover)\s+"\
             "(?P<mss>\d+)\s+(?P<mtu>\d+)\s+"\
             # optional extension -wolff
-            "((?P<cret>\d+)\s+(?P<cfret>\d+)\s+(?P<ctret>\d+)\s+(?P<dupthresh>\d+)\s+(?P<lrs>\d+)\s+(?P<tdsac>\d+)\s*)?",
+            "((?P<cret>\d+)\s+(?P<cfret>\d+)\s+(?P<ctret>\d+)\s+(?P<dupthresh>\d+)\s+(?P<lrs>\d+)\s+(?P<tdsac>\d+)\s*)?"),
             # # Sat Dec 11 08:20:49 2010: controlling host = vmhost1, number of flows = 2, reporting interval = 0.05s, [through] = 10**6 bit/second (SVN Rev 6756)
             # puneeth this regex should be fine actually fine! But since I don't want to undo flowgrind.. . I am keeping it!
             # If not aall plots are generated compare the flowgrind log output and this regex!
             #"((?P<cret>\d+)\s+(?P<cfret>\d+)\s+(?P<ctret>\d+)\s+(?P<dupthresh>\d+)\s*)?",
             #
-            "^# (?P<test_start_time>(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun) (?:|Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec) +\d{1,2} \d{2}:\d{2}:\d{2} \d{4}): .* reporting interval = (?P<reporting_interval>\d+\.\d+)"
+            (LEADING, "^# (?P<test_start_time>(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun) (?:|Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec) +\d{1,2} \d{2}:\d{2}:\d{2} \d{4}): .* reporting interval = (?P<reporting_interval>\d+\.\d+)")
         ]
 
         # compile regexes
-        self.regexes = map(re.compile, regexes)
+        self.regexes = [(cls, re.compile(regex)) for (cls, regex) in regexes]
 
         def extInt(a):
             try:
@@ -227,12 +306,12 @@ class FlowgrindRecordFactory():
         # phase 2 result calculation
         self.whats = dict(
             # average thruput: just sum up all summary lines (calculated from sender estimate)
-            thruput           = lambda r: sum(map(float, r['s_thruput_out'])),
+            thruput           = Derived(sum, 'thruput_list'),
             # average thruput: just sum up all summary lines (calculated from receiver estimate)
-            thruput_recv      = lambda r: sum(map(float, r['d_thruput_out'])),
-            rtt_min           = lambda r: min(map(float, r['s_rtt_min'])),
-            rtt_max           = lambda r: max(map(float, r['s_rtt_max'])),
-            rtt_avg           = lambda r: average(map(float, r['s_rtt_avg'])),
+            thruput_recv      = Derived(sum, 'thruput_recv_list'),
+            rtt_min           = Derived(min, 'rtt_min_list'),
+            rtt_max           = Derived(max, 'rtt_max_list'),
+            rtt_avg           = Derived(average, 'rtt_avg_list'),
             total_retransmits      = lambda r: max(map(extInt, r['cret'])),
             total_fast_retransmits = lambda r: max(map(extInt, r['cfret'])),
             total_rto_retransmits  = lambda r: max(map(extInt, r['ctret'])),
@@ -248,12 +327,13 @@ class FlowgrindRecordFactory():
             iat_max_list      = lambda r: map(float, r['d_iat_max']),
             iat_avg_list      = lambda r: map(float, r['d_iat_avg']),
             lport_list        = lambda r: map(int, r['lport']),
-            flow_ids          = lambda r: map(int, set(r['flow_id'])),
+            flow_ids          = lambda r: sorted(set(map(int, r['flow_id']))),
             flows             = group_flows,
             flow_id_list      = lambda r: map(int, r['flow_id']),
             forward_tput_list = lambda r: map(float, r['forward_tput_list']),
             reverse_tput_list = lambda r: map(float, r['reverse_tput_list']),
             test_start_time   = lambda r: time.mktime(time.strptime(r['test_start_time'][0])),
+            reporting_interval = lambda r: float(r['reporting_interval'][0]),
             outages           = outages,
             # icmp stats
             s_icmp_code_0 = lambda r: sum(map(int, r['s_icmp_code_0'])),
@@ -262,6 +342,6 @@ class FlowgrindRecordFactory():
             d_icmp_code_1 = lambda r: sum(map(int, r['d_icmp_code_1'])),
         )
 
-    def createRecord(self, filename, test):
-        return FlowgrindRecord(filename, self.regexes, self.whats)
+    def createRecord(self, filename, test, cache=None):
+        return FlowgrindRecord(filename, self.regexes, self.whats, cache)
 
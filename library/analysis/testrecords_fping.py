@@ -21,8 +21,8 @@ from logging import info, debug, warn, error
 from testrecord import TestRecord
 
 class FpingRecord(TestRecord):
-    def __init__(self, filename, regexes, whats):
-        TestRecord.__init__(self, filename, regexes, whats)
+    def __init__(self, filename, regexes, whats, cache=None):
+        TestRecord.__init__(self, filename, regexes, whats, cache)
 
 
 class FpingRecordFactory():
@@ -69,6 +69,6 @@ class FpingRecordFactory():
             packet_loss = lambda r: 1-float(r['pkt_rx'][0])/float(r['pkt_tx'][0])
         )
 
-    def createRecord(self, filename, test):
-        return FpingRecord(filename, self.regexes, self.whats)
+    def createRecord(self, filename, test, cache=None):
+        return FpingRecord(filename, self.regexes, self.whats, cache)
 
@@ -19,33 +19,25 @@ from logging import info, debug, warn, error
 from numpy import array
 
 # tcp-eval imports
-from testrecord import TestRecord
+from testrecord import TestRecord, Derived
 
 class PingRecord(TestRecord):
-    def __init__(self, filename, regexes, whats):
-        TestRecord.__init__(self, filename, regexes, whats)
+    def __init__(self, filename, regexes, whats, cache=None):
+        TestRecord.__init__(self, filename, regexes, whats, cache)
 
 
 class PingRecordFactory():
     def __init__(self):
         # helper functions for "whats" calulation
-        def compute_hop_avg(results):
+        def compute_hop_avg(hops):
             """Computes the average hopcount per test record"""
 
-            # convert array to float
-            fhops = map(float, results['ppt_ttl'])
-            # initial TTL is 65 so hop count is 65 - ttl
-            hops = map(lambda x: 65-x, fhops)
-            return array(hops).mean()
+            return array(hops, dtype=float).mean()
 
-        def compute_hop_std(results):
+        def compute_hop_std(hops):
             """Computes the hopcount deviation per test record"""
 
-            # convert array to float
-            fhops = map(float, results['ppt_ttl'])
-            # initial TTL is 65 so hop count is 65 - ttl
-            hops = map(lambda x: 65-x, fhops)
-            return array(hops).std()
+            return array(hops, dtype=float).std()
 
         # phase 1 data gathering
         regexes = [
@@ -87,18 +79,18 @@ class PingRecordFactory():
             pkt_rx   = lambda r: int(r['pkt_rx'][0]),
 
             # compute average hopcount
-            hop_avg  = compute_hop_avg,
+            hop_avg  = Derived(compute_hop_avg, 'hop'),
 
             # compute hopcount deviation
-            hop_std  = compute_hop_std,
+            hop_std  = Derived(compute_hop_std, 'hop'),
 
-            # list of hop counts,
+            # list of hop counts, initial TTL is 65 so hop count is 65 - ttl
             hop      = lambda r: map(lambda x: 65-int(x), r['ppt_ttl']),
 
             # compute packet loss
             packet_loss = lambda r: 1-float(r['pkt_rx'][0])/float(r['pkt_tx'][0])
         )
 
-    def createRecord(self, filename, test):
-        return PingRecord(filename, self.regexes, self.whats)
+    def createRecord(self, filename, test, cache=None):
+        return PingRecord(filename, self.regexes, self.whats, cache)
 
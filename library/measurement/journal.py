@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import os
+import os.path
+import time
+import json
+from logging import info, debug, warn, error
+
+# name of the journal in the log directory
+JOURNAL_NAME = "journal"
+
+def _arguments(kwargs):
+    """Returns the arguments of a test in the form they are journaled"""
+
+    return json.loads(json.dumps(kwargs, sort_keys=True, default=str))
+
+class TestJournal:
+    """Journal of the tests of a measurement campaign in the log directory.
+       For every finished test one line is appended: its identity (the name
+       of its log file), its arguments, its return code and the path of its
+       log. The journal is flushed after every test, so after a crash of the
+       controller the campaign can be resumed with the tests that are still
+       missing.
+
+       A test counts as done if its last entry has a return code of 0 (or
+       None) and its arguments did not change since.
+    """
+
+    def __init__(self, log_dir, resume=False):
+        self.path = os.path.join(log_dir, JOURNAL_NAME)
+        # entries per identity, in the order they were journaled
+        self.entries = dict()
+
+        if resume:
+            self.load()
+            self.fh = open(self.path, "a+")
+            # terminate a line broken by a crash, so the next entry is intact
+            self.fh.seek(0, os.SEEK_END)
+            if self.fh.tell() > 0:
+                self.fh.seek(-1, os.SEEK_END)
+                if self.fh.read(1) != "\n":
+                    self.fh.write("\n")
+        else:
+            self.fh = open(self.path, "w")
+
+    def load(self):
+        """Reads the journal of an earlier run"""
+
+        try:
+            fh = open(self.path, "r")
+        except IOError:
+            warn("No journal %s found, starting from scratch" %self.path)
+            return
+
+        count = 0
+        try:
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # the controller died while writing this line
+                    debug("Ignoring broken journal entry: %s" %line.strip())
+                    continue
+                self.entries.setdefault(entry["name"], list()).append(entry)
+                count += 1
+        finally:
+            fh.close()
+
+        info("Read %u entries of %u tests from %s" %(count,
+                len(self.entries), self.path))
+
+    def record(self, name, test_name, kwargs, rc, log_path):
+        """Appends the result of a test"""
+
+        entry = dict(name=name, test=test_name, args=_arguments(kwargs),
+                rc=rc, log=log_path, time=time.time())
+        self.entries.setdefault(name, list()).append(entry)
+
+        self.fh.write("%s\n" %json.dumps(entry, sort_keys=True, default=str))
+        self.fh.flush()
+        os.fsync(self.fh.fileno())
+
+    def done(self, name, kwargs):
+        """Returns True if the test succeeded before with the same arguments"""
+
+        entries = self.entries.get(name)
+        if not entries:
+            return False
+
+        last = entries[-1]
+        if last["args"] != _arguments(kwargs):
+            warn("Arguments of %s changed since the last run" %name)
+            return False
+        return last["rc"] == 0 or last["rc"] is None
+
+    def failures(self, name):
+        """Returns how often the test failed"""
+
+        return len([entry for entry in self.entries.get(name, list())
+                if not (entry["rc"] == 0 or entry["rc"] is None)])
+
+    def results(self):
+        """Yields (test name, return code) of all journaled entries"""
+
+        for entries in self.entries.itervalues():
+            for entry in entries:
+                yield (entry["test"], entry["rc"])
+
+    def close(self):
+        self.fh.close()
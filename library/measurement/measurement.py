@@ -26,16 +26,164 @@ import fabric.state
 # twisted imports
 from twisted.web.xmlrpc import Proxy
 from twisted.internet import defer, reactor
-from twisted.python import log
+from twisted.python import log, failure
 import twisted.names.client
 
 # tcp-eval imports
 from common.application import Application
 from sshexec import SSHConnectionFactory
+from journal import TestJournal
+from stopping import SequentialStopping, metrics
 from network.meshdb import MeshDbPool
 from network.xmlrpc import xmlrpc_many, xmlrpc
 from network.functions import twisted_sleep
 
+class TestSpec:
+    """One test of a campaign, run by Measurement.run_tests(). Besides the
+    test method, its log prefix and its arguments, a test declares the
+    resources it occupies: the nodes it runs on and the links its traffic
+    crosses (any name, e.g. "bottleneck" or a (src, dst) tuple). Two tests
+    that share a node or a link never run at the same time. Tests of the same
+    group may share links, e.g. the parallel flows of one dumbbell scenario,
+    and count as one test for the limit of Measurement.run_tests(). If no
+    nodes are given, the "src" and "dst" arguments are used"""
+
+    def __init__(self, test, logprefix, kwargs, nodes=None, links=(),
+            group=None, testbed=None):
+        self.test = test
+        self.logprefix = logprefix
+        self.kwargs = kwargs
+        self.testbed = testbed
+        if nodes is None:
+            nodes = [kwargs[key] for key in ("src", "dst") if key in kwargs]
+        self.nodes = frozenset(nodes)
+        self.links = frozenset(links)
+        self.group = group
+
+        # position in the campaign, set by Measurement.generate_tests()
+        self.iteration = None
+        self.scenario_no = None
+        self.run_no = None
+
+    def __str__(self):
+        return self.logprefix
+
+class _TestScheduler:
+    """State of one Measurement.run_tests() call"""
+
+    def __init__(self, mrs, specs, parallel):
+        self.mrs = mrs
+        self.pending = list(specs)
+        self.parallel = parallel
+        self.running = 0
+        self.failed = 0
+
+        # occupied nodes, and the group and number of tests per occupied link
+        self.nodes = set()
+        self.links = dict()
+
+        # running tests of every group, and the tests and groups that count
+        # for the limit
+        self.groups = dict()
+        self.slots = 0
+
+        # to report how many tests ran in parallel
+        self.started = time.time()
+        self.busy = 0.0
+
+        # schedule() may be entered again by a test that finishes at once
+        self.scheduling = False
+        self.again = False
+
+        self.deferred = defer.Deferred()
+
+    def conflicts(self, spec):
+        """Returns True if a running test occupies a node or a link of the
+        given test"""
+
+        if spec.nodes & self.nodes:
+            return True
+        for link in spec.links:
+            if link not in self.links:
+                continue
+            if spec.group is None or self.links[link][0] != spec.group:
+                return True
+        return False
+
+    def needsSlot(self, spec):
+        """Returns True if the test counts for the limit, i.e. it has no
+        group or no test of its group runs"""
+
+        return spec.group is None or spec.group not in self.groups
+
+    def schedule(self):
+        """Starts all pending tests that do not conflict with running ones,
+        in the order of the campaign"""
+
+        if self.scheduling:
+            self.again = True
+            return
+
+        self.scheduling = True
+        self.again = True
+        while self.again:
+            self.again = False
+            waiting = list()
+            for spec in self.pending:
+                if (self.parallel and self.slots >= self.parallel and
+                        self.needsSlot(spec)) or self.conflicts(spec):
+                    waiting.append(spec)
+                else:
+                    self.start(spec)
+            self.pending = waiting
+        self.scheduling = False
+
+        if not self.running and not self.pending and not self.deferred.called:
+            elapsed = time.time() - self.started
+            if elapsed > 0:
+                info("Campaign done after %.0fs, %.1f tests ran in parallel "\
+                        "on average" %(elapsed, self.busy / elapsed))
+            self.deferred.callback(self.failed)
+
+    def start(self, spec):
+        self.nodes.update(spec.nodes)
+        for link in spec.links:
+            (group, count) = self.links.get(link, (spec.group, 0))
+            self.links[link] = (group, count + 1)
+        if self.needsSlot(spec):
+            self.slots += 1
+        if spec.group is not None:
+            self.groups[spec.group] = self.groups.get(spec.group, 0) + 1
+        self.running += 1
+
+        debug("Starting %s, %u tests running" %(spec, self.running))
+        d = self.mrs.run_test(spec.test, logprefix=spec.logprefix,
+                testbed=spec.testbed, **spec.kwargs)
+        d.addBoth(self.finished, spec, time.time())
+
+    def finished(self, result, spec, started):
+        self.nodes.difference_update(spec.nodes)
+        for link in spec.links:
+            (group, count) = self.links[link]
+            if count == 1:
+                del self.links[link]
+            else:
+                self.links[link] = (group, count - 1)
+        if spec.group is not None:
+            self.groups[spec.group] -= 1
+            if not self.groups[spec.group]:
+                del self.groups[spec.group]
+        if self.needsSlot(spec):
+            self.slots -= 1
+        self.running -= 1
+        self.busy += time.time() - started
+
+        if isinstance(result, failure.Failure):
+            error("Test %s failed: %s" %(spec, result.getErrorMessage()))
+            self.failed += 1
+
+        self.schedule()
+
 class Measurement(Application):
     """Provides an Application wrapper for Measurement classes. Must be
     subclassed to be used. As usual for Application subclassses, the subclass
@@ -54,18 +202,54 @@ class Measurement(Application):
                 password="XaNU7X84BQJveYQX")
         self._maccache = dict()     # caches mac addresses
         self._stats = dict()
+        self._tc = dict()           # last traffic control settings per node
+        self._journal = None
 
         # create top-level parser and subparser
         Application.__init__(self, **kwargs)
         self.parser.add_argument("-l", "--log-dir", metavar="DIR", default="./",
                 action="store", dest="log_dir", help="Where to store the log "\
                         "files (default: %(default)s)")
+        self.parser.add_argument("-P", "--parallel", metavar="NUM", type=int,
+                default=1, action="store", dest="parallel", help="Run at "\
+                        "most NUM tests (or groups of tests that run "\
+                        "together) of a campaign at once, 0 for as many as "\
+                        "nodes and links allow (default: %(default)s)")
+        self.parser.add_argument("--resume", action="store_true",
+                default=False, help="Resume the campaign in the log "\
+                        "directory, skip the tests that succeeded before")
+        self.parser.add_argument("--retries", metavar="NUM", type=int,
+                default=2, action="store", help="On resume, run tests that "\
+                        "failed at most NUM times again (default: "\
+                        "%(default)s)")
+        self.parser.add_argument("--stop-at", metavar="PERCENT", type=float,
+                action="store", dest="stop_at", help="Stop the iterations "\
+                        "of a scenario/run once the confidence interval of "\
+                        "its mean is at most PERCENT of the mean (default: "\
+                        "run all iterations)")
+        self.parser.add_argument("--stop-level", metavar="PERCENT",
+                type=float, default=95, action="store", dest="stop_level",
+                help="Confidence level for --stop-at (default: "\
+                        "%(default)s)")
+        self.parser.add_argument("--stop-metric", metavar="WHAT",
+                default="thruput", action="store", dest="stop_metric",
+                help="Flowgrind value the confidence interval is computed "\
+                        "for (default: %(default)s)")
+        self.parser.add_argument("--min-iterations", metavar="NUM", type=int,
+                default=3, action="store", dest="min_iterations",
+                help="Iterations before --stop-at may stop (default: "\
+                        "%(default)s)")
 
     def apply_options(self):
         """Configure object based on the options form the argparser"""
 
         Application.apply_options(self)
 
+        if self.args.stop_at and self.args.stop_metric not in metrics():
+            error("Unknown metric %s for --stop-metric, choose one of %s. "\
+                    "Stop." %(self.args.stop_metric, ", ".join(metrics())))
+            sys.exit(1)
+
     def _getNull(self):
         """Provides a null file descriptor"""
 
@@ -260,10 +444,43 @@ class Measurement(Application):
                                             err_fd=sys.stderr, **kwargs)
         defer.returnValue(res)
 
-    def _update_stats(self, test, rc):
-        """ This function updates internal statistics """
+    def tc_changed(self, host, slot, settings, force=False):
+        """Returns True if the traffic control setting "slot" of host (e.g. a
+        netem qdisc or a htb class) has to be set to "settings", i.e. if they
+        differ from the settings last applied with tc_applied(). Sweeps use it
+        to send only the tc commands whose parameters changed"""
+
+        if not force and self._tc.get((host, slot)) == settings:
+            debug("%s: %s unchanged" %(host, slot))
+            return False
+
+        return True
+
+    def tc_applied(self, host, slot, settings, rc):
+        """Records that the command setting "slot" of host to "settings"
+        returned rc. If it failed, the slot is sent again on the next call,
+        whatever its settings"""
+
+        key = (host, slot)
+        if rc == 0:
+            self._tc[key] = settings
+        else:
+            warn("%s: setting %s failed (rc=%s)" %(host, slot, rc))
+            self._tc.pop(key, None)
+
+    def _getJournal(self):
+        """Provides the journal of the campaign. On resume, the results of
+        the earlier runs are added to the statistics"""
+
+        if not self._journal:
+            self._journal = TestJournal(self.args.log_dir, self.args.resume)
+            for test_name, rc in self._journal.results():
+                self._update_stats(test_name, rc)
 
-        test_name = test.func_name
+        return self._journal
+
+    def _update_stats(self, test_name, rc):
+        """ This function updates internal statistics """
 
         if not self._stats.has_key(test_name):
             self._stats[test_name] = dict()
@@ -276,22 +493,52 @@ class Measurement(Application):
             test_stats[rc] += 1
 
     @defer.inlineCallbacks
-    def run_test(self, test, append=False, **kwargs):
-        """Runs a test method with arguments self, logfile, args"""
+    def run_test(self, test, append=False, logprefix=None, testbed=None,
+            **kwargs):
+        """Runs a test method with arguments self, logfile, args. The log file
+        is named after "logprefix", by default after self.logprefix. The
+        testbed parameters (e.g. of a sweep) are written into the header of
+        the log as "testbed_param_<name>=<value>". Values only known after
+        the test are written to the metadata file next to the log"""
 
         if not os.path.exists(self.args.log_dir):
             info("%s does not exist, creating. " % self.args.log_dir)
             os.mkdir(self.args.log_dir)
 
-        log_name = "%s_%s" %(self.logprefix, test.func_name)
-        log_path = os.path.join(self.args.log_dir, log_name)
+        if logprefix is None:
+            logprefix = self.logprefix
+        log_path = self.log_path(logprefix, test)
+        log_name = os.path.basename(log_path)
+
+        # the testbed parameters are part of the identity of a test
+        args = dict(kwargs)
+        if testbed:
+            args["testbed"] = testbed
+
+        # skip the tests that are done already
+        journal = self._getJournal()
+        if self.args.resume:
+            if journal.done(log_name, args):
+                debug("Skipping test %s, it succeeded before" %log_name)
+                defer.returnValue(None)
+            failures = journal.failures(log_name)
+            if failures > self.args.retries:
+                warn("Skipping test %s, it failed %u times" %(log_name,
+                        failures))
+                defer.returnValue(None)
 
         if append:
             log_file = open(log_path, 'a')
         else:
             log_file = open(log_path, 'w')
+            # the metadata of an earlier run of the test is outdated
+            if os.path.exists("%s.meta" %log_path):
+                os.remove("%s.meta" %log_path)
 
             # write config into logfile
+            if testbed:
+                for item in sorted(testbed.iteritems()):
+                    log_file.write("testbed_param_%s=%s\n" %item)
             for item in kwargs.iteritems():
                 log_file.write("%s=%s\n" %item)
             log_file.write("test_start_time=%s\n" %time.time())
@@ -300,18 +547,157 @@ class Measurement(Application):
 
         # actually run test
         info("Starting test %s with: %s", test.func_name, kwargs)
-        rc = yield test(self, log_file, **kwargs)
+        try:
+            rc = yield test(self, log_file, **kwargs)
+        except Exception, inst:
+            # journal the test as failed, so it is run again on resume
+            self._update_stats(test.func_name, str(inst))
+            journal.record(log_name, test.func_name, args, str(inst),
+                    log_path)
+            log_file.close()
+            self.write_metadata(log_path, test_end_time=time.time(),
+                    test_rc=str(inst))
+            raise
         if (rc == 0 or rc == None):
             info("Finished test.")
         else:
             warn("Test returned with RC=%s" %rc)
 
-        self._update_stats(test,rc)
+        self._update_stats(test.func_name, rc)
+        journal.record(log_name, test.func_name, args, rc, log_path)
 
         log_file.close()
+        self.write_metadata(log_path, test_end_time=time.time(), test_rc=rc)
+
+    def write_metadata(self, log_path, **values):
+        """Appends values that are only known after the test (e.g. its end
+        time) to the metadata file "<log>.meta" next to the log. The log
+        itself is never rewritten, TestRecord adds the values to the header
+        of the log"""
+
+        fh = open("%s.meta" %log_path, "a")
+        for item in sorted(values.iteritems()):
+            fh.write("%s=%s\n" %item)
+        fh.close()
+
+    def log_path(self, logprefix, test):
+        """Returns the path of the log file of a test"""
+
+        return os.path.join(self.args.log_dir, "%s_%s" %(logprefix,
+                test.func_name))
+
+    def report_stats(self):
+        """Logs how often each test returned which return code, on resume
+        including the earlier runs of the campaign"""
+
+        for test_name in sorted(self._stats.keys()):
+            test_stats = self._stats[test_name]
+            succeeded = sum([count for rc, count in test_stats.iteritems()
+                    if rc == 0 or rc == None])
+            failed = ", ".join(["RC=%s: %u" %(rc, count) for rc, count
+                    in sorted(test_stats.iteritems())
+                    if not (rc == 0 or rc == None)])
+            if failed:
+                info("%s: %u succeeded, failed with %s" %(test_name,
+                        succeeded, failed))
+            else:
+                info("%s: %u succeeded" %(test_name, succeeded))
+
+    def generate_tests(self, test, iterations, scenarios, runs, links=(),
+            group_runs=False, port=None, testbed=None, **kwargs):
+        """returns a list of TestSpec
+
+           Generates one test per iteration, scenario and run with the usual
+           log prefix "iNNN_sN_rN". The arguments of a test are kwargs, the
+           keys of the run and the keys of the scenario. All tests occupy
+           the given links. If group_runs is True, the runs of one scenario
+           of one iteration share the links, so they run in parallel. If the
+           name of a port argument is given, every test gets its own port.
+           The testbed parameters are written into the header of every log.
+        """
+
+        res = list()
+        for it in iterations:
+            for scenario_no, scenario in enumerate(scenarios):
+                for run_no, run in enumerate(runs):
+                    args = dict(kwargs)
+                    args.update(run)
+                    args.update(scenario)
+                    if port:
+                        args[port] = int("%u%u%02u" %(scenario_no + 1, it,
+                                run_no))
+
+                    if group_runs:
+                        group = (it, scenario_no)
+                    else:
+                        group = None
+                    spec = TestSpec(test, "i%03u_s%u_r%u" %(it, scenario_no,
+                            run_no), args, links=links, group=group,
+                            testbed=testbed)
+                    spec.iteration = it
+                    spec.scenario_no = scenario_no
+                    spec.run_no = run_no
+                    res.append(spec)
+        return res
+
+    def run_tests(self, specs, parallel=None):
+        """Runs the tests of a campaign, given as a list of TestSpec, as many
+        at once as the testbed allows. A test is started as soon as no running
+        test occupies one of its nodes or links and less than "parallel" tests
+        or groups run (default: --parallel, 0 for no limit). Tests start in
+        the order
+        of the list, but a waiting test does not hold back later tests that do
+        not conflict. Returns a deferred that fires with the number of failed
+        tests when all tests are done"""
+
+        if parallel is None:
+            parallel = self.args.parallel
+
+        scheduler = _TestScheduler(self, specs, parallel)
+        scheduler.schedule()
+        return scheduler.deferred
+
+    @defer.inlineCallbacks
+    def run_iterations(self, test, iterations, scenarios, runs, **kwargs):
+        """Runs the tests of all scenarios and runs for every iteration, one
+        iteration after the other with run_tests(). The keyword arguments are
+        passed to generate_tests().
+
+        With --stop-at, "iterations" is the maximum: after every iteration
+        the logs are parsed and a scenario/run is not run anymore once its
+        confidence interval is narrow enough (see SequentialStopping)"""
+
+        stopping = None
+        if self.args.stop_at:
+            stopping = SequentialStopping(self.args.log_dir, self.args.stop_at,
+                    self.args.stop_level, self.args.stop_metric,
+                    self.args.min_iterations)
+
+        for it in iterations:
+            specs = self.generate_tests(test, [it], scenarios, runs, **kwargs)
+            if stopping:
+                specs = [spec for spec in specs if not stopping.done(
+                        "s%u_r%u" %(spec.scenario_no, spec.run_no))]
+            yield self.run_tests(specs)
+
+            if not stopping:
+                continue
+            for spec in specs:
+                stopping.add("s%u_r%u" %(spec.scenario_no, spec.run_no),
+                        self.log_path(spec.logprefix, spec.test))
+            if stopping.update(it):
+                info("All scenarios and runs are done after iteration %u"
+                        %it)
+                break
+
+        if stopping:
+            stopping.close()
 
     @defer.inlineCallbacks
     def tear_down(self):
+        self.report_stats()
+        if self._journal:
+            self._journal.close()
         yield self._scf.disconnect()
 
     def sleep(self, seconds):
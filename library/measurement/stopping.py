@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import os
+import os.path
+import time
+from logging import info, debug, warn, error
+
+# tcp-eval imports
+from analysis.aggregates import ConfidenceInterval
+from analysis.testrecords_flowgrind import FlowgrindRecordFactory
+
+# name of the log of the stopping decisions in the log directory
+STOPPING_NAME = "stopping"
+
+# flowgrind whats that are no single number besides the "*_list" ones
+NON_SCALAR_WHATS = ("flow_ids", "flows", "outages")
+
+def metrics():
+    """Returns the metrics sequential stopping can be based on, i.e. the
+       flowgrind whats that are a single number"""
+
+    return sorted(what for what in FlowgrindRecordFactory().whats
+            if not what.endswith("_list") and what not in NON_SCALAR_WHATS)
+
+class SequentialStopping:
+    """Sequential stopping of the iterations of a campaign. After every
+       iteration the flowgrind logs just written are parsed and the chosen
+       metric ("what" of the flowgrind records, throughput by default) is
+       added to the running mean and variance of its scenario and run. A
+       scenario/run is done once the half width of the confidence interval of
+       its mean is at most "target" percent of the mean, but not before
+       "minimum" iterations. Tests of scenarios/runs that are done are not run
+       anymore.
+
+       Every decision is appended to the file "stopping" in the log
+       directory, next to the logs it is based on.
+    """
+
+    def __init__(self, log_dir, target, level=95, metric="thruput",
+            minimum=3):
+        self.target = target
+        self.level = level
+        self.metric = metric
+        self.minimum = max(minimum, 2)
+        self.factory = FlowgrindRecordFactory()
+        if metric not in metrics():
+            raise ValueError("Unknown metric %s for stopping, choose one "\
+                    "of %s" %(metric, ", ".join(metrics())))
+
+        # running mean and variance per scenario/run, all scenarios/runs that
+        # ran and the done ones
+        self.stats = dict()
+        self.scheduled = set()
+        self.stopped = set()
+
+        if not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+        self.fh = open(os.path.join(log_dir, STOPPING_NAME), "a")
+        self.fh.write("# %s: %s, target %s%%, level %s%%, minimum %u\n"
+                %(time.ctime(), metric, target, level, self.minimum))
+        self.fh.flush()
+
+    def done(self, key):
+        """Returns True if the scenario/run given by key (e.g. "s0_r1") is
+           done"""
+
+        return key in self.stopped
+
+    def add(self, key, filename):
+        """Adds the metric of the given flowgrind log to the scenario/run
+           given by key
+        """
+
+        # a scenario/run without readable logs is never done
+        self.scheduled.add(key)
+        try:
+            record = self.factory.createRecord(filename, "flowgrind")
+            value = record.calculate(self.metric, optional=True)
+        except (IOError, OSError), inst:
+            warn("Failed to read %s: %s" %(filename, inst))
+            return
+        if value is None:
+            warn("No %s in %s, ignored for stopping" %(self.metric, filename))
+            return
+        if not isinstance(value, (int, long, float)):
+            warn("%s in %s is no number, ignored for stopping" %(self.metric,
+                    filename))
+            return
+
+        if key not in self.stats:
+            self.stats[key] = ConfidenceInterval()
+        self.stats[key].step(float(value), self.level / 100.0)
+
+    def update(self, iteration):
+        """Decides which scenarios/runs are done after the given iteration.
+           Returns True if all scenarios/runs that ran are done.
+        """
+
+        for key in sorted(self.scheduled - set(self.stats.keys())):
+            debug("%s after iteration %u: no %s yet, continue" %(key,
+                    iteration, self.metric))
+
+        for key in sorted(self.stats.keys()):
+            if key in self.stopped:
+                continue
+
+            stats = self.stats[key]
+            halfwidth = stats.finalize()
+            if stats.n < self.minimum or halfwidth is None:
+                decision = "continue"
+            elif halfwidth <= abs(stats.mean) * self.target / 100.0:
+                decision = "stop"
+                self.stopped.add(key)
+            else:
+                decision = "continue"
+
+            if halfwidth is None:
+                halfwidth = float("nan")
+            debug("%s after iteration %u: n=%u, mean=%f, ci=%f, %s" %(key,
+                    iteration, stats.n, stats.mean, halfwidth, decision))
+            self.fh.write("%u\t%s\t%u\t%f\t%f\t%s\n" %(iteration, key,
+                    stats.n, stats.mean, halfwidth, decision))
+        self.fh.flush()
+
+        return bool(self.scheduled) and self.scheduled <= self.stopped
+
+    def close(self):
+        self.fh.close()
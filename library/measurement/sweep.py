@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import itertools
+from logging import info, debug, warn, error
+
+def expand(parts, **common):
+    """Returns the points of a sweep as a list of dicts. Every part is a dict
+       of parameters, list values are swept over (all combinations of the
+       lists of a part), all other values are fixed. The keys of "common" are
+       added to every point, unless a part sets them itself.
+    """
+
+    points = list()
+    for part in parts:
+        part = dict(common, **part)
+        keys = sorted(part.keys())
+        values = [part[key] if isinstance(part[key], (list, tuple))
+                else [part[key]] for key in keys]
+        for combination in itertools.product(*values):
+            points.append(dict(zip(keys, combination)))
+    return points
+
+def distance(a, b, settings):
+    """Returns the number of settings that differ between two points"""
+
+    return len([key for key in settings if a.get(key) != b.get(key)])
+
+class SweepPlan:
+    """Order of the points of a parameter sweep. Changing the testbed (netem
+       qdiscs, htb classes) costs remote commands, so the points are ordered
+       greedily: starting with the current state of the testbed, the next
+       point is always the one with the fewest commands (ties are broken by
+       the order of the sweep). Only the keys in "settings" are testbed
+       settings, other keys (e.g. labels) do not cost anything. "commands"
+       lists the settings every command of the testbed sets, e.g.
+       [("delay",), ("reorder", "rdelay")], a command is sent if one of its
+       settings changes. By default, every setting has a command of its own.
+
+       Iterating the plan several times (see iterate()) runs every second
+       iteration backwards, so there is no change between two iterations.
+    """
+
+    def __init__(self, parts, settings, start=None, commands=None, **common):
+        self.settings = tuple(settings)
+        if commands is None:
+            commands = [(key,) for key in self.settings]
+        self.slots = [tuple(keys) for keys in commands]
+        self.start = start
+        self.declared = expand(parts, **common)
+        self.points = self.order(self.declared)
+
+    def order(self, points):
+        """Returns the points in greedy nearest neighbour order"""
+
+        pending = list(points)
+        ordered = list()
+        current = self.start
+        while pending:
+            if current is None:
+                best = 0
+            else:
+                costs = [self.cost(current, point) for point in pending]
+                best = costs.index(min(costs))
+            current = pending.pop(best)
+            ordered.append(current)
+        return ordered
+
+    def cost(self, a, b):
+        """Returns the number of commands to go from point a to point b"""
+
+        return len([keys for keys in self.slots if distance(a, b, keys)])
+
+    def commands(self, points=None):
+        """Returns the number of commands sent while running the points in
+           the given order (default: the planned order)
+        """
+
+        if points is None:
+            points = self.points
+        total = 0
+        current = self.start
+        for point in points:
+            if current is not None:
+                total += self.cost(current, point)
+            else:
+                total += len(self.slots)
+            current = point
+        return total
+
+    def changes(self, points=None):
+        """Returns the number of changed settings while running the points in
+           the given order (default: the planned order)
+        """
+
+        if points is None:
+            points = self.points
+        total = 0
+        current = self.start
+        for point in points:
+            if current is not None:
+                total += distance(current, point, self.settings)
+            else:
+                total += len(self.settings)
+            current = point
+        return total
+
+    def estimate(self, point_duration, command_duration, iterations=1):
+        """Returns the estimated duration of the campaign in seconds, given
+           the duration of the tests of one point and of one command
+        """
+
+        commands = self.commands([point for (it, point)
+                in self.iterate(iterations)])
+        return iterations * len(self.points) * point_duration +\
+                commands * command_duration
+
+    def report(self, point_duration, command_duration, iterations=1):
+        """Logs the plan and the estimated duration of the campaign"""
+
+        points = [point for (it, point) in self.iterate(iterations)]
+        declared = self.declared * iterations
+        seconds = int(self.estimate(point_duration, command_duration,
+                iterations))
+        info("Sweep of %u points: %u commands (%u setting changes), %u "\
+                "(%u) in the declared order, %u sending every command "\
+                "for every point" %(len(self.points), self.commands(points),
+                self.changes(points), self.commands(declared),
+                self.changes(declared), len(points) * len(self.slots)))
+        info("Estimated duration %u:%02u:%02u" %(seconds / 3600,
+                seconds / 60 % 60, seconds % 60))
+        for point in self.points:
+            debug("Sweep point: %s" %", ".join(["%s=%s" %(key, point[key])
+                    for key in sorted(point.keys())]))
+
+    def iterate(self, iterations):
+        """Yields (iteration, point) for the given number of iterations of
+           the plan. Every second iteration runs backwards.
+        """
+
+        for it in range(iterations):
+            if it % 2:
+                points = reversed(self.points)
+            else:
+                points = self.points
+            for point in points:
+                yield (it, point)
+
+    def __iter__(self):
+        return iter(self.points)
+
+    def __len__(self):
+        return len(self.points)
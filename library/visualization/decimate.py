@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import os
+import numpy
+from logging import info, debug, warn, error
+
+def toPixels(plotsize, dpi):
+    """Converts a plot size like "14.4cm,8.7cm" into pixels at the given
+       resolution. Like for the epslatex terminal, sizes without unit are
+       inches
+    """
+
+    pixels = list()
+    for length in plotsize.split(","):
+        length = length.strip()
+        if length.endswith("cm"):
+            inches = float(length[:-2]) / 2.54
+        elif length.endswith("in"):
+            inches = float(length[:-2])
+        else:
+            inches = float(length)
+        pixels.append(int(round(inches * dpi)))
+    return pixels
+
+def decimateRows(x, columns, width, exact=()):
+    """Returns the sorted indices of the rows of a time series that are
+       visible in a plot "width" pixels wide. x must be ascending. For every
+       pixel column the first and the last row are kept, and for every
+       column in "columns" the rows of its minimum and maximum (M4
+       aggregation), so the lines look the same. Every row in which a column
+       of "exact" changes is kept together with its predecessor, so these
+       events are plotted exactly.
+    """
+
+    x = numpy.asarray(x, dtype=float)
+    count = len(x)
+    if count <= 2 or width < 1 or x[-1] <= x[0]:
+        return numpy.arange(count)
+
+    bucket = ((x - x[0]) / (x[-1] - x[0]) * (width - 1)).astype(int)
+    keep = numpy.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    # first and last row of every pixel column
+    change = bucket[1:] != bucket[:-1]
+    keep[1:][change] = True
+    keep[:-1][change] = True
+
+    # rows of minimum and maximum per pixel column
+    for column in columns:
+        order = numpy.lexsort((numpy.asarray(column), bucket))
+        sortedBuckets = bucket[order]
+        starts = numpy.flatnonzero(sortedBuckets[1:] != sortedBuckets[:-1]) + 1
+        keep[order[numpy.concatenate(([0], starts))]] = True
+        keep[order[numpy.concatenate((starts - 1, [count - 1]))]] = True
+
+    # events
+    for column in exact:
+        column = numpy.asarray(column)
+        change = column[1:] != column[:-1]
+        keep[1:][change] = True
+        keep[:-1][change] = True
+
+    return numpy.flatnonzero(keep)
+
+class PixelGrid:
+    """Raster of a plot at print resolution. Data points and segments that
+       fall onto the same pixels as one before are invisible and can be
+       dropped. Used to decimate the datasets of xpl2pdf.
+    """
+
+    def __init__(self, xrange, yrange, size):
+        (self.xmin, xmax) = xrange
+        (self.ymin, ymax) = yrange
+        (self.width, self.height) = size
+        self.xscale = (self.width - 1) / float(xmax - self.xmin or 1)
+        self.yscale = (self.height - 1) / float(ymax - self.ymin or 1)
+
+    def decimateFile(self, filename, columns):
+        """Rewrites a dataset file with rows "x y" or "x1 y1 x2 y2" of float64
+           values in gnuplot's binary format and only keeps the first point
+           (or segment) per pixel (or pair of pixels). Returns the number of
+           kept and of all rows.
+        """
+
+        table = numpy.fromfile(filename, dtype=numpy.float64)
+        table = table.reshape(-1, columns)
+        total = len(table)
+        if not total:
+            return 0, 0
+
+        # one (x, y) pair per point
+        origin = numpy.tile([self.xmin, self.ymin], columns / 2)
+        scale = numpy.tile([self.xscale, self.yscale], columns / 2)
+        cells = ((table - origin) * scale).astype(numpy.int64)
+
+        # sort the rows by their cells, lexsort is stable, so the first row
+        # of every run of equal cells is the first one in the file
+        order = numpy.lexsort(cells.T[::-1])
+        cells = cells[order]
+        new = numpy.concatenate(([True],
+                (cells[1:] != cells[:-1]).any(axis=1)))
+        first = numpy.sort(order[new])
+
+        tmpfilename = "%s.tmp" %filename
+        table[first].tofile(tmpfilename)
+        os.rename(tmpfilename, filename)
+        return len(first), total
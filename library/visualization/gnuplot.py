@@ -16,18 +16,259 @@
 # more details.
 
 # python imports
-import gc
+import os
+import re
 import os.path
+import copy
+import math
+import time
+import atexit
+import shutil
+import subprocess
+import tempfile
 import textwrap
+import itertools
+import multiprocessing
+import numpy
 import Gnuplot
 from logging import info, debug, warn, error
 
 # tcp-eval imports
-from common.functions import call
+from common.functions import call, CommandFailed
 from latex import UmLatex
+from rendercache import RenderCache
+from decimate import toPixels
+
+# default size of the plots
+PLOTSIZE = "14.4cm,8.7cm"
+
+# dots per inch of the preview images
+PREVIEW_DPI = 96
+
+# quoted strings of gnuplot commands, LaTeX macros and their arguments
+_quoted = re.compile(r'"([^"]*)"')
+_macroArg = re.compile(r'\\{1,2}[a-zA-Z]+(\[[^\]]*\])?\{([^{}]*)\}')
+_macro = re.compile(r'\\{1,2}([a-zA-Z]+)')
+
+# messages of gnuplot, e.g. '"fig.gplot", line 12: undefined variable: x'.
+# Reading from a pipe, gnuplot may continue after an error
+_gnuplotMessage = re.compile(r'line \d+: ')
+_gnuplotWarning = re.compile(r'\bwarning: ', re.IGNORECASE)
+
+def _plainText(command):
+    """Strips the LaTeX markup from the quoted strings of a gnuplot command,
+    e.g. "Throughput in $\\si{\\Mbps}$" becomes "Throughput in Mbps"."""
+
+    def plain(match):
+        text = match.group(1).replace("$", "")
+        while True:
+            (text, count) = _macroArg.subn(r"\2", text)
+            if not count:
+                break
+        return '"%s"' %_macro.sub(r"\1", text)
+
+    return _quoted.sub(plain, command)
+
+def binarySpec(filename, columns):
+    """Returns the data source of a plot command for a file of rows of
+    "columns" float64 values in gnuplot's binary format"""
+
+    return '"%s" binary format="%s"' %(filename, "%float64" * columns)
+
+class UmData:
+    """Table of numbers for gnuplot, given as a 2-d array or a list of
+    columns. The table is written to "<basename>.dat" in gnuplot's binary
+    format, so neither Python nor gnuplot have to format or parse text. If
+    "text" is True, it is written to "<basename>.values" as text as well"""
+
+    def __init__(self, basename, columns, header=None, text=False):
+        if isinstance(columns, numpy.ndarray) and columns.ndim == 2:
+            table = columns
+        else:
+            table = numpy.column_stack(columns)
+        table = numpy.asarray(table, dtype=numpy.float64)
+
+        self.filename = "%s.dat" %basename
+        self.columns = table.shape[1]
+        table.tofile(self.filename)
+
+        self.textfilename = None
+        if text:
+            self.textfilename = "%s.values" %basename
+            info("Generating %s..." %self.textfilename)
+            fh = open(self.textfilename, "w")
+            if header:
+                for line in header.split("\n"):
+                    fh.write("# %s\n" %line)
+            numpy.savetxt(fh, table, fmt="%f")
+            fh.close()
+
+    def spec(self):
+        """Returns the data source of a plot command for this table"""
+
+        return binarySpec(self.filename, self.columns)
+
+    def files(self):
+        """Returns the files written for this table"""
+
+        return [f for f in (self.filename, self.textfilename) if f]
+
+    def remove(self):
+        """Removes the binary and the text file"""
+
+        for filename in self.files():
+            os.remove(filename)
+
+class _RecordingGnuplot(Gnuplot.Gnuplot):
+    """Gnuplot instance that only records the commands of a figure. They
+    identify the figure in the render cache and are sent to a gnuplot worker
+    of the _GnuplotPool once the figure is rendered. No gnuplot process is
+    started for the figure itself"""
+
+    def __init__(self):
+        self.commands = list()
+        self.gnuplot = None
+
+    def __call__(self, s):
+        self.commands.append(s)
+
+class _GnuplotWorker:
+    """Long-lived gnuplot process. Figures are rendered one after the other,
+    every figure starts with "reset", so no settings leak from one figure
+    into the next"""
+
+    def __init__(self):
+        start = time.time()
+        self.pid = os.getpid()
+        self.figures = 0
+        self.process = subprocess.Popen(["gnuplot"], stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                close_fds=True)
+
+        # wait until gnuplot is ready
+        self.run([])
+        self.figures = 0
+        self.startup = time.time() - start
+        debug("Started gnuplot worker %u in %.3fs" %(self.process.pid,
+                self.startup))
+
+    def run(self, commands):
+        """Sends the commands after a reset, closes the output file and waits
+        until gnuplot is done. Returns the output of gnuplot. Raises
+        CommandFailed if gnuplot exits or reports an error in the commands,
+        warnings of gnuplot are logged"""
+
+        # like a gnuplot started for the figure, relative paths are resolved
+        # against the current directory
+        marker = "tcp-eval: figure %u done" %self.figures
+        script = ["reset", 'cd "%s"' %os.getcwd()] + commands +\
+                ["set output", 'print "%s"' %marker]
+
+        output = list()
+        try:
+            self.process.stdin.write("\n".join(script) + "\n")
+            self.process.stdin.flush()
+            while True:
+                line = self.process.stdout.readline()
+                if not line or line.rstrip("\n") == marker:
+                    break
+                output.append(line)
+        except IOError:
+            line = None
+
+        if not line:
+            rc = self.process.wait()
+            raise CommandFailed("gnuplot", rc, "".join(output).strip())
+
+        self.figures += 1
+        failed = False
+        for line in output:
+            if _gnuplotWarning.search(line):
+                warn("gnuplot: %s" %line.strip())
+            elif _gnuplotMessage.search(line):
+                failed = True
+        if failed:
+            # the exit code of gnuplot on errors in batch mode
+            raise CommandFailed("gnuplot", 1, "".join(output).strip())
+        return "".join(output)
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except IOError:
+            pass
+        self.process.wait()
+
+class _GnuplotPool:
+    """Gnuplot workers of this process, shared by all figures. A worker is
+    started on demand and receives the commands of all following figures,
+    so the start of gnuplot is only paid once instead of once per figure.
+    Workers of the parent process are not used by forked processes (e.g. of
+    a render session)"""
+
+    # idle workers
+    idle = list()
+
+    # number of started workers, their accumulated startup time and the
+    # number of rendered figures
+    started = 0
+    startup = 0.0
+    figures = 0
+
+    @classmethod
+    def render(cls, commands, verbose=False):
+        """Runs the commands of a figure on an idle or a new worker"""
+
+        worker = None
+        while cls.idle:
+            worker = cls.idle.pop()
+            if worker.pid == os.getpid():
+                break
+            worker = None
+        if not worker:
+            worker = _GnuplotWorker()
+            if cls.started == 0:
+                atexit.register(cls.shutdown)
+            cls.started += 1
+            cls.startup += worker.startup
+
+        # a worker that exited is not reused, one that reported an error in
+        # the commands is, as every figure starts with a reset
+        try:
+            output = worker.run(commands)
+        except CommandFailed:
+            if worker.process.poll() is None:
+                cls.idle.append(worker)
+            raise
+        cls.idle.append(worker)
+        cls.figures += 1
+
+        if output.strip():
+            if verbose:
+                info("gnuplot: %s" %output.strip())
+            else:
+                debug("gnuplot: %s" %output.strip())
+
+    @classmethod
+    def shutdown(cls):
+        """Terminates all workers of this process"""
+
+        for worker in cls.idle:
+            if worker.pid == os.getpid():
+                worker.close()
+        cls.idle = list()
+
+        if cls.started:
+            debug("gnuplot: %u figures rendered by %u workers, "\
+                    "startup took %.3fs" %(cls.figures, cls.started,
+                    cls.startup))
 
 class UmGnuplot():
     """Module for gnuplot scripting."""
+
+    # render quick "png" or "svg" previews instead of pdf files, set by the
+    # applications
+    preview = None
     def __init__(self, plotname, outdir, debug=False, saveit=None, force=False, *args, **kwargs):
         """Plotname is for filename generation"""
 
@@ -36,7 +277,7 @@ class UmGnuplot():
         self.outdir = outdir
         self.force = force
 
-        self.gplot = Gnuplot.Gnuplot()
+        self.gplot = _RecordingGnuplot()
 
         # turn on math environment for axis
         self.gplot('set format "$%g$"')
@@ -49,7 +290,7 @@ class UmGnuplot():
         # for 2 pictures with subcaption, one line caption
         #self.plotsize = "14.4cm,9.3cm"
         # for 2 pictures with subcaption, two line caption
-        self.plotsize = "14.4cm,8.7cm"
+        self.plotsize = PLOTSIZE
 
         # font size
         self.fontsize = 6
@@ -60,6 +301,10 @@ class UmGnuplot():
         # actual plotcmd
         self._plotcmd = None
 
+        # tables written for this plot, removed together with the other
+        # intermediate files
+        self._data = list()
+
         # colors and line styles
         self.gplot(textwrap.dedent("""
         set style line 21 lt rgb "#DC143C" lw 1 pt 7 ps 1 #Crimson
@@ -180,6 +425,48 @@ class UmGnuplot():
     def setLogScale(self, axes="y"):
         self.gplot('set log %s' %axes)
 
+    def data(self, columns, name=None, header=None):
+        """Writes a table (a 2-d array or a list of columns) for this plot
+        and returns it. The result can be passed to the plot methods instead
+        of a file name, several times. Its files are named after the plot or
+        "name", the text file is only kept with saveit"""
+
+        if not name:
+            name = self._plotname
+            if self._data:
+                name = "%s_%u" %(name, len(self._data))
+        data = UmData(os.path.join(self.outdir, name), columns, header,
+                text=self.saveit)
+        self._data.append(data)
+        return data
+
+    def source(self, values):
+        """Returns the data source of a plot command for "values", which is
+        a file name, an UmData object or a table like for data()"""
+
+        if isinstance(values, basestring):
+            return '"%s"' %values
+        if not isinstance(values, UmData):
+            values = self.data(values)
+        return values.spec()
+
+    def usingSpec(self, values, using):
+        """Returns the using part of a plot command. Binary tables have no
+        default columns, so the first two are used unless "using" is given"""
+
+        if not using and not isinstance(values, basestring):
+            using = "1:2"
+        if using:
+            return "using %s" %using
+        return ""
+
+    def removeData(self):
+        """Removes the tables of this plot unless saveit is given"""
+
+        if not self.saveit:
+            for data in self._data:
+                data.remove()
+
     def plot(self, cmd):
         """Extends plotcmd with cmd"""
 
@@ -202,27 +489,79 @@ class UmGnuplot():
         epsfilename   = os.path.join(self.outdir, plotname+"_eps.eps")
         epspdffilename = os.path.join(self.outdir, plotname+"_eps.pdf")
 
-        info("Gnuplot: Generating %s" %texfilename)
         # always epslatex output
-        self.gplot('set terminal epslatex input color colortext solid '\
+        terminal = 'set terminal epslatex input color colortext solid '\
                 '"default" size %s font %u' \
-                %(self.plotsize,(int(round(self.fontsize*1.2)))))
-        self.setOutput(texfilename)
+                %(self.plotsize,(int(round(self.fontsize*1.2))))
 
-        # do the actual plotting
-        if self._plotcmd:
-            debug(self._plotcmd)
-            self.gplot(self._plotcmd)
-        else:
+        if not self._plotcmd:
             error("Nothing to plot, maybe not a xplot-color file?")
             quit(1)
 
+        # without the LaTeX toolchain
+        if UmGnuplot.preview:
+            self.savePreview(UmGnuplot.preview)
+            self.removeData()
+            return
+
+        # reuse a figure rendered before from the same commands and data.
+        # Existing pdf files are only touched with --force
+        key = None
+        cache = RenderCache.active
+        if cache and (self.force or not os.path.exists(pdffilename)):
+            key = cache.key(self.gplot.commands + [terminal, self._plotcmd],
+                    self._latex.getPreamble())
+            if not self.saveit and cache.load(key, self.outdir, pdffilename):
+                self.gplot = None
+                self.removeData()
+                return
+
+        # intermediate files, removed once the pdf is built
+        if self.saveit:
+            temporary = []
+        else:
+            temporary = [epsfilename, gplotfilename, texfilename,
+                    epspdffilename]
+            for data in self._data:
+                temporary.extend(data.files())
+
+        # within a render session gnuplot runs later from a script, together
+        # with all other figures
+        session = UmRenderSession.active
+        if session:
+            info("Gnuplot: Generating %s" %gplotfilename)
+            script = self.gplot.commands + [terminal,
+                    'set output "%s"' %texfilename, self._plotcmd]
+            self.gplot = None
+
+            fh = open(gplotfilename, "w")
+            fh.write("\n".join(script) + "\n")
+            fh.close()
+
+            session.addFigure(self._latex, _Figure(plotname, self.outdir,
+                    self.debug, self.force, temporary, key))
+
+            # should we save generated main latex file for further purpose?
+            if self.saveit:
+               info("Save main LaTeX file...")
+               self._latex.addLatexFigure(texfilename, plotname)
+               self._latex.save()
+            return
+
+        info("Gnuplot: Generating %s" %texfilename)
+        self.gplot(terminal)
+        self.setOutput(texfilename)
+
+        # do the actual plotting
+        debug(self._plotcmd)
+        self.gplot(self._plotcmd)
+
         info("Gnuplot: Generating %s" %gplotfilename)
         self.gplot.save(gplotfilename)
 
-        # make sure gplot output is flushed
+        # run the figure on a gnuplot worker, this flushes the output
+        _GnuplotPool.render(self.gplot.commands, self.debug)
         self.gplot = None
-        gc.collect()
 
         # convert the EPS file to a PDF file
         info("Run epstopdf on %s..." %plotname)
@@ -244,13 +583,213 @@ class UmGnuplot():
 
         # build pdf graphics
         info("Generate PDF files...")
-        self._latex.toPdf()
+        written = self._latex.toPdf()
+        if key and pdffilename in written:
+            cache.store(key, self.outdir, pdffilename)
+
+        for filename in temporary:
+            os.remove(filename)
+
+    def savePreview(self, format="png"):
+        """Renders the plot directly with the pngcairo or svg terminal of
+        gnuplot, without epslatex, epstopdf, pdflatex and pdfcrop. Line
+        styles, axes and labels are the same, but the LaTeX markup of labels
+        and titles is stripped. Like save(), this destroys the underlying
+        Gnuplot instance."""
+
+        previewfilename = os.path.join(self.outdir,
+                "%s.%s" %(self._plotname, format))
+        commands = self.gplot.commands
+
+        # the recorded commands are replayed by a gnuplot worker, so the
+        # plain text settings keep their order
+        self.gplot = None
 
-        if not self.saveit:
-            os.remove(epsfilename)
-            os.remove(gplotfilename)
-            os.remove(texfilename)
-            os.remove(epspdffilename)
+        if not self.force and os.path.exists(previewfilename):
+            error("%s already exists. Skipped." %previewfilename)
+            return
+
+        (width, height) = toPixels(self.plotsize, PREVIEW_DPI)
+        if format == "svg":
+            terminal = "svg"
+        else:
+            terminal = "pngcairo"
+
+        script = [_plainText(command) for command in commands]
+        script.append('set terminal %s size %u,%u font "sans,%u"' %(terminal,
+                width, height, int(round(self.fontsize*1.2))))
+        script.append('set output "%s"' %previewfilename)
+        script.append(_plainText(self._plotcmd))
+
+        info("Gnuplot: Generating %s" %previewfilename)
+        _GnuplotPool.render(script, self.debug)
+
+class _Figure:
+    """A figure of a render session, its gnuplot script is already written"""
+
+    def __init__(self, plotname, outdir, debug, force, temporary, key):
+        self.plotname = plotname
+        self.outdir = outdir
+        self.debug = debug
+        self.force = force
+        self.temporary = temporary
+        self.key = key
+
+        self.gplotfilename = os.path.join(outdir, plotname+".gplot")
+        self.texfilename = os.path.join(outdir, plotname+"_eps.tex")
+        self.epsfilename = os.path.join(outdir, plotname+"_eps.eps")
+        self.epspdffilename = os.path.join(outdir, plotname+"_eps.pdf")
+        self.pdffilename = os.path.join(outdir, plotname+".pdf")
+
+def _renderFigures(job):
+    """Renders a chunk of figures of a render session, possibly in a pool
+    worker. Runs gnuplot and epstopdf for every figure and builds the pdf
+    files of all figures that succeeded with one pdflatex run. Returns a list
+    of (figure, error message, written), the message is None on success and
+    written is False if the pdf already existed and was kept"""
+
+    (document, figures) = job
+    results = list()
+    rendered = list()
+
+    for figure in figures:
+        try:
+            _GnuplotPool.render(['load "%s"' %figure.gplotfilename],
+                    figure.debug)
+            if figure.debug:
+                cmd = "epstopdf --debug --outfile=%s %s" \
+                        %(figure.epspdffilename, figure.epsfilename)
+            else:
+                cmd = "epstopdf --outfile=%s %s" \
+                        %(figure.epspdffilename, figure.epsfilename)
+            call(cmd, noOutput = not figure.debug)
+        except CommandFailed, inst:
+            results.append((figure, str(inst), False))
+            continue
+
+        document.addLatexFigure(figure.texfilename, figure.plotname,
+                outdir=figure.outdir, force=figure.force)
+        rendered.append(figure)
+
+    if not rendered:
+        return results
+
+    # every chunk has a temp directory of its own
+    tempdir = tempfile.mkdtemp()
+    try:
+        try:
+            written = document.toPdf(tempdir=tempdir)
+        except (CommandFailed, SystemExit):
+            return results + [(figure, "pdflatex or pdfcrop failed", False)
+                    for figure in rendered]
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+    return results + [(figure, None, figure.pdffilename in written)
+            for figure in rendered]
+
+class UmRenderSession():
+    """Collects the figures of many UmGnuplot objects and renders them at
+    once. While a session is active, UmGnuplot.save() only writes the gnuplot
+    script of a figure. render() runs gnuplot and epstopdf for all figures
+    and builds the pdf files with one pdflatex and one pdfcrop run per
+    chunk of figures. Figures are grouped by their LaTeX preamble, so plots
+    with different font sizes end up in different documents. With more than
+    one job, the figures are split into one chunk per job and rendered by a
+    pool of processes."""
+
+    # the session UmGnuplot.save() adds its figures to
+    active = None
+
+    def __init__(self, jobs=1):
+        self.jobs = max(jobs, 1)
+
+        # one document and its figures per preamble, in the order of their
+        # first figure
+        self._documents = dict()
+        self._figures = dict()
+        self._preambles = list()
+
+    def start(self):
+        """Make this the active session and return it"""
+
+        UmRenderSession.active = self
+        return self
+
+    def addFigure(self, latex, figure):
+        """Add the figure of a UmGnuplot object. The given UmLatex object
+        provides the preamble, it must not contain any figure yet"""
+
+        preamble = latex.getPreamble()
+        if preamble not in self._documents:
+            self._documents[preamble] = copy.deepcopy(latex)
+            self._figures[preamble] = list()
+            self._preambles.append(preamble)
+        self._figures[preamble].append(figure)
+
+    def render(self):
+        """Render all collected figures and end the session"""
+
+        if UmRenderSession.active is self:
+            UmRenderSession.active = None
+
+        # split the figures of every preamble into one chunk per job
+        chunks = list()
+        for preamble in self._preambles:
+            figures = self._figures[preamble]
+            size = int(math.ceil(len(figures) / float(self.jobs)))
+            for i in range(0, len(figures), size):
+                chunks.append((copy.deepcopy(self._documents[preamble]),
+                        figures[i:i + size]))
+
+        total = sum([len(figures) for figures in self._figures.values()])
+        if self.jobs > 1 and len(chunks) > 1:
+            info("Render %u figures with %u processes..."
+                    %(total, min(self.jobs, len(chunks))))
+            pool = multiprocessing.Pool(min(self.jobs, len(chunks)))
+            results = pool.imap_unordered(_renderFigures, chunks)
+        else:
+            if total:
+                info("Render %u figures..." %total)
+            pool = None
+            results = itertools.imap(_renderFigures, chunks)
+
+        done = 0
+        failed = 0
+        for chunk in results:
+            for (figure, message, written) in chunk:
+                done += 1
+                if message:
+                    failed += 1
+                    error("[%u/%u] %s failed: %s"
+                            %(done, total, figure.pdffilename, message))
+                    continue
+
+                if not written:
+                    info("[%u/%u] %s already exists, skipped"
+                            %(done, total, figure.pdffilename))
+                    for filename in figure.temporary:
+                        os.remove(filename)
+                    continue
+
+                info("[%u/%u] %s done" %(done, total, figure.pdffilename))
+                if figure.key:
+                    RenderCache.active.store(figure.key, figure.outdir,
+                            figure.pdffilename)
+                for filename in figure.temporary:
+                    os.remove(filename)
+
+        if pool:
+            pool.close()
+            pool.join()
+
+        if failed:
+            error("%u of %u figures failed, their intermediate files are "\
+                    "kept" %(failed, total))
+
+        self._documents = dict()
+        self._figures = dict()
+        self._preambles = list()
 
 class UmHistogram(UmGnuplot):
     """Represents a Histogram plot"""
@@ -306,8 +845,7 @@ class UmHistogram(UmGnuplot):
         titlestr= "notitle"
         if title: titlestr = 'title "%s" ' %title
 
-        usingstr = ""
-        if using: usingstr = "using %s " %using
+        usingstr = self.usingSpec(values, using)
 
         linestr = ""
         if linestyle: linestr = "linestyle %s " %linestyle
@@ -334,8 +872,8 @@ class UmHistogram(UmGnuplot):
         if  axes:
             axesstr = "axes %s " %axes
 
-        cmd = '"%s" %s %s %s %s %s %s' %(values, usingstr, axesstr, titlestr,
-                linestr, fillstr, gradientstr)
+        cmd = '%s %s %s %s %s %s %s' %(self.source(values), usingstr, axesstr,
+                titlestr, linestr, fillstr, gradientstr)
         UmGnuplot.plot(self, cmd)
 
     def plotErrorbar(self, values, barNo, valColumn, yDelta, title=None,
@@ -365,8 +903,8 @@ class UmHistogram(UmGnuplot):
             usingstr = "($0+%f):%s:%s:%s" %(off, valColumn, yDelta, yHigh)
         else:
             usingstr = "($0+%f):%s:%s" %(off, valColumn, yDelta)
-        cmd = '"%s" using %s %s with errorbars %s' \
-                %(values, usingstr, titlestr, linestr)
+        cmd = '%s using %s %s with errorbars %s' \
+                %(self.source(values), usingstr, titlestr, linestr)
 
         UmGnuplot.plot(self, cmd)
 
@@ -380,11 +918,9 @@ class UmPointPlot(UmGnuplot):
         UmGnuplot.__init__(self, *args, **kwargs)
 
     def plot(self, values, title, using=None, linestyle=3):
-        usingstr = ""
-        if using:
-            usingstr = "using %s" %using
-        cmd = '"%s" %s title "%s" with points ls %u' \
-                %(values, usingstr, title, linestyle)
+        cmd = '%s %s title "%s" with points ls %u' \
+                %(self.source(values), self.usingSpec(values, using), title,
+                    linestyle)
         UmGnuplot.plot(self, cmd)
 
 class UmLinePlot(UmGnuplot):
@@ -394,11 +930,18 @@ class UmLinePlot(UmGnuplot):
         UmGnuplot.__init__(self, *args, **kwargs)
 
     def plot(self, values, title, using=None, linestyle=3):
-        usingstr = ""
-        if using:
-            usingstr = "using %s" %using
-        cmd = '"%s" %s title "%s" with lines ls %u' \
-                %(values, usingstr, title, linestyle)
+        cmd = '%s %s title "%s" with lines ls %u' \
+                %(self.source(values), self.usingSpec(values, using), title,
+                    linestyle)
+        UmGnuplot.plot(self, cmd)
+
+    def plotBand(self, values, title, using=None, linestyle=3):
+        """Plots the area between two columns, e.g. the band around a mean.
+        Should be plotted before the line it belongs to"""
+
+        cmd = '%s %s title "%s" with filledcurves ls %u fs solid 0.25' \
+                %(self.source(values), self.usingSpec(values, using), title,
+                    linestyle)
         UmGnuplot.plot(self, cmd)
 
 class UmLinePointPlot(UmGnuplot):
@@ -408,19 +951,15 @@ class UmLinePointPlot(UmGnuplot):
         UmGnuplot.__init__(self, *args, **kwargs)
 
     def plotYerror(self, values, title, using=None, linestyle=3):
-        usingstr = ""
-        if using:
-            usingstr = "using %s" %using
-        cmd = '"%s" %s title "%s" with yerrorbars ls %u' \
-                %(values, usingstr, title, linestyle)
+        cmd = '%s %s title "%s" with yerrorbars ls %u' \
+                %(self.source(values), self.usingSpec(values, using), title,
+                    linestyle)
         UmGnuplot.plot(self, cmd)
 
     def plot(self, values, title, using=None, linestyle=3):
-        usingstr = ""
-        if using:
-            usingstr = "using %s" %using
-        cmd = '"%s" %s title "%s" with linespoints ls %u' \
-                %(values, usingstr, title, linestyle)
+        cmd = '%s %s title "%s" with linespoints ls %u' \
+                %(self.source(values), self.usingSpec(values, using), title,
+                    linestyle)
         UmGnuplot.plot(self, cmd)
 
 class UmStepPlot(UmGnuplot):
@@ -430,11 +969,9 @@ class UmStepPlot(UmGnuplot):
         UmGnuplot.__init__(self, *args, **kwargs)
 
     def plot(self, values, title, using=None, linestyle=3):
-        usingstr = ""
-        if using:
-            usingstr = "using %s" %using
-        cmd = '"%s" %s title "%s" with steps ls %u' \
-                %(values, usingstr, title, linestyle)
+        cmd = '%s %s title "%s" with steps ls %u' \
+                %(self.source(values), self.usingSpec(values, using), title,
+                    linestyle)
         UmGnuplot.plot(self, cmd)
 
 class UmBoxPlot(UmGnuplot):
@@ -444,11 +981,9 @@ class UmBoxPlot(UmGnuplot):
         UmGnuplot.__init__(self, *args, **kwargs)
 
     def plot(self, values, title, using=None, linestyle=3):
-        usingstr = ""
-        if using:
-            usingstr = "using %s" %using
-        cmd = '"%s" %s title "%s" with boxes ls %u' \
-                %(values, usingstr, title, linestyle)
+        cmd = '%s %s title "%s" with boxes ls %u' \
+                %(self.source(values), self.usingSpec(values, using), title,
+                    linestyle)
         UmGnuplot.plot(self, cmd)
 
     def rawPlot(self, *args, **kwargs):
@@ -652,12 +1187,14 @@ class UmXPlot(UmGnuplot):
             title = "notitle"
 
         # concat plotcmd, for line data use 4 parameter style, else 2 parameter
+        datafilename = "%s/%s.dataset.%s.%s" %(outdir, basename, color,
+                datatype)
         if datatype == 'line':
-            cmd = '"%s/%s.dataset.%s.%s" using 1:2:($3-$1):($4-$2) with %s %s' \
-                    %(outdir, basename, color, datatype, style, title)
+            cmd = '%s using 1:2:($3-$1):($4-$2) with %s %s' \
+                    %(binarySpec(datafilename, 4), style, title)
         else:
-            cmd = '"%s/%s.dataset.%s.%s" using 1:2 with %s %s' \
-                    %(outdir, basename, color, datatype, style, title)
+            cmd = '%s using 1:2 with %s %s' \
+                    %(binarySpec(datafilename, 2), style, title)
 
         if (plot == True):
             UmGnuplot.plot(self, cmd)
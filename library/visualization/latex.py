@@ -138,14 +138,21 @@ class UmLatex():
                     "positioning,fit}")
 
     def __buildDocument(self):
-        packages = "\n".join(self.__packages)
-        settings = "\n".join(self.__settings)
         content  = "\n".join(self.__content)
-        document = "%s\n%s\n%s\n\\begin{document}\n%s\n\\end{document}"\
-            %(self.__documentclass , packages, settings, content)
+        document = "%s\n\\begin{document}\n%s\n\\end{document}"\
+            %(self.getPreamble(), content)
 
         return document
 
+    def getPreamble(self):
+        """Return everything before "\begin{document}", i.e. documentclass,
+        packages and settings. Documents with the same preamble can be merged
+        into one"""
+
+        packages = "\n".join(self.__packages)
+        settings = "\n".join(self.__settings)
+        return "%s\n%s\n%s" %(self.__documentclass , packages, settings)
+
     def __getValidTexfile(self, texfile):
         """If the parameter "texfile" is "None" return the privat member
         variable "self.__texfile" otherwise return the parameter itself """
@@ -208,16 +215,21 @@ class UmLatex():
 
         self.__content.append(content)
 
-    def addLatexFigure(self, latexfig, figname, command=None):
+    def addLatexFigure(self, latexfig, figname, command=None, outdir=None,
+            force=None):
         """Add a latex figure to the document. The figure given by the
         parameter "latexfig" is included by the latex command "\input{}". All
         necessary commands like "\begin{figure}" or "\end{figure}" are
         automatically added. The last added command is "\clearpage", so that
         all figures are on a new page. If the optional parameter "command" is
-        given, it will be added before the figure is included """
+        given, it will be added before the figure is included. If "outdir" is
+        given, the pdf of this figure is written there instead of the output
+        directory of the document. If "force" is given, it decides whether an
+        existing pdf of this figure is overwritten instead of the force mode
+        of the document """
 
         # save the name of the figure for further uses
-        self.__figures.append(figname)
+        self.__figures.append((figname, outdir, force))
 
         self.addContent("\\begin{figure}\n\\centering")
         # if an additional command is given, we added it
@@ -248,9 +260,10 @@ class UmLatex():
 
     def toPdf(self, texfile=None, outdir=None, tempdir=None):
         """Generate the actual pdf figures. First, the document is build. Then
-        pdflatex will run on the document. Afterwards, the new generated pdf
-        will be splitted into single pages, each graphic on a new page.
-        Finally, each page will be cropped by pdfcrop """
+        pdflatex will run on the document. Afterwards, all pages of the new
+        generated pdf will be cropped by a single pdfcrop run. Finally, the
+        cropped pdf will be splitted into single pages, each graphic on a new
+        page. Returns the pdf files that were written """
 
         # building document and output path
         document = self.__buildDocument()
@@ -271,37 +284,45 @@ class UmLatex():
                     "pdflatex'es output "%(os.path.basename(sys.argv[0])))
             sys.exit(1)
 
-        # open new generated pdf file
+        # crop all pages at once
         combinedPDF = os.path.join(tempdir, "%s.pdf" %texfile)
-        pdfIn = PdfFileReader(open(combinedPDF, "r"))
+        cropPDF = os.path.join(tempdir, "%s.crop.pdf" %texfile)
+        info("Run pdfcrop on %s..." %texfile)
+        cmd = "pdfcrop %s %s" %(combinedPDF, cropPDF)
+        if self.__debug:
+            call(cmd)
+        else:
+            call(cmd, noOutput = True)
+
+        # open cropped pdf file
+        pdfIn = PdfFileReader(open(cropPDF, "rb"))
 
-        # iterate over the number of figures to spit and crop the pdf
-        for page, figure in enumerate(self.__figures):
+        # iterate over the number of figures to split the pdf
+        written = list()
+        for page, (figure, figdir, force) in enumerate(self.__figures):
             # output path
-            splitPDF = os.path.join(tempdir, "%s.a4.pdf" %figure)
-            cropPDF = os.path.join(tempdir, "%s.crop.pdf" %figure)
+            pdfDst = os.path.join(figdir or destdir, "%s.pdf" %figure)
+            if force is None:
+                force = self.__force
+            if not force and os.path.exists(pdfDst):
+                error("%s already exists. Skipped." %pdfDst)
+                continue
 
-            # spit pdf into multiple pdf files
-            info("Write PDF file %s..." %figure)
+            # write the page to its own pdf file
+            info("Write PDF file %s..." %pdfDst)
             pdfOut = PdfFileWriter()
             pdfOut.addPage(pdfIn.getPage(page))
 
-            filestream = open(splitPDF, "w")
+            # write to a temporary file first, so that the pdf file appears
+            # atomically, even if several processes render into the same
+            # directory
+            (fd, pdfTmp) = tempfile.mkstemp(dir=os.path.dirname(pdfDst) or ".",
+                    suffix=".tmp")
+            filestream = os.fdopen(fd, "wb")
             pdfOut.write(filestream)
             filestream.close()
+            os.chmod(pdfTmp, 0644)
+            os.rename(pdfTmp, pdfDst)
+            written.append(pdfDst)
 
-            # crop pdf
-            info("Run pdfcrop on %s..." %figure)
-            cmd = "pdfcrop %s %s" %(splitPDF, cropPDF)
-            if self.__debug:
-                call(cmd)
-            else:
-                call(cmd, noOutput = True)
-
-            # copy cropped pdfs to final destination
-            pdfDst = os.path.join(destdir, "%s.pdf" %figure)
-            if not self.__force and os.path.exists(pdfDst):
-                error("%s already exists. Skipped." %pdfDst)
-            else:
-                shutil.copy(cropPDF, pdfDst)
-
+        return written
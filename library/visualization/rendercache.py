@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import os
+import os.path
+import re
+import shutil
+import hashlib
+import tempfile
+import subprocess
+from logging import info, debug, warn, error
+
+# bump this whenever the rendering chain changes its output without changing
+# the gnuplot commands or the LaTeX preamble
+RENDER_VERSION = 1
+
+# tools of the rendering chain, their versions are part of every key
+TOOLS = ("gnuplot", "epstopdf", "pdflatex", "pdfcrop")
+
+# quoted strings in gnuplot commands, possibly names of data files
+_quoted = re.compile(r'"([^"]+)"')
+
+# versions of the tools, only determined once
+_versions = None
+
+def toolVersions():
+    """Returns the first line of "<tool> --version" for all tools of the
+       rendering chain
+    """
+
+    global _versions
+    if _versions is None:
+        _versions = list()
+        for tool in TOOLS:
+            try:
+                prog = subprocess.Popen([tool, "--version"],
+                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                output = prog.communicate()[0]
+                _versions.append(output.strip().split("\n")[0])
+            except OSError:
+                _versions.append("%s missing" %tool)
+    return _versions
+
+class RenderCache:
+    """Content-addressed cache for the pdf figures of UmGnuplot. The key of a
+       figure is a hash over its gnuplot commands, the content of all data
+       files the commands refer to, the LaTeX preamble and the versions of
+       the tools. If a figure with the same key was rendered before, the
+       cached pdf is copied instead of running gnuplot, epstopdf, pdflatex
+       and pdfcrop again.
+
+       The cache holds at most "maxsize" bytes. If it grows larger, the least
+       recently used figures are evicted. If no cache directory is given,
+       the figures are stored in the directory ".rendercache" next to the
+       plots.
+    """
+
+    # the cache UmGnuplot.save() uses, set by the applications
+    active = None
+
+    def __init__(self, cachedir=None, maxsize=256 * 1024 * 1024):
+        self.cachedir = cachedir
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, commands, preamble):
+        """Returns the key of a figure, given by its gnuplot commands and its
+           LaTeX preamble
+        """
+
+        digest = hashlib.sha1()
+        digest.update("%s\n" %RENDER_VERSION)
+        for version in toolVersions():
+            digest.update("%s\n" %version)
+        digest.update(preamble)
+
+        for command in commands:
+            digest.update("%s\n" %command)
+            # data files are hashed by content, not by name
+            for filename in _quoted.findall(command):
+                if os.path.isfile(filename):
+                    self.hashFile(digest, filename)
+        return digest.hexdigest()
+
+    def hashFile(self, digest, filename):
+        """Adds the content of the file to the given digest"""
+
+        fh = open(filename, "rb")
+        try:
+            while True:
+                chunk = fh.read(1024 * 1024)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        finally:
+            fh.close()
+
+    def directory(self, outdir):
+        """Returns the cache directory for plots in the given output
+           directory
+        """
+
+        if self.cachedir:
+            return self.cachedir
+        else:
+            return os.path.join(outdir, ".rendercache")
+
+    def load(self, key, outdir, pdfDst):
+        """Copies the cached pdf with the given key to "pdfDst". Returns False
+           if there is no such pdf.
+        """
+
+        path = os.path.join(self.directory(outdir), "%s.pdf" %key)
+        try:
+            shutil.copyfile(path, pdfDst)
+            # mark the entry as recently used
+            os.utime(path, None)
+        except (IOError, OSError):
+            self.misses += 1
+            return False
+
+        info("Copied cached figure %s..." %pdfDst)
+        self.hits += 1
+        return True
+
+    def store(self, key, outdir, pdfSrc):
+        """Adds the pdf "pdfSrc" with the given key to the cache. The entry is
+           written to a temporary file first and renamed afterwards, so an
+           interrupted run never leaves a half written entry behind.
+        """
+
+        directory = self.directory(outdir)
+        path = os.path.join(directory, "%s.pdf" %key)
+        try:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            (fd, tmppath) = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            os.close(fd)
+        except (IOError, OSError), inst:
+            debug("Failed to write cache entry %s: %s" %(path, inst))
+            return
+
+        try:
+            shutil.copyfile(pdfSrc, tmppath)
+            os.rename(tmppath, path)
+        except (IOError, OSError), inst:
+            debug("Failed to write cache entry %s: %s" %(path, inst))
+            os.remove(tmppath)
+            return
+
+        self.evict(directory)
+
+    def evict(self, directory):
+        """Removes the least recently used figures until the cache is not
+           larger than "maxsize"
+        """
+
+        entries = list()
+        for name in os.listdir(directory):
+            if not name.endswith(".pdf"):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        size = sum([entry[1] for entry in entries])
+        entries.sort()
+        for (mtime, entrysize, path) in entries:
+            if size <= self.maxsize:
+                break
+            debug("Evicting cache entry %s" %path)
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entrysize
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+import os
+import os.path
+import re
+import bisect
+import tempfile
+import cPickle
+from logging import info, debug, warn, error
+
+# bump this whenever the layout of the index changes
+INDEX_VERSION = 1
+
+# number of elements between two checkpoints of the index
+INDEX_STEP = 1024
+
+# lines without coordinates (colors, labels), they belong to the next element
+_plain = re.compile('^(\D+|\d+)$')
+
+# elements, the first x coordinate and the second one of lines
+_element = re.compile('\w+ ([\d.]+) \d+(?: ([\d.]+))?')
+
+def isHeaderEnd(line):
+    """Returns True if the line is the last one of the xpl header"""
+
+    return line == 'sequence offset' or line == 'sequence number'
+
+class XplCut:
+    """One time window [begin, end] cut out of a xpl file. The lines after the
+       header are fed one by one. An element is written together with the
+       preceding lines without coordinates if its time is in the window.
+    """
+
+    def __init__(self, begin, end, outfile):
+        self.begin = begin
+        self.end = end
+        self.outfile = outfile
+        self.fh = open(outfile, 'w')
+        self.state = 1
+        self.buf = ''
+
+    def feed(self, line):
+        """Processes one line (without newline) of the xpl file"""
+
+        self.buf += line + "\n"
+        if _plain.match(line):
+            return
+        m = _element.match(line)
+        if not m:
+            warn('Something wrong in state %u: %s' %(self.state, line))
+            return
+
+        # until the first element in the window is found, lines are
+        # compared by their end
+        if self.state == 1:
+            d = float(m.group(2) if m.group(2) else m.group(1))
+            if d < self.begin:
+                self.buf = ''
+            elif d <= self.end:
+                self.fh.write(self.buf)
+                self.buf = ''
+                self.state = 2
+        else:
+            d = float(m.group(1))
+            if self.begin <= d and d <= self.end:
+                self.fh.write(self.buf)
+                self.buf = ''
+
+    def close(self):
+        self.fh.close()
+
+class XplIndex:
+    """Time index of a xpl file. Every INDEX_STEP elements a checkpoint holds
+       the byte offset of the element block (the element and the preceding
+       lines without coordinates), the largest time of all elements before
+       and the smallest time of all elements from there on. As xpl files are
+       only roughly sorted by time, both bounds are needed to seek straight
+       to the first element of a window and to stop after its last one.
+
+       The index is built on demand with one pass over the file and stored
+       next to it as "<xpl>.idx". It is only used while size and mtime of
+       the xpl file still match.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        # offset of the first line after the header
+        self.header = 0
+        # the checkpoints
+        self.offsets = list()
+        self.before = list()
+        self.after = list()
+
+        if not self.load():
+            self.build()
+            self.store()
+
+    def identity(self):
+        """Returns the key of the xpl file"""
+
+        stat = os.stat(self.filename)
+        return (INDEX_VERSION, INDEX_STEP, stat.st_size, stat.st_mtime)
+
+    def path(self):
+        """Returns the path of the index file"""
+
+        return "%s.idx" %self.filename
+
+    def load(self):
+        """Reads the index from disk. Returns False if there is no valid
+           index.
+        """
+
+        path = self.path()
+        try:
+            fh = open(path, "rb")
+            try:
+                entry = cPickle.load(fh)
+            finally:
+                fh.close()
+        except (IOError, OSError):
+            return False
+        except Exception, inst:
+            warn("Ignoring broken index %s: %s" %(path, inst))
+            return False
+
+        if entry["identity"] != self.identity():
+            debug("Index %s is outdated" %path)
+            return False
+
+        (self.header, self.offsets, self.before, self.after) = entry["index"]
+        return True
+
+    def store(self):
+        """Writes the index to disk. The index is written to a temporary file
+           first and renamed afterwards, so an interrupted run never leaves a
+           half written index behind.
+        """
+
+        path = self.path()
+        entry = dict(identity=self.identity(), index=(self.header,
+                self.offsets, self.before, self.after))
+        try:
+            (fd, tmppath) = tempfile.mkstemp(dir=os.path.dirname(path) or ".",
+                    suffix=".tmp")
+        except (IOError, OSError), inst:
+            debug("Failed to write index %s: %s" %(path, inst))
+            return
+
+        try:
+            fh = os.fdopen(fd, "wb")
+            try:
+                cPickle.dump(entry, fh, cPickle.HIGHEST_PROTOCOL)
+            finally:
+                fh.close()
+            os.rename(tmppath, path)
+        except (IOError, OSError), inst:
+            debug("Failed to write index %s: %s" %(path, inst))
+            os.remove(tmppath)
+
+    def build(self):
+        """Builds the index with one pass over the xpl file"""
+
+        info("Indexing %s..." %self.filename)
+        offset = 0
+        block = None
+        count = 0
+        latest = float("-inf")
+        minima = list()
+
+        fh = open(self.filename, 'r')
+        try:
+            lines = iter(fh)
+            # header
+            for line in lines:
+                offset += len(line)
+                if isHeaderEnd(line.rstrip("\n")):
+                    break
+            self.header = block = offset
+
+            # element blocks
+            for line in lines:
+                length = len(line)
+                line = line.rstrip("\n")
+                if _plain.match(line):
+                    offset += length
+                    continue
+                m = _element.match(line)
+                if not m:
+                    offset += length
+                    continue
+
+                first = float(m.group(1))
+                last = float(m.group(2)) if m.group(2) else first
+                if count % INDEX_STEP == 0:
+                    self.offsets.append(block)
+                    self.before.append(latest)
+                    minima.append(min(first, last))
+                else:
+                    minima[-1] = min(minima[-1], first, last)
+                latest = max(latest, last)
+                count += 1
+                offset += length
+                block = offset
+        finally:
+            fh.close()
+
+        # smallest time of all elements from a checkpoint on
+        smallest = float("inf")
+        self.after = [0] * len(minima)
+        for i in range(len(minima) - 1, -1, -1):
+            smallest = min(smallest, minima[i])
+            self.after[i] = smallest
+
+        debug("Indexed %u elements of %s in %u checkpoints"
+                %(count, self.filename, len(self.offsets)))
+
+    def start(self, begin):
+        """Returns the offset from which on a cut of the window beginning at
+           "begin" has to read the file. All elements before end before
+           "begin".
+        """
+
+        i = bisect.bisect_left(self.before, begin) - 1
+        if i < 0:
+            return self.header
+        return self.offsets[i]
+
+    def stop(self, end):
+        """Returns the offset up to which a cut of the window ending at "end"
+           has to read the file, or None for the end of the file. All elements
+           from there on start after "end".
+        """
+
+        i = bisect.bisect_right(self.after, end)
+        if i == len(self.offsets):
+            return None
+        return self.offsets[i]
+
+    def cut(self, windows):
+        """Cuts all windows, given as a list of (begin, end, outfile), with
+           one pass over the part of the file they cover
+        """
+
+        fh = open(self.filename, 'r')
+        try:
+            header = fh.read(self.header)
+
+            # the windows, sorted by the offset they start at
+            pending = list()
+            for (begin, end, outfile) in windows:
+                cut = XplCut(begin, end, outfile)
+                cut.fh.write(header)
+                pending.append((self.start(begin), self.stop(end), cut))
+            pending.sort(key=lambda entry: entry[0])
+            if not pending:
+                return
+
+            active = list()
+            offset = pending[0][0]
+            fh.seek(offset)
+            for line in fh:
+                # windows starting here
+                while pending and pending[0][0] <= offset:
+                    active.append(pending.pop(0)[1:])
+                # windows done
+                for entry in [entry for entry in active
+                        if entry[0] is not None and entry[0] <= offset]:
+                    active.remove(entry)
+                    entry[1].close()
+                if not active and not pending:
+                    break
+
+                offset += len(line)
+                line = line.rstrip("\n")
+                for (stop, cut) in active:
+                    cut.feed(line)
+
+            for (start, stop, cut) in pending:
+                cut.close()
+            for (stop, cut) in active:
+                cut.close()
+        finally:
+            fh.close()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vi:et:sw=4 ts=4
+
+# Copyright (C) 2013 Alexander Zimmermann <alexander.zimmermann@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for
+# more details.
+
+# python imports
+from logging import info, debug, warn, error
+
+# colors and the named colors of tcptrace
+COLORS = frozenset(("green", "yellow", "white", "orange", "blue", "magenta",
+        "red", "purple", "pink", "window", "ack", "sack", "data", "retransmit",
+        "duplicate", "reorder", "text", "default", "sinfin", "push", "ecn",
+        "urgent", "probe", "a2bseg", "b2aseg", "nosampleack", "ambigousack",
+        "icmp"))
+
+# elements with one point and an optional color, and their tag
+POINTS = {"darrow": "darrow", "uarrow": "uarrow", "larrow": "harrow",
+          "rarrow": "harrow", "dot": "dot", "diamond": "diamond",
+          "box": "box", "dtick": "tick", "utick": "tick", "ltick": "tick",
+          "rtick": "tick", "vtick": "tick", "htick": "tick"}
+
+# elements with two points
+LINES = frozenset(("line", "dline"))
+
+# text elements, the label follows on the next line
+TEXTS = frozenset(("atext", "btext", "ltext", "rtext"))
+
+# header lines, the value follows on the next line
+HEADERS = frozenset(("title", "xlabel", "ylabel"))
+
+class XplReader:
+    """Streams the elements of a xplot (xpl) file as written by tcptrace,
+    line by line. Only the current element is kept in memory, so arbitrary
+    large time-sequence graphs can be read.
+
+    Iterating yields one tuple per element, all values are strings as they
+    appear in the file:
+    ("timeval", type)
+    ("title" / "xlabel" / "ylabel", text)
+    ("color", color)
+    ("darrow" / "uarrow" / "harrow" / "dot" / "diamond" / "box" / "tick",
+     x, y, color)
+    ("line", x1, y1, x2, y2)
+    ("text", x, y, color, position, label)
+    ("end",)
+    color is None if the element has no color of its own, position is the
+    first letter of the text element (a, b, l or r).
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __iter__(self):
+        fh = open(self.filename)
+        try:
+            lines = iter(fh)
+            for line in lines:
+                parts = line.split()
+                if not parts:
+                    continue
+                cmd = parts[0]
+
+                if cmd in POINTS and len(parts) >= 3:
+                    color = None
+                    if len(parts) > 3 and parts[-1] in COLORS:
+                        color = parts[-1]
+                    yield (POINTS[cmd], parts[1], parts[2], color)
+                elif cmd in LINES and len(parts) == 5:
+                    yield ("line", parts[1], parts[2], parts[3], parts[4])
+                elif cmd in COLORS and len(parts) == 1:
+                    yield ("color", cmd)
+                elif cmd in TEXTS and len(parts) >= 3:
+                    color = None
+                    if len(parts) > 3 and parts[-1] in COLORS:
+                        color = parts[-1]
+                    label = next(lines, "").strip()
+                    yield ("text", parts[1], parts[2], color, cmd[0], label)
+                elif cmd in HEADERS and len(parts) == 1:
+                    yield (cmd, next(lines, "").strip())
+                elif cmd in ("timeval", "dtime"):
+                    yield ("timeval", " ".join(parts[1:]))
+                elif cmd == "go":
+                    yield ("end",)
+                else:
+                    debug("%s: ignoring '%s'" %(self.filename, line.strip()))
+        finally:
+            fh.close()
@@ -22,8 +22,16 @@ import sys
 
 # umic-mesh imports
 from measurement import measurement, tests
+from measurement.sweep import SweepPlan
 from common.functions import call
 
+# parameters of run_netem() that are testbed settings
+NETEM_SETTINGS = ("reorder", "rdelay", "delay", "limit", "bottleneckbw")
+
+# the settings of every remote command of run_netem()
+NETEM_COMMANDS = (("delay",), ("reorder", "rdelay"), ("limit",),
+                  ("bottleneckbw",), ("reorder", "rdelay"), ("delay",))
+
 class DumbbellEvaluationMeasurement(measurement.Measurement):
     """This Measurement will run tests of several scenarios:
        - Each scenario is defined by it's flowgrind options.
@@ -48,7 +56,7 @@ class DumbbellEvaluationMeasurement(measurement.Measurement):
                                  help = 'Set file to load node pairs from [default: %(default)s]')
 
     @defer.inlineCallbacks
-    def run_netem(self, reorder, rdelay, delay, limit, mode):
+    def run_netem(self, reorder, rdelay, delay, limit, bottleneckbw, mode):
         fdnode="vmrouter210"    # forward path delay
         frnode="vmrouter211"    # forward path reordering
         qlnode="vmrouter212"    # queue limit
@@ -57,39 +65,55 @@ class DumbbellEvaluationMeasurement(measurement.Measurement):
 
         info("Setting netem..")
 
+        # only send the settings that changed since the last call, "add"
+        # sets up everything
+        force = (mode == "add")
+
         #forward path delay
-        tc_cmd = "sudo tc qdisc %s dev eth0 parent 1:2 handle 20: netem delay %ums %ums 20%%" %(mode, delay, (int)(delay * 0.1))
-        rc = yield self.remote_execute(fdnode, tc_cmd, log_file=sys.stdout)
+        if self.tc_changed(fdnode, "netem 1:2", (delay,), force):
+            tc_cmd = "sudo tc qdisc %s dev eth0 parent 1:2 handle 20: netem delay %ums %ums 20%%" %(mode, delay, (int)(delay * 0.1))
+            rc = yield self.remote_execute(fdnode, tc_cmd, log_file=sys.stdout)
+            self.tc_applied(fdnode, "netem 1:2", (delay,), rc)
 
         #forward path reordering
-        if reorder == 0:
-            tc_cmd = "sudo tc-enhanced-netem qdisc %s dev eth0 parent 1:2 handle 10: netem reorder 0%%" %(mode)
-        else:
-            tc_cmd = "sudo tc-enhanced-netem qdisc %s dev eth0 parent 1:2 handle 10: netem reorder %u%% \
-                      reorderdelay %ums %ums 20%%" %(mode, reorder, rdelay, (int)(rdelay * 0.1))
-        rc = yield self.remote_execute(frnode, tc_cmd, log_file=sys.stdout)
+        if self.tc_changed(frnode, "netem 1:2", (reorder, rdelay), force):
+            if reorder == 0:
+                tc_cmd = "sudo tc-enhanced-netem qdisc %s dev eth0 parent 1:2 handle 10: netem reorder 0%%" %(mode)
+            else:
+                tc_cmd = "sudo tc-enhanced-netem qdisc %s dev eth0 parent 1:2 handle 10: netem reorder %u%% \
+                          reorderdelay %ums %ums 20%%" %(mode, reorder, rdelay, (int)(rdelay * 0.1))
+            rc = yield self.remote_execute(frnode, tc_cmd, log_file=sys.stdout)
+            self.tc_applied(frnode, "netem 1:2", (reorder, rdelay), rc)
 
         #queue limit
-        tc_cmd = "sudo tc qdisc %s dev eth0 parent 1:1 handle 10: netem limit %u; \
-                  sudo tc qdisc %s dev eth0 parent 1:2 handle 20: netem limit %u" %(mode, limit, mode, limit)
-        rc = yield self.remote_execute(qlnode, tc_cmd, log_file=sys.stdout)
+        if self.tc_changed(qlnode, "netem", (limit,), force):
+            tc_cmd = "sudo tc qdisc %s dev eth0 parent 1:1 handle 10: netem limit %u; \
+                      sudo tc qdisc %s dev eth0 parent 1:2 handle 20: netem limit %u" %(mode, limit, mode, limit)
+            rc = yield self.remote_execute(qlnode, tc_cmd, log_file=sys.stdout)
+            self.tc_applied(qlnode, "netem", (limit,), rc)
 
         #bottleneck bandwidth
-        tc_cmd = "sudo tc class %s dev eth0 parent 1: classid 1:1 htb rate %umbit; \
-                  sudo tc class %s dev eth0 parent 1: classid 1:2 htb rate %umbit" %(mode, bottleneckbw, mode, bottleneckbw)
-        rc = yield self.remote_execute(qlnode, tc_cmd, log_file=sys.stdout)
+        if self.tc_changed(qlnode, "htb", (bottleneckbw,), force):
+            tc_cmd = "sudo tc class %s dev eth0 parent 1: classid 1:1 htb rate %umbit; \
+                      sudo tc class %s dev eth0 parent 1: classid 1:2 htb rate %umbit" %(mode, bottleneckbw, mode, bottleneckbw)
+            rc = yield self.remote_execute(qlnode, tc_cmd, log_file=sys.stdout)
+            self.tc_applied(qlnode, "htb", (bottleneckbw,), rc)
 
         #reverse path reordering
-        if reorder == 0:
-            tc_cmd = "sudo tc-enhanced-netem qdisc %s dev eth0 parent 1:1 handle 10: netem reorder 0%%" %(mode)
-        else:
-            tc_cmd = "sudo tc-enhanced-netem qdisc %s dev eth0 parent 1:1 handle 10: netem \
-                      reorder %u%% reorderdelay %ums %ums 20%%" %(mode, reorder, rdelay, (int)(rdelay * 0.1))
-        rc = yield self.remote_execute(rrnode, tc_cmd, log_file=sys.stdout)
+        if self.tc_changed(rrnode, "netem 1:1", (reorder, rdelay), force):
+            if reorder == 0:
+                tc_cmd = "sudo tc-enhanced-netem qdisc %s dev eth0 parent 1:1 handle 10: netem reorder 0%%" %(mode)
+            else:
+                tc_cmd = "sudo tc-enhanced-netem qdisc %s dev eth0 parent 1:1 handle 10: netem \
+                          reorder %u%% reorderdelay %ums %ums 20%%" %(mode, reorder, rdelay, (int)(rdelay * 0.1))
+            rc = yield self.remote_execute(rrnode, tc_cmd, log_file=sys.stdout)
+            self.tc_applied(rrnode, "netem 1:1", (reorder, rdelay), rc)
 
         #reverse path delay
-        tc_cmd = "sudo tc qdisc %s dev eth0 parent 1:1 handle 10: netem delay %ums %ums 20%%" %(mode, delay, (int)(delay * 0.1))
-        rc = yield self.remote_execute(rdnode, tc_cmd, log_file=sys.stdout)
+        if self.tc_changed(rdnode, "netem 1:1", (delay,), force):
+            tc_cmd = "sudo tc qdisc %s dev eth0 parent 1:1 handle 10: netem delay %ums %ums 20%%" %(mode, delay, (int)(delay * 0.1))
+            rc = yield self.remote_execute(rdnode, tc_cmd, log_file=sys.stdout)
+            self.tc_applied(rdnode, "netem 1:1", (delay,), rc)
 
     @defer.inlineCallbacks
     def run_measurement(self, reorder_mode, var, reorder, rdelay, delay, limit, bottleneckbw):
@@ -118,54 +142,27 @@ class DumbbellEvaluationMeasurement(measurement.Measurement):
 
         yield self.run_netem(reorder, rdelay, delay, limit, bottleneckbw, "change")
 
+        # header for analyze script
+        testbed = dict(qlimit = "%u" %limit, rdelay = "%u" %rdelay,
+                       rrate = "%u" %reorder, reordering = reorder_mode,
+                       variable = var, bottleneckbw = "%u" %bottleneckbw)
+
         for it in iterations:
-            for scenario_no in range(len(scenarios)):
-                tasks = list()
-                logs = list()
-                for run_no in range(len(runs)):
-                    kwargs = dict()
-
-                    kwargs.update(opts)
-                    kwargs.update(runs[run_no])
-
-                    kwargs['flowgrind_src'] = kwargs['src']
-                    kwargs['flowgrind_dst'] = kwargs['dst']
-
-                    # use a different port for every test
-
-                    kwargs['flowgrind_bport'] = int("%u%u%02u" %(scenario_no+1,self.count, run_no))
-
-                    # set logging prefix, tests append _testname
-                    self.logprefix="i%03u_s%u_r%u" % (self.count, scenario_no, run_no)
-                    logs.append(self.logprefix)
-
-                    # merge parameter configuration for the tests
-                    kwargs.update(scenarios[scenario_no])
-
-                    # set source and dest for tests
-                    # actually run tests
-                    info("run test %s" %self.logprefix)
-                    if parallel:
-                        tasks.append(self.run_test(tests.test_flowgrind, **kwargs))
-                    else:
-                        yield self.run_test(tests.test_flowgrind, **kwargs)
-
-                if parallel:
-                    yield defer.DeferredList(tasks)
-
-                # header for analyze script
-                for prefix in logs:
-                    logfile = open("%s/%s_test_flowgrind" %(self.args.log_dir, prefix), "r+")
-                    old = logfile.read() # read everything in the file
-                    logfile.seek(0) # rewind
-                    logfile.write("""testbed_param_qlimit=%u\n""" \
-                        """testbed_param_rdelay=%u\n"""           \
-                        """testbed_param_rrate=%u\n"""            \
-                        """testbed_param_reordering=%s\n"""       \
-                        """testbed_param_variable=%s\n"""         \
-                        """testbed_param_bottleneckbw=%u\n"""       %(limit, rdelay, reorder, reorder_mode, var, bottleneckbw))
-                    logfile.write(old)
-                    logfile.close()
+            # all flows cross the bottleneck, parallel flows of a scenario
+            # share it
+            # use a different port for every test
+            specs = self.generate_tests(tests.test_flowgrind, [self.count],
+                                        scenarios, runs,
+                                        links=["bottleneck"],
+                                        group_runs=parallel,
+                                        port='flowgrind_bport',
+                                        testbed=testbed, **opts)
+            for spec in specs:
+                spec.kwargs['flowgrind_src'] = spec.kwargs['src']
+                spec.kwargs['flowgrind_dst'] = spec.kwargs['dst']
+
+            # actually run tests
+            yield self.run_tests(specs)
 
             # count overall iterations
             self.count += 1
@@ -179,32 +176,29 @@ class DumbbellEvaluationMeasurement(measurement.Measurement):
         #self.testbed_profile = "profilename!"
         #yield self.switchTestbedProfile(self.testbed_profile)
 
-        #initial settings for netem
-        yield self.run_netem(0, 0, 0, 1000, 100, "add")
-
-                                      #reorder_mode, var     , reorder    , rdelay    , delay, limit     , bottleneckbw
-        for qlimit in range(15):
-            yield self.run_measurement("congestion", "qlimit", 0          , 0         , delay, qlimit + 1, 100)
-
-        for reorder in range(26):
-            yield self.run_measurement("reordering", "rrate" , 2 * reorder, 30        , delay, 1000      , 100)
-
-        for rdelay in range(16):
-            yield self.run_measurement("reordering", "rdelay", 5          , 5 * rdelay, delay, 1000      , 100)
+        # the sweep, lists are swept over
+        sweep = [ dict(reorder_mode="congestion", var="qlimit", reorder=0, rdelay=0, limit=range(1, 16), bottleneckbw=100),
+                  dict(reorder_mode="reordering", var="rrate", reorder=range(0, 52, 2), rdelay=30, limit=1000, bottleneckbw=100),
+                  dict(reorder_mode="reordering", var="rdelay", reorder=5, rdelay=range(0, 80, 5), limit=1000, bottleneckbw=100),
+                  dict(reorder_mode="both", var="qlimit", reorder=5, rdelay=30, limit=range(1, 16), bottleneckbw=100),
+                  dict(reorder_mode="both", var="rrate", reorder=range(0, 52, 2), rdelay=30, limit=10, bottleneckbw=100),
+                  dict(reorder_mode="both", var="rdelay", reorder=5, rdelay=range(0, 80, 5), limit=10, bottleneckbw=100),
+                  # example using bottleneckbw to cause congestion
+                  dict(reorder_mode="congestion", var="bnbw", reorder=0, rdelay=0, limit=10, bottleneckbw=range(6, 66, 6)) ]
 
-        for qlimit in range(15):
-            yield self.run_measurement("both"      , "qlimit", 5          , 30        , delay, qlimit + 1, 100)
+        # run the points in the order with the fewest netem changes
+        initial = dict(reorder=0, rdelay=0, delay=0, limit=1000, bottleneckbw=100)
+        plan = SweepPlan(sweep, NETEM_SETTINGS, start=initial,
+                         commands=NETEM_COMMANDS, delay=delay)
 
-        for reorder in range(26):
-            yield self.run_measurement("both"      , "rrate" , 2 * reorder, 30        , delay, 10        , 100)
+        # one 10s test per point, about two seconds per remote command
+        plan.report(15, 2)
 
-        for rdelay in range(16):
-            yield self.run_measurement("both"      , "rdelay", 5          , 5 * rdelay, delay, 10        , 100)
-
-        # example using bottleneckbw to cause congestion
-        for bnbw in range(10):
-            yield self.run_measurement("congestion" , "bnbw" , 0          , 0         , delay, 10        , 6 * (bnbw + 1))
+        #initial settings for netem
+        yield self.run_netem(mode="add", **initial)
 
+        for point in plan:
+            yield self.run_measurement(**point)
 
         # switch back to minimum when done
         # yield self.switchTestbedProfile("minimum")
@@ -132,9 +132,15 @@ class TcpaNCRMeasurement(measurement.Measurement):
 
         info("Setting netem..")
 
+        # netem is set before every test, only send the qdiscs and classes
+        # whose settings changed since the last call, "add" sets up everything
+        force = (mode == "add")
+
         for ip, chars in self.dictIpCount.items():
-            fwd_cmd = "sudo tc qdisc %s dev eth0 parent 1:2 handle 20: netem" %mode
-            bck_cmd = "sudo tc qdisc %s dev eth0 parent 1:1 handle 10: netem" %mode
+            fwd_qdisc = "sudo tc qdisc %s dev eth0 parent 1:2 handle 20: netem" %mode
+            bck_qdisc = "sudo tc qdisc %s dev eth0 parent 1:1 handle 10: netem" %mode
+            fwd_cmd = fwd_qdisc
+            bck_cmd = bck_qdisc
             set_fwd_cmd = False
             set_bck_cmd = False
 
@@ -161,12 +167,14 @@ class TcpaNCRMeasurement(measurement.Measurement):
                 set_bck_cmd = True
 
             #bottleneck bandwidth
-            if 'qlnode' in chars and bottleneckbw:
+            if 'qlnode' in chars and bottleneckbw and \
+                    self.tc_changed(ip, "htb", bottleneckbw, force):
                 #tc_cmd = "sudo tc class %s dev eth0 parent 1: classid 1:1 htb rate %umbit; \
                 #    sudo tc class %s dev eth0 parent 1: classid 1:2 htb rate %umbit" %(mode, bottleneckbw, mode, bottleneckbw)
                 tc_cmd = "sudo tc class change dev eth0 parent 1: classid 1:1 htb rate %umbit; \
                     sudo tc class change dev eth0 parent 1: classid 1:2 htb rate %umbit" %(bottleneckbw, bottleneckbw)
-                yield tasks.execute(self.exec_sudo, cmd=tc_cmd, hosts=ip)
+                rc = yield tasks.execute(self.exec_sudo, cmd=tc_cmd, hosts=ip)
+                self.tc_applied(ip, "htb", bottleneckbw, rc.get(ip))
 
             #Reverse path delay
             #if delay == 0:
@@ -193,17 +201,30 @@ class TcpaNCRMeasurement(measurement.Measurement):
                 bck_cmd += " drop %u%%" %(ackloss)
                 set_bck_cmd = True
 
-            if set_fwd_cmd:
-                yield tasks.execute(self.exec_sudo, cmd=fwd_cmd, hosts=ip)
-            if set_bck_cmd:
-                yield tasks.execute(self.exec_sudo, cmd=bck_cmd, hosts=ip)
+            if set_fwd_cmd and self.tc_changed(ip, "netem 1:2",
+                    fwd_cmd[len(fwd_qdisc):], force):
+                rc = yield tasks.execute(self.exec_sudo, cmd=fwd_cmd, hosts=ip)
+                self.tc_applied(ip, "netem 1:2", fwd_cmd[len(fwd_qdisc):],
+                        rc.get(ip))
+            if set_bck_cmd and self.tc_changed(ip, "netem 1:1",
+                    bck_cmd[len(bck_qdisc):], force):
+                rc = yield tasks.execute(self.exec_sudo, cmd=bck_cmd, hosts=ip)
+                self.tc_applied(ip, "netem 1:1", bck_cmd[len(bck_qdisc):],
+                        rc.get(ip))
 
     @defer.inlineCallbacks
     def run_measurement(self, reorder_mode, var, reorder, ackreor, rdelay, delay, ackloss, limit, bottleneckbw):
         print reorder_mode, var, reorder, ackreor, rdelay, delay, ackloss, limit, bottleneckbw
+
+        # header for analyze script
+        testbed = dict(qlimit = "%u" %limit, rdelay = "%u" %rdelay,
+                       rrate = "%u" %reorder, delay = "%f" %delay,
+                       ackreor = "%u" %ackreor, ackloss = "%u" %ackloss,
+                       reordering = reorder_mode, variable = var,
+                       bottleneckbw = "%u" %bottleneckbw)
+
         for it in iterations:
             for scenario_no in range(len(self.scenarios)):
-                logs = list()
                 for run_no in range(len(self.runs)):
                     kwargs = dict()
                     pairs = list()
@@ -219,7 +240,6 @@ class TcpaNCRMeasurement(measurement.Measurement):
 
                     # set logging prefix, tests append _testname
                     self.logprefix="i%03u_s%u_r%u" % (self.count, scenario_no, run_no)
-                    logs.append(self.logprefix)
 
                     # merge parameter configuration for the tests
                     kwargs.update(self.scenarios[scenario_no])
@@ -262,7 +282,7 @@ class TcpaNCRMeasurement(measurement.Measurement):
                         self.first_run = False
                     else:
                         yield self.run_netem(reorder, ackreor, rdelay, delay, ackloss, limit, bottleneckbw, "change")
-                    yield self.run_test(tests.test_flowgrind, **kwargs)
+                    yield self.run_test(tests.test_flowgrind, testbed=testbed, **kwargs)
 
                     # set tcpdump at dest for tests
                     info("Sleeping before terminating tcpddump")
@@ -276,23 +296,6 @@ class TcpaNCRMeasurement(measurement.Measurement):
                         yield tasks.execute(self.exec_sudo, cmd=dump_cmd, hosts=kwargs['dst'])
                     # set tcpdump at dest for tests
 
-                # header for analyze script
-                for prefix in logs:
-                    logfile = open("%s/%s_test_flowgrind" %(self.args.log_dir, prefix), "r+")
-                    old = logfile.read() # read everything in the file
-                    logfile.seek(0) # rewind
-                    logfile.write("""testbed_param_qlimit=%u\n""" \
-                        """testbed_param_rdelay=%u\n"""           \
-                        """testbed_param_rrate=%u\n"""            \
-                        """testbed_param_delay=%f\n"""            \
-                        """testbed_param_ackreor=%u\n"""          \
-                        """testbed_param_ackloss=%u\n"""          \
-                        """testbed_param_reordering=%s\n"""       \
-                        """testbed_param_variable=%s\n"""         \
-                        """testbed_param_bottleneckbw=%u\n"""       %(limit, rdelay, reorder, delay, ackreor, ackloss, reorder_mode, var, bottleneckbw))
-                    logfile.write(old)
-                    logfile.close()
-
                 info("Sleeping ..")
                 time.sleep(2)
         self.count += 1
@@ -311,7 +314,7 @@ class TcpaNCRMeasurement(measurement.Measurement):
     @parallel
     def exec_sudo(self,cmd):
         print (green(cmd))
-        sudo(cmd)
+        return sudo(cmd).return_code
 
     def main(self):
         self.parse_options()
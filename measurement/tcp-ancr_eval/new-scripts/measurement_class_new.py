@@ -359,8 +359,9 @@ class TcpaNCRMeasurement(measurement.Measurement):
 
         print (green("Finished test."))
 
-    def prepare_test(self, append=False, **kwargs):
-        """Runs a test method with arguments self, logfile, args"""
+    def prepare_test(self, append=False, testbed=None, **kwargs):
+        """Runs a test method with arguments self, logfile, args. The testbed
+        parameters are written into the header of the log"""
 
         if not os.path.exists(self.args.log_dir):
             info("%s does not exist, creating. " % self.args.log_dir)
@@ -381,6 +382,9 @@ class TcpaNCRMeasurement(measurement.Measurement):
             log_file = open(log_path, 'w')
 
         # write config into logfile
+        if testbed:
+            for item in sorted(testbed.iteritems()):
+                log_file.write("testbed_param_%s=%s\n" %item)
         for item in kwargs.iteritems():
             log_file.write("%s=%s\n" %item)
         log_file.write("test_start_time=%s\n" %time.time())
@@ -395,9 +399,16 @@ class TcpaNCRMeasurement(measurement.Measurement):
 
     def run_measurement(self, reorder_mode, var, reorder, ackreor, rdelay, delay, ackloss, limit, bottleneckbw):
         print reorder_mode, var, reorder, ackreor, rdelay, delay, ackloss, limit, bottleneckbw
+
+        # header for analyze script
+        testbed = dict(qlimit = "%u" %limit, rdelay = "%u" %rdelay,
+                       rrate = "%u" %reorder, delay = "%f" %delay,
+                       ackreor = "%u" %ackreor, ackloss = "%u" %ackloss,
+                       reordering = reorder_mode, variable = var,
+                       bottleneckbw = "%u" %bottleneckbw)
+
         for it in iterations:
             for scenario_no in range(len(self.scenarios)):
-                logs = list()
                 for run_no in range(len(self.runs)):
                     kwargs = dict()
                     pairs = list()
@@ -411,7 +422,6 @@ class TcpaNCRMeasurement(measurement.Measurement):
 
                     # set logging prefix, tests append _testname
                     self.logprefix="i%u%03u_s%u_r%u" % (self.offset,self.count, scenario_no, run_no)
-                    logs.append(self.logprefix)
 
                     # merge parameter configuration for the tests
                     kwargs.update(self.scenarios[scenario_no])
@@ -463,24 +473,7 @@ class TcpaNCRMeasurement(measurement.Measurement):
                         self.run_netem(reorder, ackreor, rdelay, delay, ackloss, limit, bottleneckbw, "change", **kwargs)
 
                     if not self.args.dry_run:
-                        self.prepare_test(**kwargs)
-
-                        # header for analyze script
-                        for prefix in logs:
-                            logfile = open("%s/%s_test_flowgrind" %(self.args.log_dir, prefix), "r+")
-                            old = logfile.read() # read everything in the file
-                            logfile.seek(0) # rewind
-                            logfile.write("""testbed_param_qlimit=%u\n""" \
-                                """testbed_param_rdelay=%u\n"""           \
-                                """testbed_param_rrate=%u\n"""            \
-                                """testbed_param_delay=%f\n"""            \
-                                """testbed_param_ackreor=%u\n"""          \
-                                """testbed_param_ackloss=%u\n"""          \
-                                """testbed_param_reordering=%s\n"""       \
-                                """testbed_param_variable=%s\n"""         \
-                                """testbed_param_bottleneckbw=%u\n"""       %(limit, rdelay, reorder, delay, ackreor, ackloss, reorder_mode, var, bottleneckbw))
-                            logfile.write(old)
-                            logfile.close()
+                        self.prepare_test(testbed=testbed, **kwargs)
 
                         info("Sleeping ..")
                         time.sleep(2)
@@ -67,25 +67,11 @@ class TcpEvaluationMeasurement(measurement.Measurement):
 
         #yield self.switchTestbedProfile("vmesh_flowgrind")
 
-        for it in iterations:
-            for run_no in range(len(runs)):
-                kwargs = dict()
-
-                kwargs.update(opts)
-                kwargs.update(runs[run_no])
-
-                for scenario_no in range(len(scenarios)):
-                    # use a different port for every test
-                    kwargs['bport'] = int("%u%u%02u" %(scenario_no + 1, it, run_no))
-
-                    # set logging prefix, tests append _testname
-                    self.logprefix="i%03u_s%u_r%u" % (it, scenario_no, run_no)
-
-                    # merge parameter configuration for the tests
-                    kwargs.update(scenarios[scenario_no])
-
-                    # actually run tests
-                    yield self.run_test(tests.test_flowgrind, **kwargs)
+        # actually run tests, with --parallel pairs without common nodes run
+        # in parallel, every test uses a different port. With --stop-at,
+        # iterations is the maximum
+        yield self.run_iterations(tests.test_flowgrind, iterations,
+                                  scenarios, runs, port='bport', **opts)
 
         # switch back to minimum when done
         # yield self.switchTestbedProfile("minimum")
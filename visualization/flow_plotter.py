@@ -21,12 +21,50 @@ import sys
 import math
 import textwrap
 import os.path
+import numpy
 from logging import info, debug, warn, error
 
 # tcp-eval imports
 from common.application import Application
 from analysis.testrecords_flowgrind import FlowgrindRecordFactory
-from visualization.gnuplot import UmHistogram, UmGnuplot, UmLinePlot, UmStepPlot, UmBoxPlot
+from analysis.recordcache import RecordCache
+from visualization.gnuplot import UmHistogram, UmGnuplot, UmLinePlot, UmStepPlot, UmBoxPlot, UmRenderSession, UmData
+from visualization.rendercache import RenderCache
+from visualization.decimate import decimateRows, toPixels
+from visualization.gnuplot import PLOTSIZE
+
+def rebin(data, rate):
+    """Resamples equally spaced samples to intervals "rate" samples long.
+    Every new value is the mean of the old ones weighted by the part of
+    their interval that falls into the new one. The last interval may be
+    shorter"""
+
+    data = numpy.asarray(data, dtype=float)
+    count = len(data)
+    bins = int(math.ceil(count / rate))
+    edges = numpy.minimum(numpy.arange(bins + 1) * rate, count)
+
+    # integral of the step function up to every edge
+    whole = numpy.floor(edges).astype(int)
+    cumsum = numpy.concatenate(([0.0], numpy.cumsum(data)))
+    integral = cumsum[whole] + (edges - whole) * numpy.append(data, 0.0)[whole]
+
+    return numpy.diff(integral) / numpy.diff(edges)
+
+def percentile(values, q):
+    """Returns the q-th percentile (0-100) of every column, leaving out
+    missing values (NaN). Interpolated like numpy.percentile(), but for all
+    columns at once"""
+
+    # missing values are sorted to the end
+    values = numpy.sort(values, axis=0)
+    valid = numpy.sum(~numpy.isnan(values), axis=0)
+    rank = (numpy.maximum(valid, 1) - 1) * q / 100.0
+    lower = numpy.floor(rank).astype(int)
+    upper = numpy.minimum(lower + 1, numpy.maximum(valid - 1, 0))
+    columns = numpy.arange(values.shape[1])
+    return values[lower, columns] + (rank - lower) * \
+            (values[upper, columns] - values[lower, columns])
 
 class FlowPlotter(Application):
     """Creates graphs for throughput, cwnd, rtt, dupthresh, and segments out of
@@ -37,6 +75,12 @@ class FlowPlotter(Application):
 
         # object variables
         self.factory = FlowgrindRecordFactory()
+        self.cache = None
+        # bands of the averaged throughput, and the plots that have one
+        self.bands = dict()
+        self.banded = set()
+        # the table of values of every plot
+        self.values = dict()
         # all graphics that currently be supported
         self.graphics_array = ("tput", "cwnd", "rtt", "dupthresh", "retrans")
 
@@ -64,6 +108,15 @@ class FlowPlotter(Application):
         self.parser.add_argument("-r", "--resample", metavar="RATE",
                 default=0.0, action="store", type=float, help="resample flow "\
                         "to sample rate '%(metavar)s' (default: %(default)s)")
+        self.parser.add_argument("-b", "--band", metavar="KIND", nargs="?",
+                const="percentile", choices=("percentile", "ci"),
+                help="when averaging several log files, also plot the band "\
+                        "of the throughput of the single runs, either the "\
+                        "central percentiles or the confidence interval of "\
+                        "the mean (default: %(const)s)")
+        self.parser.add_argument("--band-level", metavar="PERCENT",
+                default=90.0, type=float, action="store", help="width of "\
+                        "the band in percent (default: %(default)s)")
         self.parser.add_argument("-a", "--all-in-one", metavar="FILE",
                 action="store", nargs="?", const="flowlog-all", dest="all",
                 help="Plot all flowlogs in one graph into file '%(metavar)s' "\
@@ -83,6 +136,31 @@ class FlowPlotter(Application):
                 help="overwrite existing output")
         self.parser.add_argument("--save", action="store_true", help="save "\
                 "gnuplot and tex files")
+        self.parser.add_argument("--decimate", metavar="DPI", type=int,
+                nargs="?", const=300, action="store", help="only write the "\
+                        "samples that are visible at a print resolution of "\
+                        "'%(metavar)s' dpi, samples with losses, reorderings "\
+                        "or retransmissions are always kept (default: "\
+                        "%(const)s)")
+        self.parser.add_argument("--preview", metavar="FORMAT", nargs="?",
+                const="png", choices=("png", "svg"), help="render quick "\
+                        "'%(metavar)s' previews with gnuplot instead of pdf "\
+                        "files (default: %(const)s)")
+        self.parser.add_argument("--cache-dir", metavar="DIR", type=str,
+                action="store", dest="cachedir", help="store parsed test "\
+                        "records and rendered figures in '%(metavar)s' "\
+                        "(default: '.recordcache' next to the log files and "\
+                        "'.rendercache' next to the figures)")
+        self.parser.add_argument("--cache-size", metavar="MB", type=int,
+                default=256, action="store", dest="cachesize", help="keep "\
+                        "at most '%(metavar)s' MiB of rendered figures "\
+                        "(default: %(default)s)")
+        self.parser.add_argument("-j", "--jobs", metavar="NUM", type=int,
+                default=1, action="store", help="render the figures with "\
+                        "'%(metavar)s' processes (default: %(default)s)")
+        self.parser.add_argument("--no-cache", action="store_false",
+                dest="cache", help="always parse the log files and render "\
+                        "the figures, don't use the record and render cache")
 
     def apply_options(self):
         """Configure object based on the options form the argparser.
@@ -95,6 +173,15 @@ class FlowPlotter(Application):
             info("%s does not exist, creating. " % self.args.outdir)
             os.mkdir(self.args.outdir)
 
+        UmGnuplot.preview = self.args.preview
+
+        # reuse parsed records of unchanged log files and figures rendered
+        # from the same data
+        if self.args.cache:
+            self.cache = RecordCache(self.args.cachedir)
+            RenderCache.active = RenderCache(self.args.cachedir,
+                    self.args.cachesize * 1024 * 1024)
+
         # create an array with the graphics we want produce
         if "all" not in self.args.graphic:
             self.graphics_array = self.args.graphic
@@ -107,7 +194,7 @@ class FlowPlotter(Application):
 
     def resample(self, record, directions, nosamples, flow):
         # get sample rate for resampling
-        sample = float(record.results['reporting_interval'][0])
+        sample = record.calculate("reporting_interval")
         resample = float(self.args.resample)
         rate = resample/sample
         debug("sample = %s, resample = %s -> rate = %s" %(sample, resample, rate))
@@ -118,72 +205,97 @@ class FlowPlotter(Application):
                 sys.exit(1)
 
             for d in directions:
-                for key in (flow[d].keys()):
+                for key in flow[d].keys():
                     data = flow[d][key]
 
-                    # check if data is number
-                    try:
-                        float(data[0])
-                    except:
+                    # only numeric columns are resampled
+                    if not isinstance(data, numpy.ndarray) or not len(data) \
+                            or data.dtype.kind not in "iuf":
                         continue
                     debug("type: %s" %key)
 
-                    # actual resampling happens here
-                    next = 0 # where to store the next resample (at the end this is the number of points)
-                    all = 0  # where are we in the list?
-                    while all < nosamples:
-                        sum = 0  # sum of all parts
-                        r = rate # how much to sum up
-
-                        if all != int(all):             # not an int
-                            frac = 1 - (all - int(all)) # get the fraction which has not yet been included
-                            sum += frac * data[int(all)]
-                            all += frac
-                            r -= frac
-
-                        while r >= 1:
-                            if all < nosamples:
-                                sum += data[int(all)]
-                                all += 1
-                                r -= 1
-                            else: break
-
-                        if r > 0 and all < nosamples:
-                            sum += r * data[int(all)]
-                            all += r
-                            r = 0
-
-                        out = sum/(rate-r) # out is the value for the interval
-                                           # r is not 0, if we are at the end of the list
-                        data[next] = out
-                        next += 1
-
-                    # truncate table to new size
-                    del flow[d][key][next:nosamples]
+                    # resampled values are fractional, even for counters
+                    flow[d][key] = rebin(data[:nosamples], rate)
 
                 # set begin and end time
-                for i in range(next):
-                    flow[d]['begin'][i] = i*resample
-                    flow[d]['end'][i] = (i+1)*resample
+                next = len(flow[d]['begin'])
+                flow[d]['begin'] = numpy.arange(next) * resample
+                flow[d]['end'] = flow[d]['begin'] + resample
 
             debug("new nosamples: %i" %next)
             return next
         else: return nosamples  # resample == 0
 
+    def trim(self, flow, directions, lo, hi):
+        """Keeps only the samples lo to hi of all columns"""
+
+        for d in directions:
+            for key in flow[d].keys():
+                if isinstance(flow[d][key], numpy.ndarray):
+                    flow[d][key] = flow[d][key][lo:hi]
+
+    def average(self, flow_array, nosamples):
+        """Replaces the throughput of the first flow by the mean of all
+        flows. The samples of the other flows are aligned by their begin
+        time, samples missing in a flow are left out. If a band is requested,
+        its lower and upper bound are stored as well"""
+
+        flow = flow_array[0][1]
+        for d in ('S', 'D'):
+            begin = flow[d]['begin'][:nosamples]
+            interval = numpy.median(numpy.diff(begin)) if nosamples > 1 else 0
+
+            # one row per file
+            tput = numpy.empty((len(flow_array), nosamples))
+            for row, (plotname, other, record, count) in enumerate(flow_array):
+                otherBegin = other[d]['begin'][:count]
+                index = numpy.searchsorted(otherBegin, begin - interval / 2.0)
+                index = numpy.minimum(index, max(count - 1, 0))
+                if not count:
+                    tput[row] = numpy.nan
+                    continue
+                tput[row] = other[d]['tput'][index]
+                tput[row][abs(otherBegin[index] - begin) > interval / 2.0] = \
+                        numpy.nan
+
+            # mean of the files that have the sample
+            runs = numpy.sum(~numpy.isnan(tput), axis=0)
+            flow[d]['tput'] = numpy.where(runs > 0, numpy.nansum(tput, axis=0)
+                    / numpy.maximum(runs, 1), numpy.nan)
+            if not self.args.band:
+                continue
+
+            level = self.args.band_level
+            if self.args.band == "percentile":
+                low = percentile(tput, 50 - level / 2.0)
+                high = percentile(tput, 50 + level / 2.0)
+            else:
+                from scipy.stats import t
+                std = numpy.sqrt(numpy.nansum((tput - flow[d]['tput'])**2,
+                        axis=0) / numpy.maximum(runs - 1, 1))
+                quantile = t.ppf(0.5 + level / 200.0, numpy.maximum(runs - 1, 1))
+                delta = numpy.where(runs > 1, quantile * std /
+                        numpy.sqrt(runs), 0)
+                (low, high) = (flow[d]['tput'] - delta, flow[d]['tput'] + delta)
+            self.bands[d] = (low, high)
 
     def load_values(self, infile, flownumber):
 
         flow_array = []
+        self.bands = dict()
 
         for file in infile.split(','):
             # create record from given file
             debug("analyzing %s" %file)
-            record = self.factory.createRecord(file, "flowgrind")
+            record = self.factory.createRecord(file, "flowgrind", self.cache)
             flows = record.calculate("flows")
             if not flows:
                 error("parse error")
                 sys.exit(1)
 
+            # only the grouped flows are needed from now on
+            record.release("reporting_interval")
+
             if flownumber > len(flows):
                 error("requested flow number %i greater then flows in file: %i"
                         %(flownumber,len(flows) ) )
@@ -203,54 +315,33 @@ class FlowPlotter(Application):
 
             flow_array.append([plotname, flow, record, nosamples])
 
-        # build average, save it to flow_array[0]
-        if len(flow_array) > 1:
-            for i in range(len(flow_array[0][1]['S']['tput'])):
-                avg_S = 0
-                avg_D = 0
-                for l in range(len(flow_array)):
-                    avg_S += flow_array[l][1]['S']['tput'][i]
-                    avg_D += flow_array[l][1]['D']['tput'][i]
-                flow_array[0][1]['S']['tput'][i] = avg_S/len(flow_array)
-                flow_array[0][1]['D']['tput'][i] = avg_D/len(flow_array)
-
         plotname = flow_array[0][0] # just take one
         flow = flow_array[0][1]     # average for all files
         record = flow_array[0][2]   # hopefully the used parameter is always the same :)
         nosamples = min([flow_array[i][3] for i in range(len(flow_array))])
 
-        # delete all data BEFORE some given time
+        # build average, save it to flow_array[0]
+        if len(flow_array) > 1:
+            self.average(flow_array, nosamples)
+
+        # delete all data BEFORE and AFTER some given time
+        begin = flow['D']['begin'][:nosamples]
+        lo = 0
+        hi = nosamples
         if self.args.start > 0:
-            for i in range(nosamples):
-                if flow['D']['begin'][i] > self.args.start: # get point where the time is over the threshold
-                    for d in directions: # delete all entries before this point
-                        for key in flow[d].keys():
-                            try:
-                                len(flow[d][key])
-                            except: continue
-                            flow[d][key] = flow[d][key][i:nosamples]
-                    break
-            nosamples = nosamples-i
-
-        # delete all data AFTER some given time
+            lo = numpy.searchsorted(begin, self.args.start, 'right')
         if self.args.end > 0:
-            for i in range(nosamples):
-                if flow['D']['begin'][i] > self.args.end: # get point where the time is over the threshold
-                    for d in directions: # delete all entries before this point
-                        for key in flow[d].keys():
-                            try:
-                                len(flow[d][key])
-                            except: continue
-                            flow[d][key] = flow[d][key][0:i]
-                    break
-            nosamples = i
+            hi = max(numpy.searchsorted(begin, self.args.end, 'right'), lo)
+        self.trim(flow, directions, lo, hi)
+        for d in self.bands:
+            self.bands[d] = [bound[lo:hi] for bound in self.bands[d]]
+        nosamples = hi - lo
 
         # get max cwnd for ssth output
         cwnd_max = 0
-        for i in range(nosamples):
-            for dir in directions:
-                if flow[dir]['cwnd'][i] > cwnd_max:
-                    cwnd_max = flow[dir]['cwnd'][i]
+        if nosamples:
+            cwnd_max = max([flow[dir]['cwnd'][:nosamples].max()
+                    for dir in directions])
 
         return plotname, flow, cwnd_max, record, nosamples
 
@@ -260,21 +351,15 @@ class FlowPlotter(Application):
         def ssth_max(ssth):
             SSTHRESH_MAX = 2147483647
             X = 50
-            if ssth == SSTHRESH_MAX:  return 0
-            elif ssth > cwnd_max + X: return cwnd_max + X
-            else:                     return ssth
+            return numpy.where(ssth == SSTHRESH_MAX, 0,
+                    numpy.minimum(ssth, cwnd_max + X))
 
         def rto_max(rto):
-            if rto == 3000: return 0
-            else:           return rto
+            return numpy.where(rto == 3000, 0, rto)
 
         plotname, flow, cwnd_max, record, nosamples = self.load_values(infile, flownumber)
 
         outdir=self.args.outdir
-        valfilename = os.path.join(outdir, plotname+".values")
-        info("Generating %s..." % valfilename)
-        fh = file(valfilename, "w")
-        # header
         recordHeader = record.getHeader()
         try:
             label = "%s %s Flow %d" %(recordHeader["scenario_label"],
@@ -282,36 +367,60 @@ class FlowPlotter(Application):
                                       flownumber)
         except:
             label = ""
-        fh.write("# start_time end_time forward_tput reverse_tput "\
-                "forward_cwnd reverse_cwnd ssth krtt krto lost reor retr "\
-                "tret dupthresh\n")
-        for i in range(nosamples):
-            formatfields = (flow['S']['begin'][i],
-                            flow['S']['end'][i],
-                            flow['S']['tput'][i],
-                            flow['D']['tput'][i],
-                            flow['S']['cwnd'][i],
-                            flow['D']['cwnd'][i],
-                            ssth_max(flow['S']['ssth'][i]),
-                            flow['S']['krtt'][i],
-                            rto_max(flow['S']['krto'][i]),
-                            flow['S']['lost'][i],
-                            flow['S']['reor'][i],
-                            flow['S']['retr'][i],
-                            flow['S']['tret'][i] )
-            formatstring = "%f %f %f %f %f %f %f %f %f %f %f %f %f"
-
-            # to plot linux and tcp-ancr dupthresh together
-#            if 'dupthresh' in self.graphics_array:
-#                formatfields += tuple([flow['S']['dupthresh'][i]])
-#                formatstring += " %f"
-            formatstring += "\n"
-            fh.write( formatstring % formatfields )
-        fh.close()
+        header = "start_time end_time forward_tput reverse_tput "\
+                "forward_cwnd reverse_cwnd ssth krtt krto lost reor retr tret"
+
+        # only the samples that are visible in the plot
+        samples = numpy.arange(nosamples)
+        if self.args.decimate:
+            (width, height) = toPixels(PLOTSIZE, self.args.decimate)
+            column = lambda d, key: flow[d][key][:nosamples]
+            samples = decimateRows(column('S', 'begin'),
+                    [column('S', key) for key in ('tput', 'cwnd', 'ssth',
+                        'krtt', 'krto')] +
+                    [column('D', key) for key in ('tput', 'cwnd')] +
+                    [bound[:nosamples] for d in sorted(self.bands)
+                        for bound in self.bands[d]], width,
+                    exact=[column('S', key) for key in ('lost', 'reor',
+                        'retr', 'tret')])
+            info("Decimated %s: kept %u of %u samples (%.1fx)" %(plotname,
+                    len(samples), nosamples,
+                    nosamples / float(max(len(samples), 1))))
+
+        columns = [flow['S']['begin'][samples],
+                   flow['S']['end'][samples],
+                   flow['S']['tput'][samples],
+                   flow['D']['tput'][samples],
+                   flow['S']['cwnd'][samples],
+                   flow['D']['cwnd'][samples],
+                   ssth_max(flow['S']['ssth'][samples]),
+                   flow['S']['krtt'][samples],
+                   rto_max(flow['S']['krto'][samples]),
+                   flow['S']['lost'][samples],
+                   flow['S']['reor'][samples],
+                   flow['S']['retr'][samples],
+                   flow['S']['tret'][samples]]
+
+        # band of the averaged throughput
+        if self.bands:
+            columns += [self.bands[d][bound][samples] for d in ('S', 'D')
+                    for bound in (0, 1)]
+            header += " forward_tput_low forward_tput_high "\
+                    "reverse_tput_low reverse_tput_high"
+            self.banded.add(plotname)
+
+        # to plot linux and tcp-ancr dupthresh together
+#        if 'dupthresh' in self.graphics_array:
+#            columns.append(flow['S']['dupthresh'][samples])
+#            header += " dupthresh"
+
+        # the values are passed to gnuplot in its binary format, the text
+        # file is only written to be saved
+        self.values[plotname] = UmData(os.path.join(outdir, plotname),
+                columns, header, text=self.args.save)
 
         return [plotname, label]
 
-
     def plot(self, *plotnameList):
         """Produce the plot"""
 
@@ -335,20 +444,30 @@ class FlowPlotter(Application):
 
             count = 0
             for plotname, label in plotnameList:
-                valfilename = os.path.join(outdir, plotname+".values")
+                values = self.values[plotname]
+                # band of the single runs below the average
+                if plotname in self.banded:
+                    if self.args.node in ("src", "both"):
+                        p.plotBand(values, "Forward path band %s" %label,
+                                using="2:14:15", linestyle=count + 1
+                                if self.args.node == "src" else 2*count)
+                    if self.args.node in ("dst", "both"):
+                        p.plotBand(values, "Reverse path band %s" %label,
+                                using="2:16:17", linestyle=count + 1
+                                if self.args.node == "dst" else 2*count+1)
                 # plotting both sender and receiver side
                 if self.args.node == "both":
-                    p.plot(valfilename, "Forward path %s" %label, using="2:3",
+                    p.plot(values, "Forward path %s" %label, using="2:3",
                             linestyle=2*count)
-                    p.plot(valfilename, "Reverse path %s" %label, using="2:4",
+                    p.plot(values, "Reverse path %s" %label, using="2:4",
                             linestyle=2*count+1)
                 # plotting sender side only
                 elif self.args.node == "src":
-                    p.plot(valfilename, "%s" %label, using="2:3",
+                    p.plot(values, "%s" %label, using="2:3",
                             linestyle=count+1)
                 # plotting receiver side only
                 elif self.args.node == "dst":
-                    p.plot(valfilename, "%s" %label, using="2:4",
+                    p.plot(values, "%s" %label, using="2:4",
                             linestyle=count+1)
                 count += 1
 
@@ -367,16 +486,16 @@ class FlowPlotter(Application):
 
             count = 0
             for plotname, label in plotnameList:
-                valfilename = os.path.join(outdir, plotname+".values")
+                values = self.values[plotname]
                 # plotting sender side
                 if self.args.node == "src":
-                    p.plot(valfilename, "Sender CWND %s" %label, using="2:5",
+                    p.plot(values, "Sender CWND %s" %label, using="2:5",
                             linestyle=2*count+1)
-                    p.plot(valfilename, "Sender SSTHRESH %s" %label, using="2:7",
+                    p.plot(values, "Sender SSTHRESH %s" %label, using="2:7",
                             linestyle=2*count+3)
                 # plotting receiver side
                 if self.args.node == "dst":
-                    p.plot(valfilename, "Receiver CWND %s" %label, using="2:6",
+                    p.plot(values, "Receiver CWND %s" %label, using="2:6",
                             linestyle=1*count+2)
                 count += 1
 
@@ -395,12 +514,12 @@ class FlowPlotter(Application):
 
             count = 0
             for plotname, label in plotnameList:
-                valfilename = os.path.join(outdir, plotname+".values")
+                values = self.values[plotname]
                 # plotting sender side
                 if self.args.node == "src":
-                    p.plot(valfilename, "RTO %s" %label, using="2:9",
+                    p.plot(values, "RTO %s" %label, using="2:9",
                             linestyle=2*count)
-                    p.plot(valfilename, "RTT %s" %label, using="2:8",
+                    p.plot(values, "RTT %s" %label, using="2:8",
                             linestyle=2*count+1)
                 # plotting receiver side
                 if self.args.node == "dst":
@@ -423,14 +542,14 @@ class FlowPlotter(Application):
 
             count = 0
             for plotname, label in plotnameList:
-                valfilename = os.path.join(outdir, plotname+".values")
+                values = self.values[plotname]
                 # plotting sender side
                 if self.args.node == "src":
-                    p.plot(valfilename, "Lost segments %s" %label,
+                    p.plot(values, "Lost segments %s" %label,
                             using="2:10", linestyle=3*count+1)
-                    p.plot(valfilename, "Fast retransmits %s" %label,
+                    p.plot(values, "Fast retransmits %s" %label,
                             using="2:12", linestyle=3*count+3)
-                    p.plot(valfilename, "Timeout retransmits %s" %label,
+                    p.plot(values, "Timeout retransmits %s" %label,
                             using="2:13", linestyle=3*count+4)
                 # plotting receiver side
                 if self.args.node == "dst":
@@ -458,13 +577,13 @@ class FlowPlotter(Application):
 
             count = 0
             for plotname, label in plotnameList:
-                valfilename = os.path.join(outdir, plotname+".values")
+                values = self.values[plotname]
                 # plotting sender side
                 if self.args.node == "src":
-                    p.plot(valfilename, "Dupthresh %s" %label, using="2:11",
+                    p.plot(values, "Dupthresh %s" %label, using="2:11",
                             linestyle=2*count+1)
                     # to plot linux and tcp-ancr dupthresh together
-#                    p.plot(valfilename, "%s" %label, using="2:14",
+#                    p.plot(values, "%s" %label, using="2:14",
 #                            linestyle=2*count+2)
                 # plotting receiver side
                 if self.args.node == "dst":
@@ -481,6 +600,9 @@ class FlowPlotter(Application):
         # helper variable
         plotnameList = []
 
+        # build the pdfs of all plots at once
+        session = UmRenderSession(self.args.jobs).start()
+
         # iterate over all log and flow numbers
         for infile in self.args.flowgrind_log:
             for n in self.args.flownumber:
@@ -495,11 +617,12 @@ class FlowPlotter(Application):
         if self.args.all:
             self.plot(*plotnameList)
 
+        session.render()
+
         # clean up
         if not self.args.save:
             for plotname, label in plotnameList:
-                os.remove(os.path.join(self.args.outdir, "%s.values"
-                    %(plotname)))
+                self.values[plotname].remove()
 
     def main(self):
         self.parse_options()
@@ -19,15 +19,23 @@ import os
 import math
 import sys
 import glob
-import textwrap
+import struct
+import numpy
 from logging import info, debug, warn, error
-from simpleparse import generator
-from simpleparse.parser import Parser
-from mx.TextTools import TextTools
 
 # tcp-eval imports
 from common.application import Application
-from visualization.gnuplot import UmHistogram, UmGnuplot, UmXPlot
+from visualization.gnuplot import UmHistogram, UmGnuplot, UmXPlot, UmRenderSession
+from visualization.rendercache import RenderCache
+from visualization.xplreader import XplReader
+from visualization.decimate import PixelGrid, toPixels
+
+# datasources of these colors are never decimated
+EXACT_COLORS = ("retransmit", "reorder", "sack")
+
+# rows of the dataset files, in gnuplot's binary format
+POINT = struct.Struct("=2d")
+LINE = struct.Struct("=4d")
 
 class xpl2pdf(Application):
     """Class to convert xplot/tcptrace files to gnuplot files"""
@@ -35,55 +43,6 @@ class xpl2pdf(Application):
     def __init__(self):
         """Creates a new xpl2pdf object"""
 
-        self.declaration = textwrap.dedent("""\
-                root        :=    timeval,title,xlabel,ylabel,(diamond / text / darrow / uarrow / harrow /
-                                  line / dot / box / tick / color / linebreak)*,end*
-                alphanum    :=    [a-zA-Z0-9]
-                punct       :=    [!@#$%^&()+=|\{}:;<>,.?/"_-]
-                whitespace  :=    [ \t]
-                string      :=    ( alphanum / punct / whitespace )*
-                keyword     :=    ( string / int1 )
-                float1      :=    [0-9]+,".",[0-9]+
-                float2      :=    [0-9]+,".",[0-9]+
-                int1        :=    [0-9]+
-                int2        :=    [0-9]+
-                end         :=    'go', linebreak*
-                timeval     :=    ( 'timeval double' / 'timeval signed' / 'dtime signed' ),
-                                    linebreak
-                title       :=    'title\n',string, linebreak
-                xlabel      :=     'xlabel\n',string, linebreak
-                ylabel      :=     'ylabel\n',string, linebreak
-                linebreak   :=    [ \t]*,( '\n' / '\n\r' ),[ \t]*
-                color       :=    ( 'green' / 'yellow' / 'white' / 'orange' / 'blue' / 'magenta' /
-                                    'red' / 'purple' / 'pink' / 'window' / 'ack' / 'sack' / 'data' /
-                                    'retransmit' / 'duplicate' / 'reorder'/ 'text' / 'default' /
-                                    'sinfin' / 'push' / 'ecn' / 'urgent' / 'probe' / 'a2bseg' /
-                                    'b2aseg'/ 'nosampleack' /'ambigousack' / 'icmp' )
-                localcolor  :=    ( 'green' / 'yellow' / 'white' / 'orange' / 'blue' / 'magenta' /
-                                    'red' / 'purple' / 'pink' / 'window' / 'ack' / 'sack' / 'data' /
-                                    'retransmit' / 'duplicate' / 'reorder'/ 'text' / 'default' /
-                                    'sinfin' / 'push' / 'ecn' / 'urgent' / 'probe' / 'a2bseg' /
-                                    'b2aseg'/ 'nosampleack' /'ambigousack' / 'icmp' )
-                harrow      :=    ( 'larrow' / 'rarrow'),whitespace,float1,whitespace,int1,
-                                    linebreak
-                darrow      :=    ('darrow'),whitespace,float1,whitespace,int1,
-                                    linebreak
-                uarrow      :=    ('uarrow'),whitespace,float1,whitespace,int1,
-                                    linebreak
-                line        :=    ( 'line' / 'dline' ),whitespace,float1,whitespace,int1,whitespace,
-                                    float2,whitespace,int2,linebreak
-                dot         :=    ('dot'),whitespace,float1,whitespace,int1,(whitespace,localcolor)*,
-                                    linebreak
-                diamond     :=    ('diamond'),whitespace,float1,whitespace,int1,(whitespace,
-                                    localcolor)*,linebreak
-                box         :=    ('box'),whitespace,float1,whitespace,int1,(whitespace,localcolor)*,
-                                    linebreak
-                tick        :=    ('dtick' / 'utick' / 'ltick' / 'rtick' / 'vtick' / 'htick'),
-                                    whitespace,float1,whitespace,int1,linebreak
-                text        :=    ('atext' / 'btext' / 'ltext' / 'rtext'),whitespace,float1,
-                                    whitespace,int1,(whitespace,localcolor)*,linebreak,keyword,linebreak
-        """)
-
         # initialization of the option parser
         description = "Creates PDFs for every xpl file specified"
         Application.__init__(self, description=description)
@@ -122,6 +81,29 @@ class xpl2pdf(Application):
                         "No default packages will be loaded")
         self.parser.add_argument("-f", "--force", action="store_true",
                 help="overwrite existing output")
+        self.parser.add_argument("--decimate", metavar="DPI", type=int,
+                nargs="?", const=300, action="store", help="drop the "\
+                        "elements that are invisible at a print resolution "\
+                        "of '%(metavar)s' dpi, retransmissions, reorderings "\
+                        "and SACKs are always kept (default: %(const)s)")
+        self.parser.add_argument("--preview", metavar="FORMAT", nargs="?",
+                const="png", choices=("png", "svg"), help="render quick "\
+                        "'%(metavar)s' previews with gnuplot instead of pdf "\
+                        "files (default: %(const)s)")
+        self.parser.add_argument("--cache-dir", metavar="DIR", type=str,
+                action="store", dest="cachedir", help="store rendered "\
+                        "figures in '%(metavar)s' (default: '.rendercache' "\
+                        "in the output directory)")
+        self.parser.add_argument("--cache-size", metavar="MB", type=int,
+                default=256, action="store", dest="cachesize", help="keep "\
+                        "at most '%(metavar)s' MiB of rendered figures "\
+                        "(default: %(default)s)")
+        self.parser.add_argument("-j", "--jobs", metavar="NUM", type=int,
+                default=1, action="store", help="render the figures with "\
+                        "'%(metavar)s' processes (default: %(default)s)")
+        self.parser.add_argument("--no-cache", action="store_false",
+                dest="cache", help="always render the figures, don't use "\
+                        "the render cache")
 
     def apply_options(self):
         """Set the options"""
@@ -134,49 +116,49 @@ class xpl2pdf(Application):
                 error("%s not found." %entry)
                 exit(1)
 
+        UmGnuplot.preview = self.args.preview
+
+        # reuse figures rendered from the same data
+        if self.args.cache:
+            RenderCache.active = RenderCache(self.args.cachedir,
+                    self.args.cachesize * 1024 * 1024)
+
     def work(self, filename):
         """work, work"""
         outdir = self.args.outdir
         basename = os.path.splitext(os.path.basename(filename))[0]
-        xplfile = open (filename).read()
-
-        simpleparser = generator.buildParser(self.declaration).parserbyname('root')
 
         gploutput = UmXPlot(basename, outdir, debug=self.args.debug, saveit=self.args.save, force=self.args.force)
         if self.args.arrowsize:
             gploutput.arrowsize = self.args.arrowsize
         labelsoutput = open ( "%s/%s.labels" %(outdir,basename) , 'w')
 
-        # start the work
+        # start the work. Every element is written directly to the dataset
+        # file of its datasource (plottype x color), in order of appearance
         datasources = list()
-        data = list()
+        dataoutputs = dict()
         info("starting parsing of %s" %(filename) )
-        taglist = TextTools.tag(xplfile, simpleparser)
-        currentcolor = title = xlabel = ylabel = ""
+        currentcolor = ""
         # used to generate default XRange
         xmin = sys.maxint
         xmax = 0.0
-
-        for tag, beg, end, subtags in taglist[1]:
-        # read options and labels from parse tree
-        # convert keyword labels
-            localcolor = 0
+        # used for the decimation
+        ydatamin = float("inf")
+        ydatamax = float("-inf")
+
+        for element in XplReader(filename):
+            tag = element[0]
+            # read options and labels
+            # convert keyword labels
             if tag == 'text':
+                (tag, xpoint, ypoint, localcolor, position, label) = element
                 # default color for labels
-                localcolor = "black"
-                for subtag, subbeg, subend, subparts in subtags:
-                    if subtag == 'float1':
-                        xpoint = xplfile[subbeg:subend]
-                    elif subtag == 'int1':
-                        ypoint = xplfile[subbeg:subend]
-                    elif subtag == 'keyword':
-                        label = xplfile[subbeg:subend]
-                    elif subtag == 'localcolor':
-                        localcolor = xplfile[subbeg:subend]
-
-                if xplfile[beg:beg+1] == 'l': # 'l'text
+                if not localcolor:
+                    localcolor = "black"
+
+                if position == 'l': # 'l'text
                     position = "right"
-                elif xplfile[beg:beg+1] == 'r':
+                elif position == 'r':
                     position = "left"
                 else:
                     position = "center"
@@ -224,112 +206,56 @@ class xpl2pdf(Application):
                     labelsoutput.write('set label "\\\\fontsize{%s}{%s}\\\\selectfont %s" at %s, %s '\
                             '%s offset %f, %f tc rgbcolor "%s" rotate by %s\n'
                             %(labelsize, int(round(labelsize/1.2)),label,xpoint,ypoint,position,labelyoffset,labelxoffset,localcolor,labelrotation) )
+                continue
+
             # read colors
             elif tag == 'color':
-                currentcolor = xplfile[beg:end]
-
-            # read l/r arrow
-            elif tag == 'darrow':
-                for subtag, subbeg, subend, subparts in subtags:
-                    if subtag == 'float1':
-                        xpoint = xplfile[subbeg:subend]
-                    elif subtag == 'int1':
-                        ypoint = xplfile[subbeg:subend]
-                    elif subtag == 'localcolor':
-                        localcolor = xplfile[subbeg:subend]
-                if not localcolor:
-                    localcolor = currentcolor
-                if ('darrow',localcolor) not in datasources:
-                    datasources.append( ('darrow',localcolor) )
-                data.append( ( ('darrow', localcolor), "%s %s\n" %(xpoint, ypoint) ) )
-
-            elif tag == 'harrow':
-                for subtag, subbeg, subend, subparts in subtags:
-                    if subtag == 'float1':
-                        xpoint = xplfile[subbeg:subend]
-                    elif subtag == 'int1':
-                        ypoint = xplfile[subbeg:subend]
-                    elif subtag == 'localcolor':
-                        localcolor = xplfile[subbeg:subend]
-                if not localcolor:
-                    localcolor = currentcolor
-                if ('harrow',localcolor) not in datasources:
-                    datasources.append( ('harrow',localcolor) )
-                data.append( ( ('harrow', localcolor), "%s %s\n" %(xpoint, ypoint) ) )
-
-            # read dot
-            elif tag == 'dot':
-                for subtag, subbeg, subend, subparts in subtags:
-                    if subtag == 'float1':
-                        xpoint = xplfile[subbeg:subend]
-                    elif subtag == 'int1':
-                        ypoint = xplfile[subbeg:subend]
-                    elif subtag == 'localcolor':
-                        localcolor = xplfile[subbeg:subend]
-                if not localcolor:
-                    localcolor = currentcolor
-                if ('dot',localcolor) not in datasources:
-                    datasources.append( ('dot',localcolor) )
-                data.append( ( ('dot', localcolor), "%s %s\n" %(xpoint, ypoint) ) )
-
-            # diamonds
-            elif tag == 'diamond':
-                for subtag, subbeg, subend, subparts in subtags:
-                    if subtag == 'float1':
-                        xpoint = xplfile[subbeg:subend]
-                    elif subtag == 'int1':
-                        ypoint = xplfile[subbeg:subend]
-                    elif subtag == 'localcolor':
-                        localcolor = xplfile[subbeg:subend]
-                if not localcolor:
-                    localcolor = currentcolor
-                if ('diamond',localcolor) not in datasources:
-                    datasources.append( ('diamond',localcolor) )
-                data.append( ( ('diamond', localcolor), "%s %s\n" %(xpoint, ypoint) ) )
-
-            elif tag == 'box':
-                for subtag, subbeg, subend, subparts in subtags:
-                    if subtag == 'float1':
-                        xpoint = xplfile[subbeg:subend]
-                    elif subtag == 'int1':
-                        ypoint = xplfile[subbeg:subend]
-                    elif subtag == 'localcolor':
-                        localcolor = xplfile[subbeg:subend]
-                if ('box',currentcolor) not in datasources:
-                    datasources.append( ('box',currentcolor) )
-                data.append( ( ('box',currentcolor), "%s %s\n" %(xpoint, ypoint) ) )
-
-            elif tag == 'tick':
-                for subtag, subbeg, subend, subparts in subtags:
-                    if subtag == 'float1':
-                        xpoint = xplfile[subbeg:subend]
-                    elif subtag == 'int1':
-                        ypoint = xplfile[subbeg:subend]
-                    elif subtag == 'localcolor':
-                        localcolor = xplfile[subbeg:subend]
-                if not localcolor:
+                currentcolor = element[1]
+                continue
+
+            # arrows, dots, diamonds and ticks have an optional color of
+            # their own, boxes always use the current color
+            elif tag in ('darrow', 'harrow', 'dot', 'diamond', 'tick', 'box'):
+                (tag, xpoint, ypoint, localcolor) = element
+                if not localcolor or tag == 'box':
                     localcolor = currentcolor
-                if ('tick',localcolor) not in datasources:
-                    datasources.append( ('tick',localcolor) )
-                data.append( ( ('tick',localcolor), "%s %s\n" %(xpoint, ypoint) ) )
+                datasource = (tag, localcolor)
+                y = float(ypoint)
+                dataline = POINT.pack(float(xpoint), y)
+                if y < ydatamin:
+                    ydatamin = y
+                if y > ydatamax:
+                    ydatamax = y
 
             elif tag == 'line':
-                for subtag, subbeg, subend, subparts in subtags:
-                    if subtag == 'float1':
-                        x1point = float(xplfile[subbeg:subend])
-                        if x1point < xmin:
-                            xmin = x1point
-                    elif subtag == 'int1':
-                        y1point = xplfile[subbeg:subend]
-                    elif subtag == 'float2':
-                        x2point = float(xplfile[subbeg:subend])
-                        if x2point > xmax:
-                            xmax = x2point
-                    elif subtag == 'int2':
-                        y2point = xplfile[subbeg:subend]
-                if ('line',currentcolor) not in datasources:
-                    datasources.append( ('line',currentcolor) )
-                data.append( ( ('line',currentcolor), "%s %s %s %s\n" %(x1point, y1point, x2point, y2point) ) )
+                x1point = float(element[1])
+                y1point = float(element[2])
+                x2point = float(element[3])
+                y2point = float(element[4])
+                if x1point < xmin:
+                    xmin = x1point
+                if x2point > xmax:
+                    xmax = x2point
+                for y in (y1point, y2point):
+                    if y < ydatamin:
+                        ydatamin = y
+                    if y > ydatamax:
+                        ydatamax = y
+                datasource = ('line', currentcolor)
+                dataline = LINE.pack(x1point, y1point, x2point, y2point)
+
+            else:
+                continue
+
+            # open the dataset file of a new datasource
+            try:
+                dataoutput = dataoutputs[datasource]
+            except KeyError:
+                datafilename = "%s/%s.dataset.%s.%s" %(outdir,
+                        basename, datasource[1], datasource[0])
+                dataoutput = dataoutputs[datasource] = open(datafilename, 'wb')
+                datasources.append(datasource)
+            dataoutput.write(dataline)
 
         # finish close
         labelsoutput.close()
@@ -359,33 +285,70 @@ class xpl2pdf(Application):
         if self.args.microview:
             gploutput.arrowheads()
 
-        #iterate over data sources (color x plottype) and write file
-        for index,datasource in enumerate(datasources):
-            datafilename = "%s/%s.dataset.%s.%s" %(outdir,
-                    basename, datasource[1], datasource[0])
-            dataoutput = open ( datafilename , 'w')
-            wrotedata = False
-
-            # iterate over all data and write approciate  lines to target file
-            for dataline in data:
-                if dataline[0] == datasource:
-                    dataoutput.write("%s" %dataline[1] )
-                    if (wrotedata == False):
-                        wrotedata = True
-            dataoutput.close()
-
-            # only plot datasource if wrote data, else remove target file
-            if (wrotedata == True):
-                gploutput.plot(outdir, basename, datasource[1], datasource[0],
-                        self.args.microview)
+        # close the dataset files
+        for datasource in datasources:
+            dataoutputs[datasource].close()
+
+        # drop what is invisible at print resolution
+        if self.args.decimate:
+            if xmin < xmax:
+                if self.args.ymax:
+                    ydatamax = min(ydatamax, self.args.ymax)
+                self.decimate(outdir, basename, datasources, (xmin, xmax),
+                        (ydatamin, ydatamax), gploutput.plotsize)
             else:
-                os.remove(datafilename)
+                warn("%s: no lines, not decimated" %filename)
+
+        # readable copies of the datasets
+        if self.args.save:
+            for (datatype, color) in datasources:
+                datafilename = "%s/%s.dataset.%s.%s" %(outdir, basename,
+                        color, datatype)
+                if datatype == 'line':
+                    columns = 4
+                else:
+                    columns = 2
+                table = numpy.fromfile(datafilename, dtype=numpy.float64)
+                numpy.savetxt("%s.values" %datafilename,
+                        table.reshape(-1, columns), fmt="%s")
+
+        for datasource in datasources:
+            gploutput.plot(outdir, basename, datasource[1], datasource[0],
+                    self.args.microview)
 
         gploutput.gplot('load "%s/%s.labels"\n' %(outdir,basename) )
 
         gploutput.arrowheads()
         gploutput.save()
 
+    def decimate(self, outdir, basename, datasources, xrange, yrange,
+            plotsize):
+        """Decimates the dataset files to the pixels of the plot at the
+        resolution given by --decimate. Datasources with a color of
+        EXACT_COLORS are kept as they are"""
+
+        grid = PixelGrid(xrange, yrange, toPixels(plotsize,
+                self.args.decimate))
+        kept = total = 0
+        for (datatype, color) in datasources:
+            if color in EXACT_COLORS:
+                continue
+            datafilename = "%s/%s.dataset.%s.%s" %(outdir, basename, color,
+                    datatype)
+            if datatype == 'line':
+                columns = 4
+            else:
+                columns = 2
+            (datakept, datatotal) = grid.decimateFile(datafilename, columns)
+            debug("%s: kept %u of %u elements" %(datafilename, datakept,
+                    datatotal))
+            kept += datakept
+            total += datatotal
+
+        if kept:
+            info("Decimated %s: kept %u of %u elements (%.1fx)" %(basename,
+                    kept, total, total / float(kept)))
+
     def prepare(self):
         """ global configuration for all input files """
 
@@ -413,22 +376,24 @@ class xpl2pdf(Application):
             os.remove(filename)
 
     def debugparser(self, filename):
-        file = open(filename).read()
-        debugparser = Parser (self.declaration)
         import pprint
         info("started debug parsing")
-        pprint.pprint(debugparser.parse(file))
+        for element in XplReader(filename):
+            pprint.pprint(element)
         info("completed debug parsing")
         exit(0)
 
     def run(self):
         self.prepare()
 
+        # build the pdfs of all xpl files at once
+        session = UmRenderSession(self.args.jobs).start()
         for arg in self.args.xpl_files:
             if self.args.parser_output:
                 self.debugparser(arg)
             else:
                 self.work(arg)
+        session.render()
 
         if not self.args.debug and not self.args.save:
             for arg in self.args.xpl_files:
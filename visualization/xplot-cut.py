@@ -23,6 +23,7 @@ from logging import info, debug, warn, error
 
 # tcp-eval imports
 from common.application import Application
+from visualization.xplindex import XplIndex
 
 class XplotCut(Application):
     """xplot-cut generates a new xpl file based on the current view of xplot"""
@@ -36,75 +37,69 @@ class XplotCut(Application):
                 xplot should print the start and end time of the current view
                 to stdout when 'c' is pressed. xplot-cut then grabs the output
                 and creates a new xpl-file with the given start and end
-                time""")
+                time. With --window or --window-file, all given windows are
+                cut in one pass without starting xplot. A time index of the
+                xpl-file is stored next to it, so cuts only read the part of
+                the file they cover""")
         Application.__init__(self, description=description)
         self.parser.add_argument("xpl_file", metavar="xpl", help="a xplot "\
                 "xpl file")
+        self.parser.add_argument("-w", "--window", metavar=("BEGIN", "END"),
+                type=float, nargs=2, action="append", dest="windows",
+                help="cut the window from BEGIN to END without starting "\
+                        "xplot. Can be given multiple times")
+        self.parser.add_argument("-W", "--window-file", metavar="FILE",
+                action="store", help="cut all windows listed in FILE, one "\
+                        "'BEGIN END' per line, without starting xplot")
 
     def apply_options(self):
         """Configure XplotCut object based on the options form the argparser"""
 
         Application.apply_options(self)
 
-    def cut(self, begin, end):
-        """Write the current view to a new file"""
-
-        infile = self.args.xpl_file
-        outfile = "%s-%s-%s.xpl" %(self.args.xpl_file, begin, end)
-
-        ifh = open(infile,  'r')
-        ofh = open(outfile, 'w')
-        state = 0
-        buf   = ''
-        info("Cutting %s" %(infile))
-        for line in ifh.xreadlines():
-            line = line.rstrip("\n")
-            if state == 0:
-                ofh.write(line + "\n")
-                if line == 'sequence offset' or line == 'sequence number':
-                    state += 1
-                continue
-            if state == 1:
-                buf += line + "\n"
-                if re.match('^(\D+|\d+)$', line):
+        # windows from the window file
+        windows = self.args.windows or list()
+        if self.args.window_file:
+            fh = open(self.args.window_file)
+            for line in fh:
+                line = line.split("#")[0].split()
+                if not line:
                     continue
-                m = re.match('\w+ ([\d.]+) \d+(?: ([\d.]+))?', line)
-                if not m:
-                    warn('Something wrong in state 1: %s' %(line))
-                    continue
-                d = float(m.group(2) if m.group(2) else m.group(1))
-                if d < begin:
-                    buf = ''
-                    continue
-                elif begin <= d and d <= end:
-                    ofh.write(buf)
-                    buf = ''
-                    state += 1
-                    continue
-            if state == 2:
-                buf += line + "\n"
-                if re.match('^(\D+|\d+)$', line):
-                    continue
-                m = re.match('\w+ ([\d.]+)', line)
-                if not m:
-                    warn('Something wrong in state 2: %s' %(line))
-                    continue
-                d = float(m.group(1))
-                if begin <= d and d <= end:
-                    ofh.write(buf)
-                    buf = ''
-                    continue
-                elif d > end:
-                    continue
-        ofh.close()
-        ifh.close()
+                if len(line) != 2:
+                    error("Malformed window in %s: %s"
+                            %(self.args.window_file, " ".join(line)))
+                    sys.exit(1)
+                windows.append((float(line[0]), float(line[1])))
+            fh.close()
+        self.args.windows = windows
+
+        # the time index of the xpl file, built on the first cut
+        self.index = None
+
+    def cut(self, *windows):
+        """Write the given windows, each a tuple (begin, end), to new files"""
+
+        if not self.index:
+            self.index = XplIndex(self.args.xpl_file)
+
+        cuts = list()
+        for (begin, end) in windows:
+            outfile = "%s-%s-%s.xpl" %(self.args.xpl_file, begin, end)
+            info("Cutting %s to %s" %(self.args.xpl_file, outfile))
+            cuts.append((begin, end, outfile))
+        self.index.cut(cuts)
 
     def run(self):
         """Xplot file is opened (and normally doesn't print anything to
         stdout). The modified version prints by pressing 'c' the begin and end
         time of the current view. This view is then written to a new file.
+        If windows are given, they are cut without starting xplot.
         """
 
+        if self.args.windows:
+            self.cut(*self.args.windows)
+            return
+
         xplot = Popen(["xplot", self.args.xpl_file], bufsize=0, stdout=PIPE,
                 shell=False).stdout
         while True:
@@ -113,7 +108,7 @@ class XplotCut(Application):
             print line
             begin, end = re.match("<time_begin:time_end> = "\
                     "<(-?[\d.]+):(-?[\d.]+)>", line).group(1, 2)
-            self.cut(float(begin), float(end))
+            self.cut((float(begin), float(end)))
 
     def main(self):
         self.parse_options()